@@ -8,6 +8,7 @@ import sys  # 新增：供平台判斷
 import subprocess  # 新增：啟動外部處理腳本
 from urllib.parse import urlparse, unquote  # 新增：解析 file:// URL
 import re  # 新增：解析 stdout 中的路徑
+import threading  # 新增：背景跑模型升級版
 from zipfile import ZipFile, ZIP_DEFLATED
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -35,6 +36,18 @@ except ImportError:
     print("警告：無法導入 PdfHandler")
     traceback.print_exc()
 
+try:
+    from file_handlers.pipeline_context import PipelineContext
+except ImportError:
+    print("警告：無法導入 PipelineContext")
+    traceback.print_exc()
+
+try:
+    from file_handlers.parallel_engine import ParallelEngine
+except ImportError:
+    ParallelEngine = None
+    print("警告：無法導入 ParallelEngine，改為逐一處理檔案")
+
 # Optional packages for file preview
 try:
     from docx import Document  # for .docx
@@ -74,6 +87,9 @@ APP_PREVIEW_DIR = APP_OUTPUT_DIR / "_previews"
 APP_OUTPUT_DIR.mkdir(exist_ok=True, parents=True)
 APP_EXPORT_DIR = APP_OUTPUT_DIR / "exports"  # ← 新增
 APP_PREVIEW_DIR.mkdir(exist_ok=True, parents=True)
+# 即時模式（選用，ANONIME_INSTANT_PREVIEW=1 開啟）：先用本地 Faker 出結果，
+# 模型版（v2）在背景完成後再透過 resultsUpgraded 更新；預設照原本直接用模型替換
+INSTANT_PREVIEW = os.getenv("ANONIME_INSTANT_PREVIEW", "0") == "1"
 
 def _rasterize_pdf(pdf_path: str, limit_pages: int = 10, dpi: int = 144):
     print("[PREVIEW] rasterize:", pdf_path)
@@ -102,11 +118,14 @@ class TestBackend(QObject):
 
     filesChanged = Signal(list)
     resultsReady = Signal(str)  # JSON: [{fileName, type, originalText, maskedText}]
+    resultsUpgraded = Signal(str)  # 模型升級版完成，格式同 resultsReady
     exportReady = Signal(str)   # ← 打包成功，回傳 zip 的 file:// URL
     exportFailed = Signal(str)  # ← 打包失敗訊息
     outputsCleared = Signal(str)       # 清理完成訊息
     outputsClearFailed = Signal(str)
     stateCleared = Signal()        
+    # 背景升級 thread → 主 thread：(gen, 合併後的結果 list)；跨 thread 的 emit 會排進主 thread 的事件迴圈
+    _upgradeFinished = Signal(int, object)
 
     def __init__(self):
         super().__init__()
@@ -114,6 +133,13 @@ class TestBackend(QObject):
         self._options: list[str] = []
         self._option_texts: list[str] = []    # 新增：儲存選項的顯示文字
         self._last_results = []          # 新增：快取最近一次結果
+        self._engine = None              # 多檔平行處理的 process pool（第一次用到才啟動）
+        self._context = None             # 本程序共用的 client / mapping / handler（第一次用到才建立）
+        # 前景處理與背景升級共用 engine / context（都不支援同時呼叫），_run_jobs 一次只跑一個
+        self._jobs_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._upgrade_gen = 0            # 每次 processFiles 加一；舊的背景升級結果不再送出
+        self._upgradeFinished.connect(self._apply_upgrade)
 
     # 檔案操作 -------------------------------------------------
     @Slot(str)
@@ -396,8 +422,17 @@ class TestBackend(QObject):
         """
         正式後端：依據前端傳遞的檔案與選項，回傳真實處理結果。
         根據檔案類型分配給相對應的 handler 進行處理。
+        多個檔案時交給 ParallelEngine 平行處理，單一檔案直接在本程序處理。
+        即時模式（INSTANT_PREVIEW）下先不呼叫模型、立刻送出 resultsReady，
+        模型版在背景 thread 完成後輸出 *_v2 檔並送出 resultsUpgraded。
         """
-        results = []
+        # 建立輸出路徑到 test_output/processed
+        processed_dir = APP_OUTPUT_DIR / "processed"
+        processed_dir.mkdir(parents=True, exist_ok=True)
+        # users options
+        selected_types_list = self.getOptions()
+
+        jobs = []
         for src in self._files:
             name = os.path.basename(src)
             if name.startswith("~$"):
@@ -416,50 +451,56 @@ class TestBackend(QObject):
                 ftype = "text"
                 print(f"[後端] 未知副檔名 {ext}，當作文字檔處理")
 
+            out_filename = f"{Path(src).stem}_deid{ext if ext else '.txt'}"
+            jobs.append((ftype, src, str(processed_dir / out_filename)))
+
+        # PDF 本來就只用本地 Faker，沒有要升級的
+        instant = INSTANT_PREVIEW and any(ftype != "pdf" for ftype, _, _ in jobs)
+        self._upgrade_gen += 1
+
+        outputs = self._run_jobs(jobs, selected_types_list, use_model=not instant)
+        results = self._collect_results(jobs, outputs)
+
+        self._last_results = results
+        print(f"[後端] 處理完成，共 {len(results)} 個檔案")
+        self.resultsReady.emit(json.dumps(results, ensure_ascii=False))
+
+        if instant:
+            self._start_upgrade(jobs, selected_types_list, results)
+
+    def _run_jobs(self, jobs, selected_types_list, use_model: bool = True):
+        """處理 jobs，回傳與 jobs 同順序的輸出路徑或 Exception；前景與背景升級的呼叫依序執行"""
+        with self._jobs_lock:
+            return self._run_jobs_locked(jobs, selected_types_list, use_model)
+
+    def _run_jobs_locked(self, jobs, selected_types_list, use_model: bool):
+        outputs = [None] * len(jobs)
+        retry = range(len(jobs))
+        if len(jobs) > 1 and ParallelEngine is not None:
             try:
-                # 建立輸出路徑到 test_output/processed
-                processed_dir = APP_OUTPUT_DIR / "processed"
-                processed_dir.mkdir(parents=True, exist_ok=True)
-                out_filename = f"{Path(src).stem}_deid{ext if ext else '.txt'}"
-                out_path = processed_dir / out_filename
-
-                # 根據檔案類型選擇對應的 handler 並進行處理
-                handler = None
-                
-                if ftype == "text":
-                    try:
-                        handler = TextHandler()
-                        print(f"[後端] 使用 TextHandler 處理文字檔案: {src}")
-                    except NameError:
-                        raise RuntimeError("TextHandler 未正確導入或不可用")
-                        
-                elif ftype == "docx":
-                    try:
-                        handler = DocxHandler()
-                        print(f"[後端] 使用 DocxHandler 處理 Word 檔案: {src}")
-                    except NameError:
-                        raise RuntimeError("DocxHandler 未正確導入或不可用")
-                        
-                elif ftype == "pdf":
-                    try:
-                        handler = PdfHandler()
-                        print(f"[後端] 使用 PdfHandler 處理 PDF 檔案: {src}")
-                    except NameError:
-                        raise RuntimeError("PdfHandler 未正確導入或不可用")
-                        
-                else:
-                    raise RuntimeError(f"不支援的檔案類型：{ftype} (副檔名: {ext})")
-
-                # 確認 handler 已正確初始化
-                if handler is None:
-                    raise RuntimeError(f"無法取得 {ftype} 類型的處理器")
-
-                # 呼叫 handler 的 deidentify 方法進行處理
-                print(f"[後端] 開始去識別化處理，輸入: {src}, 輸出: {out_path}")
-                # users options
-                backend = TestBackend()
-                selected_types_list = backend.getOptions()
-                processed_path = handler.deidentify(src, str(out_path), selected_types_list)
+                print(f"[後端] 平行處理 {len(jobs)} 個檔案")
+                outputs = self._get_engine().process_files(jobs, selected_types_list, use_model=use_model)
+                # 每個檔案各自回報結果，只有失敗的才逐一重跑
+                retry = [i for i, out in enumerate(outputs) if isinstance(out, Exception)]
+                if retry:
+                    print(f"[後端] {len(retry)} 個檔案平行處理失敗，改為逐一處理")
+            except Exception as e:
+                print(f"[後端] 平行處理失敗，改為逐一處理：{e}")
+        for i in retry:
+            ftype, src, out_path = jobs[i]
+            try:
+                outputs[i] = self._process_one(ftype, src, out_path, selected_types_list, use_model)
+            except Exception as e:
+                outputs[i] = e
+        return outputs
+
+    def _collect_results(self, jobs, outputs):
+        results = []
+        for (ftype, src, _), processed_path in zip(jobs, outputs):
+            name = os.path.basename(src)
+            try:
+                if isinstance(processed_path, Exception):
+                    raise processed_path
 
                 if not processed_path or not os.path.isfile(processed_path):
                     raise RuntimeError(f"Handler 未產生有效輸出檔：{processed_path}")
@@ -485,10 +526,82 @@ class TestBackend(QObject):
                     "maskedText": "",
                     "error": str(e),
                 })
+        return results
+
+    def _start_upgrade(self, jobs, selected_types_list, results):
+        """背景 thread 用模型重跑（輸出 *_v2 檔），完成後更新結果並送出 resultsUpgraded"""
+        gen = self._upgrade_gen
+        indices = [k for k, (ftype, _, _) in enumerate(jobs) if ftype != "pdf"]
+        upgrade_jobs = []
+        for k in indices:
+            ftype, src, out_path = jobs[k]
+            out = Path(out_path)
+            upgrade_jobs.append((ftype, src, str(out.with_name(f"{out.stem}_v2{out.suffix}"))))
+
+        def work():
+            print(f"[後端] 背景模型升級開始，共 {len(upgrade_jobs)} 個檔案")
+            try:
+                with self._jobs_lock:
+                    # 等到輪到自己時已經有新的 processFiles，就不必再跑
+                    if gen != self._upgrade_gen:
+                        print("[後端] 已有新的處理請求，略過這次的升級")
+                        return
+                    outputs = self._run_jobs_locked(upgrade_jobs, selected_types_list, use_model=True)
+            except Exception as e:
+                print(f"[後端] 背景模型升級失敗，保留即時結果：{e}")
+                return
 
-        self._last_results = results
-        print(f"[後端] 處理完成，共 {len(results)} 個檔案")
-        self.resultsReady.emit(json.dumps(results, ensure_ascii=False))
+            # 背景 thread 只建新的 list，不碰 self 的狀態；交給主 thread 的 _apply_upgrade 套用
+            merged = list(results)
+            for k, item in zip(indices, self._collect_results(upgrade_jobs, outputs)):
+                if "error" in item:
+                    print(f"[後端] {item['fileName']} 升級失敗，保留即時結果")
+                    continue
+                merged[k] = item
+            self._upgradeFinished.emit(gen, merged)
+
+        threading.Thread(target=work, name="anonime-upgrade", daemon=True).start()
+
+    @Slot(int, object)
+    def _apply_upgrade(self, gen, merged):
+        """在主 thread 套用背景升級結果；期間又有新的 processFiles 時捨棄"""
+        if gen != self._upgrade_gen:
+            print("[後端] 已有新的處理請求，捨棄這次的升級結果")
+            return
+        self._last_results = merged
+        print(f"[後端] 背景模型升級完成，共 {len(merged)} 個檔案")
+        self.resultsUpgraded.emit(json.dumps(merged, ensure_ascii=False))
+
+    def _get_engine(self):
+        if self._engine is None:
+            with self._init_lock:
+                if self._engine is None:
+                    self._engine = ParallelEngine()
+        return self._engine
+
+    def _get_context(self):
+        if self._context is None:
+            with self._init_lock:
+                if self._context is None:
+                    self._context = PipelineContext()
+        return self._context
+
+    def _process_one(self, ftype: str, src: str, out_path: str, selected_types_list, use_model: bool = True) -> str:
+        """在本程序用對應的 handler 處理單一檔案，回傳輸出路徑"""
+        # 根據檔案類型取得對應的 handler（同一 session 共用，不再每個檔案重建 client / 重載對照表）
+        try:
+            handler = self._get_context().handler(ftype)
+        except NameError:
+            raise RuntimeError(f"{ftype} 的 handler 未正確導入或不可用")
+        print(f"[後端] 使用 {type(handler).__name__} 處理 {ftype} 檔案: {src}")
+
+        # 確認 handler 已正確初始化
+        if handler is None:
+            raise RuntimeError(f"無法取得 {ftype} 類型的處理器")
+
+        # 呼叫 handler 的 deidentify 方法進行處理
+        print(f"[後端] 開始去識別化處理，輸入: {src}, 輸出: {out_path}")
+        return handler.deidentify(src, out_path, selected_types_list, use_model=use_model)
 
     # 打包全部處理後檔案成 ZIP
     @Slot()
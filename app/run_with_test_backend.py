@@ -10,20 +10,21 @@ from PySide6.QtGui import QGuiApplication
 from PySide6.QtQml import QQmlApplicationEngine
 from PySide6.QtQuickControls2 import QQuickStyle
 
-# 每次執行先刪除 faker_models/pii_map.json
-try:
-    cache_path = os.path.join(os.path.dirname(__file__), '..', '..', 'faker_models', 'pii_map.json')
-    cache_path = os.path.abspath(cache_path)
-    if os.path.exists(cache_path):
-        os.remove(cache_path)
-        print(f"[INFO] 已刪除快取檔: {cache_path}")
-except Exception as e:
-    print(f"[WARN] 刪除 pii_map.json 失敗: {e}")
-
 from pathlib import Path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 
+# 對照表預設保留 7 天（可用環境變數 ANONIME_MAPPING_TTL 覆寫），啟動時只清掉過期的，
+# 不再整份刪除：同一段期間內處理的文件會拿到一致的假資料
+os.environ.setdefault("ANONIME_MAPPING_TTL", str(7 * 24 * 3600))
+try:
+    from faker_models.mapping_store import open_mapping_store
+    store = open_mapping_store()
+    print(f"[INFO] 已清除過期的對照：{store.purge_expired()} 筆（namespace: {store.namespace}）")
+    store.close()
+except Exception as e:
+    print(f"[WARN] 清除過期對照失敗: {e}")
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]   # ...\AnoniMe
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
@@ -0,0 +1,199 @@
+# faker_models/entity_validators.py
+"""
+偵測後的驗證：判斷 DATE_TIME / PERSON 實體要保留原文還是替換。
+
+原本每個 DATE_TIME 都重建約 150 個相對時間關鍵字的 set 再逐一比對、
+再跑 8 個沒編譯的 regex；每個 PERSON 也逐一比對約 50 個關鍵字。
+這裡改成模組載入時建好的 Aho-Corasick 關鍵字比對器 + 預先編譯（合併）的 regex，
+同一個原文只判斷一次（lru_cache），並提供整批 span 的 API。
+"""
+
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+VALIDATION_CACHE_SIZE = 65536
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick：一次掃過文字就知道是否包含任一關鍵字，
+    成本與關鍵字數量無關（原本是 關鍵字數 × 文字長度）。
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[bool] = [False]
+        for word in keywords:
+            if word:
+                self._add(word)
+        self._build()
+
+    def _add(self, word: str):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(False)
+            node = nxt
+        self._out[node] = True
+
+    def _build(self):
+        # BFS 建 failure link；某節點的 failure 鏈上有關鍵字結尾，該節點也算命中
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] or self._out[self._fail[nxt]]
+
+    def contains(self, text: str) -> bool:
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                return True
+        return False
+
+
+# ---------- DATE_TIME：相對時間保留原文 ----------
+RELATIVE_TIME_KEYWORDS = (
+    # 英文相對時間 - 基本
+    "today", "tomorrow", "yesterday", "now", "tonight",
+    # 英文相對時間 - 時段
+    "this morning", "this afternoon", "this evening", "this noon",
+    "last night", "yesterday morning", "yesterday afternoon", "yesterday evening",
+    "tomorrow morning", "tomorrow afternoon", "tomorrow evening", "tomorrow night",
+    # 英文相對時間 - 週期
+    "this week", "this month", "this year", "this quarter", "this semester",
+    "next week", "next month", "next year", "next quarter", "next semester",
+    "last week", "last month", "last year", "last quarter", "last semester",
+    # 英文相對時間 - 模糊時間
+    "recently", "lately", "soon", "later", "earlier", "before", "after",
+    "currently", "presently", "nowadays", "these days", "right now",
+    "just now", "a moment ago", "a while ago", "in a while", "shortly",
+    # 中文相對時間 - 基本
+    "今天", "明天", "昨天", "現在", "今晚", "今夜",
+    # 中文相對時間 - 時段
+    "今早", "今天早上", "今天上午", "今天中午", "今天下午", "今天晚上",
+    "昨天早上", "昨天上午", "昨天中午", "昨天下午", "昨天晚上", "昨晚",
+    "明天早上", "明天上午", "明天中午", "明天下午", "明天晚上", "明晚",
+    # 中文相對時間 - 週期
+    "這週", "這個星期", "這個月", "這一個月", "今年", "這一年",
+    "下週", "下個星期", "下個月", "下一個月", "明年", "下一年",
+    "上週", "上個星期", "上個月", "上一個月", "去年", "上一年",
+    # 中文相對時間 - 模糊時間
+    "最近", "近來", "稍後", "等等", "等一下", "之前", "之後", "以前", "以後",
+    "目前", "現階段", "當前", "眼前", "剛才", "剛剛", "一會兒", "待會兒",
+)
+
+_RELATIVE_TIME_PATTERNS = (
+    r'\b(in|within)\s+\d+\s+(days?|weeks?|months?|years?)\b',  # "in 3 days", "within 2 weeks"
+    r'\b\d+\s+(days?|weeks?|months?|years?)\s+(ago|from now)\b',  # "3 days ago", "2 weeks from now"
+    r'\bthis\s+(coming|past)\s+(week|month|year)\b',  # "this coming week", "this past month"
+    r'\b(next|last)\s+\w+(day|week|end)\b',  # "next weekend", "last weekday"
+    r'\b(early|late)\s+(this|next|last)\s+(week|month|year)\b',  # "early this week"
+    r'\b幾天(前|後|內)\b',  # 中文："幾天前", "幾天後", "幾天內"
+    r'\b\d+天(前|後|內)\b',  # 中文："3天前", "5天後"
+    r'\b(下|上)(周|月|年)(初|中|末)\b',  # 中文："下週初", "上月末"
+)
+
+_relative_time_matcher = KeywordMatcher(RELATIVE_TIME_KEYWORDS)
+_RELATIVE_TIME_RE = re.compile("|".join(f"(?:{p})" for p in _RELATIVE_TIME_PATTERNS))
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def is_relative_time(text: str) -> bool:
+    """是否為相對時間表達（今天、3 days ago...），是的話保留原文"""
+    lowered = text.lower().strip()
+    return _relative_time_matcher.contains(lowered) or _RELATIVE_TIME_RE.search(lowered) is not None
+
+
+# ---------- PERSON：不像人名的保留原文 ----------
+NON_PERSON_KEYWORDS = (
+    'email', 'mail', 'address', 'phone', 'number', 'id', 'card',
+    'password', 'user', 'admin', 'account', 'login', 'register',
+    'submit', 'send', 'click', 'here', 'link', 'url', 'http',
+    'www', 'com', 'org', 'net', 'gov', 'edu',
+    'file', 'document', 'pdf', 'doc', 'txt',
+    'company', 'corporation', 'inc', 'ltd', 'llc',
+    'street', 'avenue', 'road', 'drive', 'lane',
+    'city', 'state', 'country', 'zip', 'postal',
+    'contact', 'information', 'details', 'form',
+    'name', 'first', 'last', 'full', 'given',  # 表單欄位名稱
+)
+
+_non_person_matcher = KeywordMatcher(NON_PERSON_KEYWORDS)
+# 只允許英文字母、空格、連字符、撇號、點
+_PERSON_CHARS_RE = re.compile(r"[a-z \-'.]+")
+_FORM_FIELD_RE = re.compile("|".join(f"(?:{p})" for p in (
+    r'^(first|last|full)\s*(name)?$',
+    r'^name\s*(field)?$',
+    r'^email\s*(address)?$',
+    r'^phone\s*(number)?$',
+    r'^contact\s*(info|information)?$',
+)))
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def is_likely_person_name(text: str) -> bool:
+    """驗證文字是否真的像人名"""
+    text = text.strip().lower()
+    if len(text) < 2 or len(text) > 50:
+        return False
+    if _non_person_matcher.contains(text):
+        return False
+    # 含數字或特殊符號的都會在這裡被擋掉
+    if not _PERSON_CHARS_RE.fullmatch(text):
+        return False
+    return _FORM_FIELD_RE.match(text) is None
+
+
+# ---------- 批次 API ----------
+def keep_original(entity_type: str, raw: str) -> bool:
+    """這個實體是否應保留原文（不替換）"""
+    if entity_type == "DATE_TIME":
+        return is_relative_time(raw)
+    if entity_type == "PERSON":
+        return not is_likely_person_name(raw)
+    return False
+
+
+def keep_original_batch(spans: List[Dict], text: str = None) -> List[bool]:
+    """
+    spans 同 detect_pii 的輸出；回傳與 spans 同順序的「保留原文」判斷。
+    有給 text 時原文取 text[start:end]，否則用 span 的 raw_txt。
+    同一個 (類型, 原文) 只判斷一次。
+    """
+    decisions: Dict[tuple, bool] = {}
+    out = []
+    for s in spans:
+        if text is not None:
+            raw = text[int(s["start"]):int(s["end"])]
+        else:
+            raw = s.get("raw_txt") or ""
+        key = (s.get("entity_type"), raw)
+        keep = decisions.get(key)
+        if keep is None:
+            keep = decisions[key] = keep_original(*key)
+        out.append(keep)
+    return out
+
+
+def clear_cache():
+    is_relative_time.cache_clear()
+    is_likely_person_name.cache_clear()
@@ -0,0 +1,174 @@
+# faker_models/fake_pools.py
+"""
+大量產生假資料：共用 Faker 實例 + 數字型類別用 NumPy 向量化 + 每個類別一個可補充的池子。
+
+- Faker 實例依 locale 建一次重複使用（原本每個 span 都 new 一個 Faker）；
+- 台灣手機、身分證、統編、健保卡、護照等純數字格式一次用 NumPy 產生一整批；
+- take() 從池子取一個值是 O(1)，池子空了才一次補 POOL_REFILL 個。
+"""
+
+import os
+import random
+import string
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Tuple, Union
+
+from faker import Faker
+
+try:
+    import numpy as np
+except ImportError:  # 沒有 NumPy 時退回 random（較慢，結果格式相同）
+    np = None
+
+DEFAULT_LOCALE = ("zh_TW", "en_US")
+POOL_REFILL = 1024
+
+Locale = Union[str, Tuple[str, ...]]
+
+
+def _locale_key(locale: Locale) -> Tuple[str, ...]:
+    if isinstance(locale, str):
+        return (locale,)
+    return tuple(locale)
+
+
+@lru_cache(maxsize=None)
+def _get_faker(locale_key: Tuple[str, ...]) -> Faker:
+    return Faker(list(locale_key))
+
+
+def get_faker(locale: Locale = DEFAULT_LOCALE) -> Faker:
+    """依 locale 取得共用的 Faker 實例"""
+    return _get_faker(_locale_key(locale))
+
+
+# ---------- 數字型：向量化 ----------
+_rng = np.random.default_rng() if np is not None else None
+
+
+def _digits(n: int, k: int) -> List[str]:
+    """n 個長度 k 的數字字串"""
+    if k == 0:
+        return [""] * n
+    if np is None:
+        return ["".join(random.choices(string.digits, k=k)) for _ in range(n)]
+    codes = _rng.integers(48, 58, size=(n, k), dtype=np.uint8)  # '0'..'9'
+    return codes.view(f"S{k}").ravel().astype(str).tolist()
+
+
+def _choices(options: str, n: int) -> List[str]:
+    if np is None:
+        return random.choices(options, k=n)
+    return [options[i] for i in _rng.integers(0, len(options), size=n)]
+
+
+def _concat(*columns: List[str]) -> List[str]:
+    return ["".join(parts) for parts in zip(*columns)]
+
+
+BULK_GENERATORS = {
+    # 台灣手機：09 + 8 碼
+    "TW_PHONE_NUMBER": lambda n: [f"09{d}" for d in _digits(n, 8)],
+    # 台灣身分證：英文字母 + 1/2 + 8 碼
+    "TW_ID_NUMBER": lambda n: _concat(_choices(string.ascii_uppercase, n), _choices("12", n), _digits(n, 8)),
+    # 統一編號：8 碼
+    "UNIFIED_BUSINESS_NO": lambda n: _digits(n, 8),
+    # 健保卡：0000 + 6 碼
+    "TW_HEALTH_INSURANCE": lambda n: [f"0000{d}" for d in _digits(n, 6)],
+    # 台灣護照：3 + 7 碼
+    "TW_PASSPORT_NUMBER": lambda n: [f"3{d}" for d in _digits(n, 7)],
+    # UK NHS：3 3 4 格式
+    "UK_NHS": lambda n: [f"{d[:3]} {d[3:6]} {d[6:]}" for d in _digits(n, 10)],
+    # US ITIN：9 碼
+    "US_ITIN": lambda n: _digits(n, 9),
+}
+
+# ---------- 其他類別：Faker provider ----------
+FAKER_METHODS = {
+    "CREDIT_CARD": "credit_card_number",
+    "PERSON": "name",
+    "CRYPTO": "sha256",
+    "PHONE_NUMBER": "phone_number",
+    "EMAIL_ADDRESS": "email",
+    "URL": "url",
+    "IBAN_CODE": "iban",
+    "IP_ADDRESS": "ipv4",
+    "LOCATION": "address",
+    "US_BANK_NUMBER": "bban",
+    "US_DRIVER_LICENSE": "license_plate",
+    "US_PASSPORT": "passport_number",
+    "US_SSN": "ssn",
+    "MAC_ADDRESS": "mac_address",
+}
+
+
+def supports(entity_type: str) -> bool:
+    return entity_type in BULK_GENERATORS or entity_type in FAKER_METHODS or entity_type == "DATE_TIME"
+
+
+def generate_many(entity_type: str, n: int, locale: Locale = DEFAULT_LOCALE) -> List[str]:
+    """產生 n 個 entity_type 的假值；不支援的類別丟 KeyError"""
+    if n <= 0:
+        return []
+    bulk = BULK_GENERATORS.get(entity_type)
+    if bulk is not None:
+        return bulk(n)  # 純數字格式與 locale 無關
+    fake = get_faker(locale)
+    if entity_type == "DATE_TIME":
+        return [fake.date_time().isoformat() for _ in range(n)]
+    method = getattr(fake, FAKER_METHODS[entity_type])
+    return [method() for _ in range(n)]
+
+
+class FakePool:
+    """每個 (類別, locale) 一個 deque；取值 O(1)，空了一次補 refill 個"""
+
+    def __init__(self, refill: int = POOL_REFILL):
+        self.refill = refill
+        self._pools: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def take(self, entity_type: str, locale: Locale = DEFAULT_LOCALE) -> str:
+        key = (entity_type, _locale_key(locale))
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools.setdefault(key, deque())
+        try:
+            return pool.popleft()
+        except IndexError:
+            pass
+        # Faker 類別一個一個產生，池子不需要那麼大
+        size = self.refill if entity_type in BULK_GENERATORS else max(1, self.refill // 16)
+        with self._lock:
+            while True:
+                try:
+                    return pool.popleft()
+                except IndexError:
+                    # 別的 thread 可能不經 lock 取走剛補的值，取不到就再補
+                    pool.extend(generate_many(entity_type, size, locale))
+
+    def clear(self):
+        with self._lock:
+            self._pools.clear()
+
+
+_pool = FakePool()
+
+
+def take(entity_type: str, locale: Locale = DEFAULT_LOCALE) -> str:
+    """從共用池子取一個假值（O(1)）"""
+    return _pool.take(entity_type, locale)
+
+
+def _after_fork():
+    # fork 出來的 worker 會繼承同一個亂數狀態與池子內容，不重設的話各 worker 會發出一樣的假值
+    global _rng
+    if np is not None:
+        _rng = np.random.default_rng()
+    _pool.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,199 @@
+# faker_models/keyed_pseudonym.py
+"""
+決定性的金鑰化假名：替換值由 HMAC(金鑰, 類別, 正規化後原文) 推導，不需要對照表。
+
+同一把金鑰下，同一個輸入在任何 process / 機器上都得到同一個假名，
+不必讀寫 pii_map.json，也不需要 process 之間共用任何狀態。
+
+- 數字型（身分證、統編、電話、健保卡、護照...）：以 HMAC 當回合函數的 Feistel
+  格式保留加密（FPE）——位數不變、分隔符號留在原位，且不同輸入不會撞到同一個輸出；
+- 其他類別：用 HMAC 當種子驅動 Faker（語系依原文判斷；需同一版 Faker 才會一致）。
+
+用環境變數 ANONIME_PSEUDONYM_KEY 設定金鑰即啟用（見 muiltAI_pii_replace._route_spans）。
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import threading
+import unicodedata
+from typing import Optional
+
+from faker import Faker
+
+from faker_models.entity_validators import keep_original
+from pii_models.language_router import classify_language
+
+FPE_ROUNDS = 10
+
+# 這些類別的數字部分用 FPE；值為要原樣保留的前綴（如手機的 09）
+FPE_TYPES = {
+    "TW_PHONE_NUMBER": ("8869", "09"),
+    "PHONE_NUMBER": (),
+    "TW_ID_NUMBER": (),
+    "UNIFIED_BUSINESS_NO": (),
+    "TW_HEALTH_INSURANCE": (),
+    "TW_PASSPORT_NUMBER": (),
+    "UK_NHS": (),
+    "US_ITIN": (),
+    "US_SSN": (),
+    "US_BANK_NUMBER": (),
+    "CREDIT_CARD": (),
+}
+
+FAKER_METHODS = {
+    "PERSON": "name",
+    "LOCATION": "address",
+    "ADDRESS": "address",
+    "EMAIL_ADDRESS": "email",
+    "URL": "url",
+    "IP_ADDRESS": "ipv4",
+    "MAC_ADDRESS": "mac_address",
+    "DATE_TIME": "date",
+    "ORGANIZATION": "company",
+    "NRP": "country",
+    "IBAN_CODE": "iban",
+    "CRYPTO": "sha256",
+    "US_DRIVER_LICENSE": "license_plate",
+    "US_PASSPORT": "passport_number",
+}
+FAKER_LOCALES = {"zh": "zh_TW", "en": "en_US"}
+
+_TW_ID_RE = re.compile(r"[A-Z][12]\d{8}")
+_SPACES_RE = re.compile(r"\s+")
+_DIGIT_RE = re.compile(r"\d+")
+_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def normalize(e_type: str, raw: str) -> str:
+    """同一個實體的不同寫法（全半形、大小寫、多餘空白）要得到同一個假名"""
+    text = _SPACES_RE.sub(" ", unicodedata.normalize("NFKC", raw).strip())
+    if e_type in FPE_TYPES:
+        return text.upper()
+    return text.casefold()
+
+
+class KeyedPseudonymizer:
+    """
+    用法：
+        p = KeyedPseudonymizer(b"secret")
+        p.pseudonymize("TW_ID_NUMBER", "A123456789")  # 每次、每台機器都一樣
+    thread-safe（Faker 實例每個 thread 一份）。
+    """
+
+    def __init__(self, key: bytes):
+        if not key:
+            raise ValueError("KeyedPseudonymizer 需要非空的金鑰")
+        self._mac = hmac.new(key, digestmod=hashlib.sha256)
+        self._local = threading.local()
+        # 身分證字母：金鑰決定的 26 字母排列（一對一）
+        order = sorted(_LETTERS, key=lambda c: self._prf("letter", c))
+        self._letter_map = dict(zip(_LETTERS, order))
+        self._flip_gender = self._prf("gender")[0] & 1
+
+    def _prf(self, *parts: str) -> bytes:
+        mac = self._mac.copy()
+        mac.update("\x1f".join(parts).encode("utf-8"))
+        return mac.digest()
+
+    # ---------- FPE ----------
+    def _fpe(self, digits: str, tweak: str) -> str:
+        """Feistel（FF1 的結構）：n 位數字 → n 位數字，一對一"""
+        n = len(digits)
+        if n < 2:
+            return str(int.from_bytes(self._prf(tweak, "d1", digits), "big") % 10) if n else ""
+        u = n // 2
+        v = n - u
+        a, b = int(digits[:u]), int(digits[u:])
+        for r in range(FPE_ROUNDS):
+            m = u if r % 2 == 0 else v
+            width = v if r % 2 == 0 else u  # b 目前的位數
+            f = int.from_bytes(self._prf(tweak, str(n), str(r), str(b).zfill(width))[:16], "big")
+            a, b = b, (a + f) % (10 ** m)
+        return str(a).zfill(u) + str(b).zfill(v)
+
+    def _fpe_in_place(self, raw: str, norm: str, tweak: str, keep_prefixes=()) -> str:
+        """只加密數字，其他字元（-、空白、括號、大小寫）照 raw 原樣留在原位。
+
+        加密的輸入取自 norm 的數字（全形轉半形後才一致），結果再寫回 raw 對應的位置，
+        全形數字仍輸出全形。
+        """
+        digits = "".join(ch for ch in norm if ch.isdecimal())
+        keep = next((p for p in keep_prefixes if digits.startswith(p) and len(digits) > len(p)), "")
+        new_digits = iter(keep + self._fpe(digits[len(keep):], tweak))
+        # raw 裡有 NFKC 後才變成數字的字元（如 ①）時位置對不上，改寫 norm
+        target = raw if sum(ch.isdecimal() for ch in raw) == len(digits) else norm
+        return "".join(
+            chr(ord(ch) - unicodedata.digit(ch) + int(next(new_digits))) if ch.isdecimal() else ch
+            for ch in target
+        )
+
+    def _tw_id(self, raw: str, norm: str) -> str:
+        if not _TW_ID_RE.fullmatch(norm):
+            return self._fpe_in_place(raw, norm, "TW_ID_NUMBER")
+        gender = str(3 - int(norm[1])) if self._flip_gender else norm[1]
+        return self._letter_map[norm[0]] + gender + self._fpe(norm[2:], "TW_ID_NUMBER")
+
+    # ---------- Faker ----------
+    def _faker(self, locale: str) -> Faker:
+        fakers = getattr(self._local, "fakers", None)
+        if fakers is None:
+            fakers = self._local.fakers = {}
+        fake = fakers.get(locale)
+        if fake is None:
+            fake = fakers[locale] = Faker(locale)
+        return fake
+
+    def _seeded_value(self, e_type: str, raw: str, norm: str) -> str:
+        seed = int.from_bytes(self._prf("seed", e_type, norm)[:8], "big")
+        if e_type == "DURATION_TIME":
+            # 同 replace_pii：只換數字
+            return _DIGIT_RE.sub(str(seed % 20 + 1), raw, count=1)
+        method = FAKER_METHODS.get(e_type)
+        if method is None:
+            return f"{e_type}_{seed:016x}"
+        fake = self._faker(FAKER_LOCALES.get(classify_language(raw), "en_US"))
+        fake.seed_instance(seed)
+        return str(getattr(fake, method)())
+
+    # ---------- 主函式 ----------
+    def pseudonymize(self, e_type: str, raw: str) -> str:
+        if not raw:
+            return raw
+        # 相對時間、不像人名的，同本地替換的判斷保留原文
+        # （人名驗證只認英文字母，中文人名不套用，否則會原樣留下）
+        if keep_original(e_type, raw) and (e_type != "PERSON" or classify_language(raw) == "en"):
+            return raw
+        norm = normalize(e_type, raw)
+        if e_type == "TW_ID_NUMBER":
+            return self._tw_id(raw, norm)
+        if e_type in FPE_TYPES and any(ch.isdecimal() for ch in norm):
+            return self._fpe_in_place(raw, norm, e_type, FPE_TYPES[e_type])
+        return self._seeded_value(e_type, raw, norm)
+
+
+_pseudonymizer = None
+_configured = False
+_lock = threading.Lock()
+
+
+def get_pseudonymizer() -> Optional[KeyedPseudonymizer]:
+    """有設 ANONIME_PSEUDONYM_KEY（或呼叫過 configure_pseudonymizer）時回傳共用實例，否則 None"""
+    global _pseudonymizer, _configured
+    if not _configured:
+        with _lock:
+            if not _configured:
+                key = os.getenv("ANONIME_PSEUDONYM_KEY")
+                _pseudonymizer = KeyedPseudonymizer(key.encode("utf-8")) if key else None
+                _configured = True
+    return _pseudonymizer
+
+
+def configure_pseudonymizer(key: Optional[bytes]) -> Optional[KeyedPseudonymizer]:
+    """設定金鑰（None 表示關閉決定性模式），回傳新的實例"""
+    global _pseudonymizer, _configured
+    with _lock:
+        _pseudonymizer = KeyedPseudonymizer(key) if key else None
+        _configured = True
+    return _pseudonymizer
@@ -0,0 +1,207 @@
+# faker_models/kuwa_async_client.py
+"""
+非同步的 Kuwa 聊天客戶端（OpenAI-Compatible /chat/completions）。
+
+- 同一個 aiohttp.ClientSession（連線池）重複使用，不必每次重新建立連線；
+- max_concurrency 限制同時在途的請求數，requests_per_second 限制送出速率；
+- 自己帶一個背景 event loop thread，同步程式（handler）可用 run() 執行 coroutine，
+  session 一直留在同一個 loop 上。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    import aiohttp
+except ImportError:  # 只有真的要連模型時才需要
+    aiohttp = None
+
+
+def iter_lines(chunks):
+    """把串流的文字片段切成完整的行（略過空行）；串流中斷時不會吐出最後那半行"""
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buf.strip():
+        yield buf.strip()
+
+
+async def aiter_lines(chunks):
+    """iter_lines 的 async 版"""
+    buf = ""
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buf.strip():
+        yield buf.strip()
+
+
+class AsyncKuwaChatClient:
+    """
+    用法：
+        client = AsyncKuwaChatClient()
+        text = client.run(client.chat(system_prompt, user_prompt))
+        # 或在 async 程式裡直接 await client.chat(...)
+    會使用 .env 的 KUWA_BASE_URL / KUWA_API_KEY / KUWA_MODEL（同 KuwaChatClient）。
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        temperature: float = 0.8,
+        max_tokens: int = 1024,
+        max_concurrency: int = 4,
+        requests_per_second: float = 8.0,
+    ):
+        self.base_url = (base_url or os.getenv("KUWA_BASE_URL", "")).rstrip("/")
+        self.api_key = api_key or os.getenv("KUWA_API_KEY", "")
+        self.model = model or os.getenv("KUWA_MODEL", "")
+        self.temperature = temperature
+        # 一次要回整批（最多 batch_size 行），比同步版的 64 大
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+
+        if aiohttp is None:
+            raise RuntimeError("AsyncKuwaChatClient 需要 aiohttp，請先 pip install aiohttp。")
+        if not self.base_url or not self.api_key:
+            raise RuntimeError(
+                "缺少 KUWA_BASE_URL / KUWA_API_KEY。請在 .env 依 Kuwa 介面填寫完整 Base URL（含埠與 /v1*）。"
+            )
+        if not self.model:
+            raise RuntimeError("缺少 KUWA_MODEL，請先用 /models 清單對到正確 id 再填。")
+
+        # 以下都綁在 self._loop 上，第一次用到才建立
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._session_loop = None
+        self._semaphore = None
+        self._rate_lock = None
+        self._next_slot = 0.0
+        self._start_lock = threading.Lock()
+
+    # ---------- 背景 event loop ----------
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="kuwa-async", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """在 client 自己的 event loop 上執行 coroutine，阻塞直到完成（給同步程式用）"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return future.result(timeout)
+
+    async def _get_session(self):
+        # session / semaphore 都綁在建立它的 event loop 上，換了 loop 就重建
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            self._session_loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._rate_lock = asyncio.Lock()
+        return self._session
+
+    async def _wait_rate_limit(self):
+        # 每個請求佔一個 1 / requests_per_second 秒的時段，時段還沒到就等
+        if not self.requests_per_second:
+            return
+        async with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.requests_per_second
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    # ---------- 聊天 ----------
+    def _payload(self, system_prompt: str, user_prompt: str, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+        }
+
+    async def chat(self, system_prompt: str, user_prompt: str) -> str:
+        """送出一次問答，回傳模型完整的回覆文字（多行保留）"""
+        session = await self._get_session()
+        payload = self._payload(system_prompt, user_prompt, stream=False)
+        async with self._semaphore:
+            await self._wait_rate_limit()
+            async with session.post(f"{self.base_url}/chat/completions", json=payload) as resp:
+                resp.raise_for_status()
+                data = await resp.json(content_type=None)
+
+        choices = data.get("choices") or [{}]
+        text = (choices[0].get("message") or {}).get("content") or data.get("content") or ""
+        return text.strip()
+
+    async def chat_stream(self, system_prompt: str, user_prompt: str):
+        """串流版：邊收邊 yield 模型輸出的文字片段（SSE 的 delta.content）"""
+        session = await self._get_session()
+        payload = self._payload(system_prompt, user_prompt, stream=True)
+        async with self._semaphore:
+            await self._wait_rate_limit()
+            async with session.post(f"{self.base_url}/chat/completions", json=payload) as resp:
+                resp.raise_for_status()
+                if "text/event-stream" not in resp.headers.get("Content-Type", ""):
+                    # 伺服器不支援串流時會直接回完整 JSON
+                    data = await resp.json(content_type=None)
+                    choices = data.get("choices") or [{}]
+                    yield (choices[0].get("message") or {}).get("content") or data.get("content") or ""
+                    return
+                async for raw in resp.content:
+                    line = raw.decode("utf-8", errors="replace").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    piece = (choices[0].get("delta") or {}).get("content")
+                    if piece:
+                        yield piece
+
+    def chat_stream_lines(self, system_prompt: str, user_prompt: str):
+        """串流版，一次 yield 一個完整的替換行（async generator）"""
+        return aiter_lines(self.chat_stream(system_prompt, user_prompt))
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def close(self):
+        """關閉連線池並停止背景 event loop"""
+        if self._loop is None:
+            return
+        self.run(self.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
@@ -0,0 +1,506 @@
+# faker_models/mapping_store.py
+"""
+原文 → 假資料的對照表（同一個原文在所有文件都換成同一個假值）。
+
+兩種實作，介面相同（get / put / get_many / put_many，put 回傳最後採用的值）：
+
+MappingStore：記憶體 dict + 磁碟上的 snapshot（pii_map.json）與 append-only journal。
+- put 只把一行 JSON 放進待寫佇列，累積 group_size 筆或 flush_interval 秒後一次 append（group commit）；
+- journal 超過 compact_every 筆時壓縮成新的 snapshot（寫暫存檔 → fsync → os.replace），再清空 journal；
+- 啟動時讀 snapshot 再重播 journal；當機留下的半行會被忽略並截掉。
+只適合單一 process 使用。
+
+SqliteMappingStore：SQLite（WAL 模式），多個 process 可同時讀寫同一個檔案。
+- put 是原子的 get-or-create：第一個寫入的值勝出，之後的 put 都拿回那個值；
+- 值寫入後不再改變，讀過的值放在 process 內有上限的 LRU，資料本身都在磁碟上；
+- namespace 區隔不同專案/工作的對照（同一原文在不同 namespace 可有不同假值）；
+- ttl 秒後對照過期，視同不存在，purge_expired() 會把過期資料刪掉。
+
+keep_raw=True 時兩種實作都另外保存原文，reverse_entries() 可逐步取出 (假值, 原文)，
+給 reidentifier 把 AI 回覆裡的假值還原回原文；預設不保存原文。
+
+一般用 open_mapping_store() 取得（預設 SQLite，namespace / ttl / keep_raw 可由環境變數設定）。
+改用 SQLite 前累積在 pii_map.json 的對照，在 SQLite 資料表還是空的時候會匯入一次，既有的假值不會變。
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "pii_map.json")
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), "pii_map.sqlite3")
+# SQLite 單一查詢的參數數量上限（舊版為 999）
+_SQL_CHUNK = 500
+DEFAULT_NAMESPACE = "default"
+DEFAULT_MAX_CACHE_ENTRIES = 50000
+
+
+def mapping_key(e_type, raw) -> str:
+    return hashlib.sha256(f"{e_type}::{raw}".encode("utf-8")).hexdigest()[:32]
+
+
+class MappingStore:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        group_size: int = 256,
+        flush_interval: float = 0.5,
+        compact_every: int = 20000,
+        fsync: bool = True,
+        keep_raw: bool = False,
+    ):
+        self.path = path or DEFAULT_PATH
+        self.journal_path = self.path + ".journal"
+        # 原文另存一份 snapshot，pii_map.json 的格式維持 {key: 假值} 不變
+        self.raw_path = self.path + ".raw"
+        self.group_size = group_size
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.keep_raw = keep_raw
+
+        self._data = {}
+        self._raw = {}            # key → 原文（keep_raw 時）
+        self._raw_log = []        # 值有變動的 key，依寫入順序；reverse_entries 的 cursor 是這裡的位置
+        self._pending = []        # 尚未寫入 journal 的行
+        self._journal_count = 0   # journal 目前的筆數
+        self._lock = threading.RLock()
+        self._timer = None
+
+        self._load()
+        # 程式結束前把還沒寫出的 mapping 寫進 journal
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    # ---------- 讀取 / 復原 ----------
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            self._data = {}
+        except Exception as e:
+            print(f"[Mapping] 讀取 snapshot 失敗，從空的對照表開始：{e}")
+            self._data = {}
+
+        if self.keep_raw:
+            try:
+                with open(self.raw_path, "r", encoding="utf-8") as f:
+                    self._raw = json.load(f)
+            except FileNotFoundError:
+                self._raw = {}
+            except Exception as e:
+                print(f"[Mapping] 讀取原文 snapshot 失敗：{e}")
+                self._raw = {}
+
+        try:
+            with open(self.journal_path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            self._raw_log = list(self._raw)
+            return
+
+        good_end = 0
+        pos = 0
+        while pos < len(raw):
+            nl = raw.find(b"\n", pos)
+            if nl < 0:
+                break  # 沒有換行結尾：寫到一半就當機的最後一行
+            try:
+                rec = json.loads(raw[pos:nl].decode("utf-8"))
+                self._data[rec["k"]] = rec["v"]
+                if self.keep_raw and "r" in rec:
+                    self._raw[rec["k"]] = rec["r"]
+            except Exception:
+                break
+            self._journal_count += 1
+            pos = nl + 1
+            good_end = pos
+        self._raw_log = list(self._raw)
+
+        if good_end < len(raw):
+            print(f"[Mapping] journal 尾端有 {len(raw) - good_end} bytes 不完整，已截掉")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_end)
+
+    # ---------- 介面 ----------
+    def _key(self, e_type, raw):
+        return mapping_key(e_type, raw)
+
+    def get(self, e_type, raw):
+        return self._data.get(self._key(e_type, raw))
+
+    def get_many(self, items):
+        """items: [(e_type, raw), ...]，回傳同順序的值（沒有則 None）"""
+        return [self.get(e_type, raw) for e_type, raw in items]
+
+    def put_many(self, items):
+        """items: [(e_type, raw, val), ...]，回傳同順序實際採用的值"""
+        return [self.put(e_type, raw, val) for e_type, raw, val in items]
+
+    def put(self, e_type, raw, val):
+        key = self._key(e_type, raw)
+        rec = {"k": key, "v": val}
+        if self.keep_raw:
+            rec["r"] = raw
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self.keep_raw and (key not in self._raw or self._data.get(key) != val):
+                self._raw[key] = raw
+                self._raw_log.append(key)
+            self._data[key] = val
+            self._pending.append(line)
+            if len(self._pending) >= self.group_size:
+                self.flush()
+            elif self._timer is None and self.flush_interval:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return val
+
+    def flush(self):
+        """把待寫的 mapping 一次 append 到 journal（group commit）"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.writelines(self._pending)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._journal_count += len(self._pending)
+            self._pending = []
+            if self._journal_count >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """把目前的對照表寫成新的 snapshot（原子替換），再清空 journal"""
+        with self._lock:
+            # 待寫的內容已經在 _data 裡，會一起寫進 snapshot
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending = []
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if self.keep_raw:
+                # 原文 snapshot 先換好；這之後、主 snapshot 換好之前當機的話，journal 都還在
+                raw_tmp = self.raw_path + ".tmp"
+                with open(raw_tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._raw, f, ensure_ascii=False, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(raw_tmp, self.raw_path)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            # snapshot 已包含 journal 的所有內容；這之前當機的話重播 journal 結果也一樣
+            with open(self.journal_path, "w", encoding="utf-8"):
+                pass
+            self._journal_count = 0
+
+    def reverse_entries(self, since: int = 0):
+        """
+        回傳 (新 cursor, [(假值, 原文), ...])：cursor since 之後新增或變動的對照。
+        下次傳回這個 cursor 就只拿到增量；keep_raw=False 時永遠是空的。
+        """
+        with self._lock:
+            keys = self._raw_log[since:]
+            entries = [(self._data[k], self._raw[k]) for k in keys if k in self._data]
+            return len(self._raw_log), entries
+
+    def close(self):
+        self.flush()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteMappingStore:
+    """
+    多 process 共用的對照表（SQLite WAL）。
+    只存 key（namespace + e_type + 原文的 hash）、e_type 與假值，原文本身不落地；
+    keep_raw=True 時才另外存原文（raw 欄位），供 reverse_entries() 反查。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        namespace: str = DEFAULT_NAMESPACE,
+        ttl: Optional[float] = None,
+        max_cache_entries: int = DEFAULT_MAX_CACHE_ENTRIES,
+        timeout: float = 30.0,
+        keep_raw: bool = False,
+    ):
+        self.path = path or DEFAULT_SQLITE_PATH
+        self.namespace = namespace or DEFAULT_NAMESPACE
+        self.ttl = ttl
+        self.keep_raw = keep_raw
+        self.max_cache_entries = max_cache_entries
+        self.timeout = timeout
+        # key → (value, expires_at)；值寫入後不會再變，可以放心快取（過期另外判斷）
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self):
+        # fork 出來的 process 不能沿用父 process 的連線，pid 不同就重連
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS mappings ("
+            " key TEXT PRIMARY KEY,"
+            " e_type TEXT NOT NULL,"
+            " value TEXT NOT NULL)"
+        )
+        # 舊版資料表沒有 namespace / 時間欄位，補上（舊資料歸到 default、永不過期）
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(mappings)")}
+        if "namespace" not in columns:
+            conn.execute(f"ALTER TABLE mappings ADD COLUMN namespace TEXT NOT NULL DEFAULT '{DEFAULT_NAMESPACE}'")
+        if "created_at" not in columns:
+            conn.execute("ALTER TABLE mappings ADD COLUMN created_at REAL")
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE mappings ADD COLUMN expires_at REAL")
+        if "raw" not in columns:
+            conn.execute("ALTER TABLE mappings ADD COLUMN raw TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_mappings_expires ON mappings (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_mappings_namespace ON mappings (namespace)")
+        conn.commit()
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def _key(self, e_type, raw):
+        # default namespace 沿用原本的 key，舊資料不必搬
+        if self.namespace == DEFAULT_NAMESPACE:
+            return mapping_key(e_type, raw)
+        return mapping_key(e_type, f"{self.namespace}::{raw}")
+
+    def _remember(self, key, value, expires_at):
+        # 呼叫端需持有 self._lock
+        self._cache[key] = (value, expires_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cache_entries:
+            self._cache.popitem(last=False)
+
+    def _cached(self, key, now):
+        # 呼叫端需持有 self._lock；回傳未過期的值或 None
+        hit = self._cache.get(key)
+        if hit is None:
+            return None
+        value, expires_at = hit
+        if expires_at is not None and expires_at <= now:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return value
+
+    def _select(self, conn, keys, now):
+        found = {}
+        for i in range(0, len(keys), _SQL_CHUNK):
+            chunk = keys[i:i + _SQL_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM mappings WHERE key IN ({marks})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (*chunk, now),
+            )
+            for key, value, expires_at in rows:
+                found[key] = (value, expires_at)
+        return found
+
+    def get(self, e_type, raw):
+        return self.get_many([(e_type, raw)])[0]
+
+    def get_many(self, items):
+        """items: [(e_type, raw), ...]，回傳同順序的值（沒有或已過期則 None），一次查詢"""
+        keys = [self._key(e_type, raw) for e_type, raw in items]
+        now = time.time()
+        with self._lock:
+            values = {}
+            for key in keys:
+                value = self._cached(key, now)
+                if value is not None:
+                    values[key] = value
+            missing = list({k for k in keys if k not in values})
+            if missing:
+                for key, (value, expires_at) in self._select(self._connect(), missing, now).items():
+                    self._remember(key, value, expires_at)
+                    values[key] = value
+            return [values.get(k) for k in keys]
+
+    def put(self, e_type, raw, val):
+        return self.put_many([(e_type, raw, val)])[0]
+
+    def put_many(self, items):
+        """
+        items: [(e_type, raw, val), ...]，在同一個 transaction 內 get-or-create。
+        已有（未過期）值的 key 不會被覆寫（先寫先贏），回傳同順序實際採用的值。
+        """
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        rows = [
+            (self._key(e_type, raw), self.namespace, e_type, val, now, expires_at, raw if self.keep_raw else None)
+            for e_type, raw, val in items
+        ]
+        keys = list({row[0] for row in rows})
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                # 過期的舊值先刪掉，才能寫入新值
+                for i in range(0, len(keys), _SQL_CHUNK):
+                    chunk = keys[i:i + _SQL_CHUNK]
+                    marks = ",".join("?" * len(chunk))
+                    conn.execute(
+                        f"DELETE FROM mappings WHERE key IN ({marks}) AND expires_at <= ?", (*chunk, now)
+                    )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO mappings (key, namespace, e_type, value, created_at, expires_at, raw)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                found = self._select(conn, keys, now)
+            for key, (value, exp) in found.items():
+                self._remember(key, value, exp)
+            return [found[row[0]][0] for row in rows]
+
+    def reverse_entries(self, since: int = 0):
+        """
+        回傳 (新 cursor, [(假值, 原文), ...])：這個 namespace 中 rowid 大於 since、有存原文且未過期的對照。
+        rowid 只增不減，下次傳回這個 cursor 就只拿到增量。
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT rowid, value, raw FROM mappings"
+                " WHERE rowid > ? AND namespace = ? AND raw IS NOT NULL"
+                " AND (expires_at IS NULL OR expires_at > ?) ORDER BY rowid",
+                (since, self.namespace, time.time()),
+            ).fetchall()
+        cursor = rows[-1][0] if rows else since
+        return cursor, [(value, raw) for _, value, raw in rows]
+
+    def import_json(self, json_path: str = DEFAULT_PATH) -> int:
+        """
+        資料表還是空的時，把 MappingStore 的 JSON 對照表（snapshot + journal）匯入 default namespace，
+        回傳匯入筆數。key 的算法相同，匯入後同一個原文拿到的仍是原本的假值；
+        JSON 只有 key 沒有類型，e_type 留空。多個 process 同時匯入也只是重複 INSERT OR IGNORE。
+        """
+        if not (os.path.exists(json_path) or os.path.exists(json_path + ".journal")):
+            return 0
+        with self._lock:
+            conn = self._connect()
+            if conn.execute("SELECT 1 FROM mappings LIMIT 1").fetchone() is not None:
+                return 0
+            legacy = MappingStore(json_path, flush_interval=0, keep_raw=self.keep_raw)
+            now = time.time()
+            rows = [
+                (key, DEFAULT_NAMESPACE, "", value, now, None, legacy._raw.get(key))
+                for key, value in legacy._data.items()
+            ]
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO mappings (key, namespace, e_type, value, created_at, expires_at, raw)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        if rows:
+            print(f"[Mapping] 已把 {os.path.basename(json_path)} 的 {len(rows)} 筆對照匯入 SQLite")
+        return len(rows)
+
+    def purge_expired(self) -> int:
+        """刪除所有 namespace 中已過期的對照，回傳刪除筆數"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                deleted = conn.execute("DELETE FROM mappings WHERE expires_at <= ?", (now,)).rowcount
+            for key in [k for k, (_, exp) in self._cache.items() if exp is not None and exp <= now]:
+                del self._cache[key]
+        return deleted
+
+    def clear_namespace(self, namespace: Optional[str] = None) -> int:
+        """刪除某個 namespace（預設為自己的）的所有對照，回傳刪除筆數"""
+        namespace = namespace or self.namespace
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                deleted = conn.execute("DELETE FROM mappings WHERE namespace = ?", (namespace,)).rowcount
+            self._cache.clear()
+        return deleted
+
+    def flush(self):
+        # 每次 put 都已 commit，保留這個方法以相容 MappingStore 的介面
+        pass
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def __len__(self):
+        """這個 namespace 中未過期的對照筆數"""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM mappings WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.namespace, time.time()),
+            ).fetchone()[0]
+
+
+def open_mapping_store(
+    namespace: Optional[str] = None,
+    ttl: Optional[float] = None,
+    backend: Optional[str] = None,
+    path: Optional[str] = None,
+    keep_raw: Optional[bool] = None,
+):
+    """
+    取得對照表。沒指定的參數讀環境變數：
+    ANONIME_MAPPING_BACKEND（sqlite / journal，預設 sqlite）、
+    ANONIME_MAPPING_NAMESPACE（預設 default）、ANONIME_MAPPING_TTL（秒，預設永不過期）、
+    ANONIME_MAPPING_KEEP_RAW（1 表示保存原文以便還原，預設不保存）。
+    環境變數會傳給 parallel_engine 的 worker，所以同一個工作的所有 process 用同一個 namespace。
+    用預設路徑的 SQLite 時，資料表是空的就先匯入舊的 pii_map.json（見 SqliteMappingStore.import_json）。
+    """
+    backend = backend or os.getenv("ANONIME_MAPPING_BACKEND", "sqlite")
+    if keep_raw is None:
+        keep_raw = os.getenv("ANONIME_MAPPING_KEEP_RAW", "").lower() in ("1", "true", "yes")
+    if backend == "journal":
+        return MappingStore(path, keep_raw=keep_raw)
+    if backend != "sqlite":
+        raise ValueError(f"不支援的對照表類型：{backend}（可用：sqlite、journal）")
+
+    namespace = namespace or os.getenv("ANONIME_MAPPING_NAMESPACE") or DEFAULT_NAMESPACE
+    if ttl is None and os.getenv("ANONIME_MAPPING_TTL"):
+        ttl = float(os.getenv("ANONIME_MAPPING_TTL"))
+    store = SqliteMappingStore(path, namespace=namespace, ttl=ttl, keep_raw=keep_raw)
+    if path is None:
+        store.import_json(DEFAULT_PATH)
+    return store
+
+
+def _flush_at_exit(store_ref):
+    store = store_ref()
+    if store is not None:
+        try:
+            store.flush()
+        except Exception as e:
+            print(f"[Mapping] 結束前寫入 journal 失敗：{e}")
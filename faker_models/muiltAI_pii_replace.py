@@ -1,12 +1,19 @@
 # muiltAI_pii_replace.py  — 改用 KuwaClient，不再載本地 HF 模型
-import os, json, hashlib
+import os, json, hashlib, time
 from typing import List, Dict, Tuple, Optional
 import asyncio
+import threading
 import types
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 
 # 你原本的 presidio 替換器
 from faker_models.presidio_replacer_plus import replace_pii as _presidio_replace
+from faker_models.kuwa_async_client import iter_lines
+from faker_models.span_rewriter import rewrite_spans
+from faker_models import fake_pools
+from faker_models.keyed_pseudonym import get_pseudonymizer
+from faker_models.single_flight import SingleFlight
 
 # 讀 .env（若沒有也能跑，只是拿不到環境變數）
 try:
@@ -58,13 +65,29 @@ class KuwaChatClient:
 
 
 
-    def chat(self, system_prompt: str, user_prompt: str) -> str:
-        messages = [
+    def _messages(self, system_prompt: str, user_prompt: str):
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
+
+    @staticmethod
+    def _resp_text(resp) -> str:
+        if isinstance(resp, str):
+            return resp
+        if isinstance(resp, dict):
+            return (
+                resp.get("content")
+                or resp.get("message")
+                or (resp.get("choices", [{}])[0].get("message", {}) or {}).get("content", "")
+                or ""
+            )
+        return getattr(resp, "content", "") or str(resp)
+
+    def chat(self, system_prompt: str, user_prompt: str) -> str:
+        """回傳模型完整的回覆（多行保留，一行對應批次裡的一個項目）"""
         resp = self._client.chat_complete(
-            messages=messages,
+            messages=self._messages(system_prompt, user_prompt),
             streaming=False,
         )
 
@@ -76,62 +99,68 @@ class KuwaChatClient:
                     result += chunk
                 return result
             text = asyncio.run(collect())
-        elif isinstance(resp, str):
-            text = resp
-        elif isinstance(resp, dict):
-            text = (
-                resp.get("content")
-                or resp.get("message")
-                or (resp.get("choices", [{}])[0].get("message", {}) or {}).get("content", "")
-                or ""
-            )
         else:
-            text = getattr(resp, "content", "") or str(resp)
+            text = self._resp_text(resp)
 
-        text = (text or "").strip()
-        for line in text.splitlines():
-            line = line.strip()
-            if line:
-                return line
-        return text
+        return (text or "").strip()
 
+    def chat_stream(self, system_prompt: str, user_prompt: str):
+        """串流版：邊收邊 yield 文字片段（KuwaClient 回 async generator，這裡一段一段拉）"""
+        resp = self._client.chat_complete(
+            messages=self._messages(system_prompt, user_prompt),
+            streaming=True,
+        )
+        if not isinstance(resp, types.AsyncGeneratorType):
+            yield self._resp_text(resp)
+            return
 
-# ----------- safe chat 包裝（原樣保留）-----------
-def _safe_chat(chat_client, system_prompt: str, user_prompt: str, batch, timeout_sec: int = 20) -> str:
-    import time
-    t0 = time.time()
-    try:
-        out = chat_client.chat(system_prompt, user_prompt)
-        if time.time() - t0 > timeout_sec:
-            raise TimeoutError(f"model timeout after {timeout_sec}s")
-        return out if isinstance(out, str) else str(out)
-    except Exception as e:
-        print(f"[Warn ] 模型失敗或逾時: {e}")
-        return "\n".join(raw for _, _, raw in batch)
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    chunk = loop.run_until_complete(resp.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        finally:
+            loop.run_until_complete(resp.aclose())
+            loop.close()
+
+    def chat_stream_lines(self, system_prompt: str, user_prompt: str):
+        """串流版，一次 yield 一個完整的替換行"""
+        return iter_lines(self.chat_stream(system_prompt, user_prompt))
+
+
+# ----------- safe chat 包裝 -----------
+# 真正的逾時 + 抖動退避重試 + 斷路器（見 faker_models/resilience.py）
+from faker_models.resilience import (  # noqa: E402
+    CircuitOpenError, RetryPolicy, call_async, call_sync, get_breaker, get_llm_metrics, run_in_thread,
+)
 
+MODEL_RETRY = RetryPolicy(attempts=2, base_delay=0.5, max_delay=4.0)
 
-# ----------- 生成快取（原樣保留）-----------
-class MappingStore:
-    def __init__(self, path: Optional[str] = None):
-        base_dir = os.path.dirname(__file__)
-        default_path = os.path.join(base_dir, "pii_map.json")
-        self.path = path or default_path
-        try:
-            self._data = json.load(open(self.path, "r", encoding="utf-8"))
-        except Exception:
-            self._data = {}
 
-    def _key(self, e_type, raw):
-        return hashlib.sha256(f"{e_type}::{raw}".encode("utf-8")).hexdigest()[:32]
+def _safe_chat(chat_client, system_prompt: str, user_prompt: str, batch, timeout_sec: int = 20) -> Optional[str]:
+    """回傳模型回覆；失敗、逾時或斷路器打開時回傳 None（由呼叫端改走本地替換）"""
+    try:
+        out = call_sync(
+            chat_client.chat, system_prompt, user_prompt,
+            timeout_sec=timeout_sec, breaker=get_breaker(), retry=MODEL_RETRY,
+        )
+        return out if isinstance(out, str) else str(out)
+    except CircuitOpenError:
+        # 只有斷路器擋下或逾時／失敗才算 fallback（空行、照抄原文不算）
+        get_breaker().record_fallback(len(batch))
+        return None
+    except Exception as e:
+        print(f"[Warn ] 模型失敗或逾時: {e!r}")
+        get_breaker().record_fallback(len(batch))
+        return None
 
-    def get(self, e_type, raw):
-        return self._data.get(self._key(e_type, raw))
 
-    def put(self, e_type, raw, val):
-        self._data[self._key(e_type, raw)] = val
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        json.dump(self._data, open(self.path, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-        return val
+# ----------- 生成快取 -----------
+# 對照表：單 process 用 MappingStore（journal），多 process 共用 SqliteMappingStore（見 faker_models/mapping_store.py）
+from faker_models.mapping_store import MappingStore, SqliteMappingStore, open_mapping_store  # noqa: E402
 
 
 # ----------- 你原本的 Presidio 類型集合（原樣保留）-----------
@@ -146,7 +175,17 @@ PRESIDIO_TYPES = {
 }
 
 
+# 這些類別在 replace_pii 裡只產生固定格式的值，直接從 fake_pools 的池子取（O(1)），
+# 不必為了一個值組 span 再跑整個 replace_pii；locale 同 replace_pii 的 Faker()
+POOLED_TYPES = {
+    "TW_PHONE_NUMBER", "TW_ID_NUMBER", "UNIFIED_BUSINESS_NO", "TW_HEALTH_INSURANCE", "TW_PASSPORT_NUMBER",
+    "UK_NHS", "PHONE_NUMBER", "CREDIT_CARD", "IP_ADDRESS", "URL", "MAC_ADDRESS",
+}
+
+
 def _presidio_replace_one(e_type: str, raw: str) -> str:
+    if e_type in POOLED_TYPES:
+        return fake_pools.take(e_type, locale="en_US")
     tmp_text = raw
     tmp_spans = [{"entity_type": e_type, "start": 0, "end": len(raw), "raw_txt": raw, "score": 1.0}]
     try:
@@ -167,86 +206,508 @@ def build_user_prompt(batch):
     return "\n".join(lines)
 
 
-# ----------- 主函式：替換（保留原介面，預設用 KuwaChatClient）-----------
-def replace_entities(
-    text: str,
-    spans: List[Dict],
-    chat_client=None,
-    mapping: Optional[MappingStore] = None,
-    batch_size: int = 30,
-    debug: bool = True,
-) -> str:
-    mapping = mapping or MappingStore()
-    chat_client = chat_client or KuwaChatClient()  # ← 不傳就用 Kuwa
-
+# ----------- 替換流程的共用步驟 -----------
+def _route_spans(text: str, spans: List[Dict], mapping, debug: bool):
+    """路由 + 快取：回傳 (prepared {span index: 替換值}, need_model [(span index, e_type, raw)])"""
     prepared: Dict[int, str] = {}
     need_model: List[Tuple[int, str, str]] = []
 
-    if debug:
-        print("\n[Step 0] 原始文字：", text)
-        print("[Step 0] 偵測到的 spans：")
-        for s in spans:
-            print("  -", s)
-
-    # 2) 路由 + 快取
-    for i, s in enumerate(spans):
-        e_type = s.get("entity_type")
+    items = []
+    for s in spans:
         start, end = int(s["start"]), int(s["end"])
-        raw = s.get("raw_txt") or text[start:end]
-
-        cached = mapping.get(e_type, raw)
-        if cached:
+        items.append((s.get("entity_type"), s.get("raw_txt") or text[start:end]))
+
+    # 決定性模式（有設 ANONIME_PSEUDONYM_KEY）：替換值由金鑰推導，不查對照表也不呼叫模型
+    pseudonymizer = get_pseudonymizer()
+    if pseudonymizer is not None:
+        for i, (e_type, raw) in enumerate(items):
+            prepared[i] = pseudonymizer.pseudonymize(e_type, raw)
+            if debug: print(f"[Keyed ] 金鑰假名 #{i}: {e_type} {raw!r} -> {prepared[i]!r}")
+        return prepared, need_model
+
+    # 一次查完所有 span 的既有對照
+    cached_values = mapping.get_many(items)
+
+    for i, ((e_type, raw), cached) in enumerate(zip(items, cached_values)):
+        # 舊版會把「原文 → 原文」寫進對照表，這種對照當作沒有
+        if cached and cached != raw:
             prepared[i] = cached
             if debug: print(f"[Route] 快取已有 #{i}: {raw!r} -> {cached!r}")
             continue
 
         if e_type in PRESIDIO_TYPES:
             rep = _presidio_replace_one(e_type, raw)
-            mapping.put(e_type, raw, rep)
+            if rep != raw:
+                # put 回傳實際採用的值（別的 process 先寫入的話以它為準）
+                rep = mapping.put(e_type, raw, rep)
             prepared[i] = rep
             if debug: print(f"[Local ] presidio 替換 #{i}: {e_type} {raw!r} -> {rep!r}")
         else:
             need_model.append((i, e_type, raw))
             if debug: print(f"[Model ] 模型處理 #{i}: {e_type} {raw!r}")
+    return prepared, need_model
+
+
+# 即時模式（use_model=False）的暫時替換值：同一個 (類型, 原文) 在本程序內給同一個值，
+# 但不寫入對照表，之後模型升級版的結果才是正式對照
+# 即時預覽與背景升級會在不同 thread 同時跑，讀寫都要持有 _PREVIEW_LOCK
+_PREVIEW_VALUES: Dict[Tuple[str, str], str] = {}
+_PREVIEW_MAX_ENTRIES = 50000
+_PREVIEW_LOCK = threading.Lock()
 
-    # 3) 模型批次
-    for j in range(0, len(need_model), batch_size):
-        batch = need_model[j:j + batch_size]
-        if not batch:
-            break
 
-        user_prompt = build_user_prompt(batch)
+def _local_preview(need_model, prepared: Dict[int, str], debug: bool):
+    """不等模型，先用本地 Faker 給需要模型的項目暫時的替換值"""
+    for i, e_type, raw in need_model:
+        with _PREVIEW_LOCK:
+            rep = _PREVIEW_VALUES.get((e_type, raw))
+        if rep is None:
+            rep = _presidio_replace_one(e_type, raw)
+            with _PREVIEW_LOCK:
+                if len(_PREVIEW_VALUES) >= _PREVIEW_MAX_ENTRIES:
+                    _PREVIEW_VALUES.clear()
+                # 別的 thread 先放進去的話以它為準，同一個原文只給一個值
+                rep = _PREVIEW_VALUES.setdefault((e_type, raw), rep)
+        prepared[i] = rep
         if debug:
-            print("\n[Model] 發送批次：")
-            print(user_prompt)
+            print(f"[Preview] 暫時替換 #{i}: {raw!r} -> {rep!r}")
 
-        out = _safe_chat(chat_client, SYSTEM_PROMPT, user_prompt, batch, timeout_sec=10)
-        lines = (out or "").strip().splitlines()
 
-        # 補齊
-        while len(lines) < len(batch):
-            lines.append("")
+# ----------- 合併同一個 (類型, 原文) 的模型請求 -----------
+# 多個檔案 / thread 同時遇到同一個還沒有對照的實體時，只有一個呼叫送模型，其他的等它的結果；
+# 同一次呼叫內重複的項目也只送一次
+_MODEL_FLIGHT = SingleFlight()
 
-        for line, (i, e_type, raw) in zip(lines, batch):
-            rep = (line or "").strip()
-            if (not rep) or (rep == raw):
-                rep = raw  # 保守處理
-            mapping.put(e_type, raw, rep)
-            prepared[i] = rep
+
+def _flight_wait_sec(timeout_sec: float) -> float:
+    # owner 最久要跑完所有重試（含退避）；等超過這個時間就不再等，自己改走本地替換
+    return (timeout_sec + MODEL_RETRY.max_delay) * MODEL_RETRY.attempts
+
+
+def _claim_model_items(need_model):
+    """
+    need_model 依 (類型, 原文) 分組並向 _MODEL_FLIGHT 登記。
+    回傳 (groups {key: [span index...]}, 這次要送模型的項目, owned keys, waiting {key: Future})
+    """
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for i, e_type, raw in need_model:
+        groups.setdefault((e_type, raw), []).append(i)
+    owned, waiting = _MODEL_FLIGHT.acquire(groups)
+    leaders = [(groups[key][0], *key) for key in owned]
+    return groups, leaders, owned, waiting
+
+
+def _release_model_items(groups, owned, prepared: Dict[int, str]):
+    _MODEL_FLIGHT.release(owned, {key: prepared.get(groups[key][0]) for key in owned})
+
+
+def _wait_model_items(waiting, timeout_sec: float) -> Dict[Tuple[str, str], Optional[str]]:
+    deadline = time.monotonic() + timeout_sec
+    values = {}
+    for key, fut in waiting.items():
+        try:
+            values[key] = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            values[key] = None
+    return values
+
+
+async def _wait_model_items_async(waiting, timeout_sec: float) -> Dict[Tuple[str, str], Optional[str]]:
+    if not waiting:
+        return {}
+    # 逾時也不取消：wrap_future 的取消會傳到共用的 Future，其他等待者會跟著失敗
+    wrapped = {asyncio.wrap_future(fut): key for key, fut in waiting.items()}
+    done, _ = await asyncio.wait(wrapped, timeout=timeout_sec)
+    return {key: (w.result() if w in done else None) for w, key in wrapped.items()}
+
+
+def _share_model_results(groups, waited: Dict[Tuple[str, str], Optional[str]], mapping,
+                         prepared: Dict[int, str], debug: bool):
+    """把別的呼叫問到的值填進 prepared（等不到的改走本地替換），再複製給同組的重複項目"""
+    missing = []
+    for key, value in waited.items():
+        if value is None:
+            missing.append((groups[key][0], *key))
+        else:
+            prepared[groups[key][0]] = value
             if debug:
-                print(f"[Model] 批次結果 #{i}: {raw!r} -> {rep!r}")
+                print(f"[Shared] 共用進行中的模型結果 #{groups[key][0]}: {key[1]!r} -> {value!r}")
+    if missing:
+        _store_local_batch(missing, mapping, prepared, debug)
+    for indices in groups.values():
+        if indices[0] in prepared:
+            for i in indices[1:]:
+                prepared[i] = prepared[indices[0]]
+
+
+def _store_local_batch(batch, mapping, prepared: Dict[int, str], debug: bool):
+    """模型不可用時整批改走本地 Faker；本地也替換不了（回傳原文）的不寫入對照表，下次還能交給模型"""
+    reps = [(e_type, raw, _presidio_replace_one(e_type, raw)) for _, e_type, raw in batch]
+    changed = [r for r in reps if r[2] != r[1]]
+    stored = dict(zip(((e_type, raw) for e_type, raw, _ in changed), mapping.put_many(changed)))
+    for (i, e_type, raw), (_, _, rep) in zip(batch, reps):
+        prepared[i] = stored.get((e_type, raw), rep)
+        if debug:
+            print(f"[Local ] 模型不可用，本地替換 #{i}: {raw!r} -> {prepared[i]!r}")
 
-    # 4) 右→左套用
-    new_text = text
-    for i, s in sorted(enumerate(spans), key=lambda x: int(x[1]["start"]), reverse=True):
-        if i not in prepared:
+
+def _store_model_batch(out: Optional[str], batch, mapping, prepared: Dict[int, str], debug: bool):
+    """把模型回覆逐行對回 batch，寫入對照表並放進 prepared；out 為 None 表示模型不可用"""
+    if out is None:
+        _store_local_batch(batch, mapping, prepared, debug)
+        return
+
+    lines = (out or "").strip().splitlines()
+
+    # 補齊
+    while len(lines) < len(batch):
+        lines.append("")
+
+    answered, reps, unanswered = [], [], []
+    for line, (i, e_type, raw) in zip(lines, batch):
+        rep = (line or "").strip()
+        # 空行或照抄原文：不能寫進對照表（否則之後永遠「替換」成原文），改走本地替換
+        if (not rep) or (rep == raw):
+            unanswered.append((i, e_type, raw))
             continue
-        start, end = int(s["start"]), int(s["end"])
-        before = new_text
-        new_text = new_text[:start] + prepared[i] + new_text[end:]
+        answered.append(i)
+        reps.append((e_type, raw, rep))
+    # 整批一次寫入，拿回實際採用的值
+    for i, (_, raw, _), rep in zip(answered, reps, mapping.put_many(reps)):
+        prepared[i] = rep
+        if debug:
+            print(f"[Model] 批次結果 #{i}: {raw!r} -> {rep!r}")
+    if unanswered:
+        _store_local_batch(unanswered, mapping, prepared, debug)
+
+
+# ----------- 串流模式：模型每吐出一行就寫入對照表 -----------
+def _commit_stream_line(line: str, item, mapping, prepared: Dict[int, str], debug: bool):
+    i, e_type, raw = item
+    rep = line.strip()
+    if (not rep) or (rep == raw):
+        # 同 _store_model_batch：空行或照抄原文不寫入對照表，這一項改走本地替換
+        _store_local_batch([item], mapping, prepared, debug)
+        return
+    prepared[i] = mapping.put(e_type, raw, rep)
+    if debug:
+        print(f"[Stream] #{i}: {raw!r} -> {prepared[i]!r}")
+
+
+class _StreamAttempt:
+    """
+    同步串流的一次嘗試：每次嘗試一個新的實例，逾時後仍在背景收的舊 thread
+    只會寫到自己的 items / received，不會寫進下一次嘗試的狀態。
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.received = 0
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def stop(self) -> int:
+        """不再接受這次嘗試的結果，回傳已收到的項目數"""
+        with self.lock:
+            self.stopped = True
+            return self.received
+
+    def consume(self, chat_client, mapping, prepared: Dict[int, str], debug: bool):
+        lines = chat_client.chat_stream_lines(SYSTEM_PROMPT, build_user_prompt(self.items))
+        try:
+            for line in lines:
+                with self.lock:
+                    # 逾時後背景 thread 可能還在收，這時不能再寫入
+                    if self.stopped or self.received >= len(self.items):
+                        return
+                    _commit_stream_line(line, self.items[self.received], mapping, prepared, debug)
+                    self.received += 1
+        finally:
+            # 停止時關掉串流（釋放連線），不必等模型把剩下的內容吐完
+            close = getattr(lines, "close", None)
+            if close is not None:
+                close()
+
+
+def _stream_model_batch(chat_client, batch, mapping, prepared: Dict[int, str], timeout_sec: float, debug: bool):
+    """
+    同步串流：每收到一行就寫入對照表。串流中斷或逾時時，已收到的項目保留，
+    只把剩下的項目重試（或交給本地替換）。chat_client 需提供 chat_stream_lines()。
+    """
+    breaker = get_breaker()
+    pending = list(batch)
+    succeeded = False
+    for attempt in range(MODEL_RETRY.attempts):
+        if not pending or not breaker.allow():
+            break
+        if attempt:
+            time.sleep(MODEL_RETRY.delay(attempt - 1))
+        breaker.record_attempt(retry=attempt > 0)
+
+        attempt_state = _StreamAttempt(pending)
+
+        # 串流自己處理重試與斷路器（中斷時只重送沒收到的項目），這裡只需要逾時
+        try:
+            run_in_thread(attempt_state.consume, chat_client, mapping, prepared, debug).result(timeout=timeout_sec)
+        except Exception as e:
+            received = attempt_state.stop()
+            print(f"[Warn ] 串流中斷或逾時（已收到 {received}/{len(pending)}）: {e!r}")
+            breaker.record_failure(timeout=isinstance(e, FutureTimeoutError))
+            pending = pending[received:]
+            continue
+        breaker.record_success()
+        succeeded = True
+        pending = pending[attempt_state.stop():]
+        break
+
+    if pending:
+        if not succeeded:
+            # 斷路器擋下或每次嘗試都中斷；串流正常結束但行數不足不算 fallback
+            breaker.record_fallback(len(pending))
+        _store_local_batch(pending, mapping, prepared, debug)
+
+
+async def _stream_model_batch_async(chat_client, batch, mapping, prepared: Dict[int, str], timeout_sec: float, debug: bool):
+    """_stream_model_batch 的 async 版（逾時會取消串流）"""
+    breaker = get_breaker()
+    pending = list(batch)
+    succeeded = False
+    for attempt in range(MODEL_RETRY.attempts):
+        if not pending or not breaker.allow():
+            break
+        if attempt:
+            await asyncio.sleep(MODEL_RETRY.delay(attempt - 1))
+        breaker.record_attempt(retry=attempt > 0)
+
+        items = pending
+        received = 0
+
+        async def consume():
+            nonlocal received
+            async for line in chat_client.chat_stream_lines(SYSTEM_PROMPT, build_user_prompt(items)):
+                if received >= len(items):
+                    break
+                _commit_stream_line(line, items[received], mapping, prepared, debug)
+                received += 1
+
+        try:
+            await asyncio.wait_for(consume(), timeout_sec)
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            print(f"[Warn ] 串流中斷或逾時（已收到 {received}/{len(items)}）: {e!r}")
+            breaker.record_failure(timeout=timed_out)
+            pending = items[received:]
+            continue
+        breaker.record_success()
+        succeeded = True
+        pending = items[received:]
+        break
+
+    if pending:
+        if not succeeded:
+            breaker.record_fallback(len(pending))
+        _store_local_batch(pending, mapping, prepared, debug)
+
+
+async def _run_model_batches_async(chat_client, batches, mapping, prepared: Dict[int, str],
+                                   timeout_sec: float, stream: bool, debug: bool):
+    """所有模型批次同時送出；stream=True 時逐行寫入對照表"""
+    if stream:
+        await asyncio.gather(*(
+            _stream_model_batch_async(chat_client, batch, mapping, prepared, timeout_sec, debug)
+            for batch in batches
+        ))
+        return
+    outs = await asyncio.gather(*(
+        _safe_chat_async(chat_client, SYSTEM_PROMPT, build_user_prompt(batch), batch, timeout_sec)
+        for batch in batches
+    ))
+    for batch, out in zip(batches, outs):
+        _store_model_batch(out, batch, mapping, prepared, debug)
+
+
+async def _resolve_model_items_async(chat_client, need_model, mapping, prepared: Dict[int, str],
+                                     batch_size: int, timeout_sec: float, stream: bool, debug: bool):
+    """需要模型的項目：去重、合併其他呼叫進行中的請求，其餘整批同時送出"""
+    groups, leaders, owned, waiting = _claim_model_items(need_model)
+    try:
+        batches = [leaders[j:j + batch_size] for j in range(0, len(leaders), batch_size)]
         if debug:
-            print(f"[Apply ] #{i} 位置({start},{end})：{before!r} -> {new_text!r}")
+            print(f"\n[Model] 同時發送 {len(batches)} 個批次"
+                  f"（重複 {len(need_model) - len(groups)} 個、等其他請求 {len(waiting)} 個）")
+        if batches:
+            await _run_model_batches_async(chat_client, batches, mapping, prepared, timeout_sec, stream, debug)
+    finally:
+        _release_model_items(groups, owned, prepared)
+    waited = await _wait_model_items_async(waiting, _flight_wait_sec(timeout_sec))
+    _share_model_results(groups, waited, mapping, prepared, debug)
+
+
+def span_replacements(spans: List[Dict], prepared: Dict[int, str]) -> List[Tuple[int, int, str]]:
+    """prepared {span index: 替換值} → rewrite_spans 用的 [(start, end, value)]"""
+    return [(int(s["start"]), int(s["end"]), prepared[i]) for i, s in enumerate(spans) if i in prepared]
+
+
+def apply_replacements(text: str, spans: List[Dict], prepared: Dict[int, str], debug: bool) -> str:
+    # 一次改寫（見 span_rewriter）
+    replacements = span_replacements(spans, prepared)
+    if debug:
+        for start, end, value in replacements:
+            print(f"[Apply ] 位置({start},{end})：{text[start:end]!r} -> {value!r}")
+    new_text, _ = rewrite_spans(text, replacements)
 
     if debug:
         print("\n[Done ] 最終輸出：", new_text)
-    return new_text
\ No newline at end of file
+    return new_text
+
+
+def _debug_input(text: str, spans: List[Dict]):
+    print("\n[Step 0] 原始文字：", text)
+    print("[Step 0] 偵測到的 spans：")
+    for s in spans:
+        print("  -", s)
+
+
+# ----------- 主函式：替換（保留原介面，預設用 KuwaChatClient）-----------
+def replace_entities(
+    text: str,
+    spans: List[Dict],
+    chat_client=None,
+    mapping: Optional[MappingStore] = None,
+    batch_size: int = 30,
+    debug: bool = True,
+    stream: bool = False,
+    use_model: bool = True,
+) -> str:
+    """
+    stream=True 時用 chat_client.chat_stream_lines() 逐行接收，每收到一行就寫入對照表。
+    use_model=False 時不呼叫模型，需要模型的項目先用本地 Faker 暫時替換（不寫入對照表），
+    可立即得到完整的去識別化結果；之後再用 use_model=True 跑一次就是模型升級版。
+    """
+    # 注意不能寫 mapping or ...：空的對照表 len() 為 0，會被當成 False
+    if mapping is None:
+        mapping = open_mapping_store()
+    if use_model:
+        chat_client = chat_client or KuwaChatClient()  # ← 不傳就用 Kuwa
+
+    if debug:
+        _debug_input(text, spans)
+
+    # 2) 路由 + 快取
+    prepared, need_model = _route_spans(text, spans, mapping, debug)
+    if not use_model:
+        _local_preview(need_model, prepared, debug)
+        need_model = []
+
+    # 3) 模型批次（逐批送出；重複的、別的呼叫正在問的不再送）
+    groups, leaders, owned, waiting = _claim_model_items(need_model)
+    try:
+        for j in range(0, len(leaders), batch_size):
+            batch = leaders[j:j + batch_size]
+
+            user_prompt = build_user_prompt(batch)
+            if debug:
+                print("\n[Model] 發送批次：")
+                print(user_prompt)
+
+            if stream:
+                _stream_model_batch(chat_client, batch, mapping, prepared, 10, debug)
+                continue
+            out = _safe_chat(chat_client, SYSTEM_PROMPT, user_prompt, batch, timeout_sec=10)
+            _store_model_batch(out, batch, mapping, prepared, debug)
+    finally:
+        _release_model_items(groups, owned, prepared)
+    _share_model_results(groups, _wait_model_items(waiting, _flight_wait_sec(10)), mapping, prepared, debug)
+
+    # 4) 右→左套用
+    return apply_replacements(text, spans, prepared, debug)
+
+
+# ----------- 非同步版：同一份文件的模型批次同時送出 -----------
+async def _safe_chat_async(chat_client, system_prompt: str, user_prompt: str, batch, timeout_sec: float = 20) -> Optional[str]:
+    try:
+        out = await call_async(
+            chat_client.chat, system_prompt, user_prompt,
+            timeout_sec=timeout_sec, breaker=get_breaker(), retry=MODEL_RETRY,
+        )
+        return out if isinstance(out, str) else str(out)
+    except CircuitOpenError:
+        get_breaker().record_fallback(len(batch))
+        return None
+    except Exception as e:
+        print(f"[Warn ] 模型失敗或逾時: {e!r}")
+        get_breaker().record_fallback(len(batch))
+        return None
+
+
+async def replace_entities_async(
+    text: str,
+    spans: List[Dict],
+    chat_client=None,
+    mapping: Optional[MappingStore] = None,
+    batch_size: int = 30,
+    debug: bool = True,
+    timeout_sec: float = 10,
+    stream: bool = False,
+    use_model: bool = True,
+) -> str:
+    """
+    同 replace_entities，但所有模型批次用 asyncio.gather 同時送出，
+    整份文件只需約一次模型往返的時間（同時在途數量由 client 的 max_concurrency 限制）。
+    chat_client 需提供 async chat()，預設為 AsyncKuwaChatClient；
+    stream=True 時改用 chat_stream_lines()，每收到一行就寫入對照表；use_model 同 replace_entities。
+    """
+    if mapping is None:
+        mapping = open_mapping_store()
+    if chat_client is None and use_model:
+        from faker_models.kuwa_async_client import AsyncKuwaChatClient
+        chat_client = AsyncKuwaChatClient()
+
+    if debug:
+        _debug_input(text, spans)
+
+    prepared, need_model = _route_spans(text, spans, mapping, debug)
+
+    if not use_model:
+        _local_preview(need_model, prepared, debug)
+        need_model = []
+    if need_model:
+        await _resolve_model_items_async(chat_client, need_model, mapping, prepared, batch_size, timeout_sec, stream, debug)
+
+    return apply_replacements(text, spans, prepared, debug)
+
+
+async def resolve_replacements_async(
+    pairs,
+    chat_client=None,
+    mapping: Optional[MappingStore] = None,
+    batch_size: int = 30,
+    debug: bool = True,
+    timeout_sec: float = 10,
+    stream: bool = False,
+    use_model: bool = True,
+) -> Dict[Tuple[str, str], str]:
+    """
+    整份文件一次解析：pairs 為 [(e_type, raw), ...]（可重複），
+    先去重，再走同樣的 快取 → presidio → 模型 路由，模型部分以完整大小的批次同時送出。
+    回傳 {(e_type, raw): 替換值}，由呼叫端自行套用回文件。
+    """
+    if mapping is None:
+        mapping = open_mapping_store()
+    if chat_client is None and use_model:
+        from faker_models.kuwa_async_client import AsyncKuwaChatClient
+        chat_client = AsyncKuwaChatClient()
+
+    unique = list(dict.fromkeys((e_type, raw) for e_type, raw in pairs if raw))
+    spans = [{"entity_type": e_type, "start": 0, "end": 0, "raw_txt": raw} for e_type, raw in unique]
+    prepared, need_model = _route_spans("", spans, mapping, debug)
+
+    if not use_model:
+        _local_preview(need_model, prepared, debug)
+        need_model = []
+    if need_model:
+        if debug:
+            print(f"\n[Model] {len(unique)} 個不重複實體，{len(need_model)} 個交給模型")
+        await _resolve_model_items_async(chat_client, need_model, mapping, prepared, batch_size, timeout_sec, stream, debug)
+
+    return {pair: prepared[i] for i, pair in enumerate(unique) if i in prepared}
@@ -3,6 +3,9 @@ from presidio_analyzer import RecognizerResult
 from presidio_anonymizer.entities import OperatorConfig
 import random, string, re
 from faker import Faker
+from faker_models.span_rewriter import rewrite_spans
+from faker_models.entity_validators import keep_original_batch
+from faker_models import fake_pools
 
 anonymizer = AnonymizerEngine()
 fake = Faker()
@@ -18,64 +21,6 @@ def fake_ubn():
     # 8 位數統編
     return "".join(random.choices(string.digits, k=8))
 
-def is_likely_person_name(text: str) -> bool:
-    """
-    驗證文字是否真的像人名
-    """
-    text = text.strip().lower()
-    
-    # 明顯不是人名的關鍵字
-    non_person_keywords = [
-        'email', 'mail', 'address', 'phone', 'number', 'id', 'card',
-        'password', 'user', 'admin', 'account', 'login', 'register',
-        'submit', 'send', 'click', 'here', 'link', 'url', 'http',
-        'www', 'com', 'org', 'net', 'gov', 'edu',
-        'file', 'document', 'pdf', 'doc', 'txt',
-        'company', 'corporation', 'inc', 'ltd', 'llc',
-        'street', 'avenue', 'road', 'drive', 'lane',
-        'city', 'state', 'country', 'zip', 'postal',
-        'contact', 'information', 'details', 'form',
-        'name', 'first', 'last', 'full', 'given'  # 表單欄位名稱
-    ]
-    
-    # 檢查是否包含明顯不是人名的關鍵字
-    for keyword in non_person_keywords:
-        if keyword in text:
-            return False
-    
-    # 檢查是否包含數字（大部分人名不包含數字）
-    if any(char.isdigit() for char in text):
-        return False
-    
-    # 檢查是否包含特殊符號（除了空格、連字符、撇號、點）
-    allowed_chars = set('abcdefghijklmnopqrstuvwxyz -\'.')
-    if not all(char in allowed_chars for char in text):
-        return False
-    
-    # 檢查長度（太短或太長可能不是人名）
-    if len(text) < 2 or len(text) > 50:
-        return False
-    
-    # 檢查是否全部大寫（可能是縮寫或代碼）
-    if text.isupper() and len(text) > 5:
-        return False
-    
-    # 檢查是否為純粹的表單欄位名稱
-    form_field_patterns = [
-        r'^(first|last|full)\s*(name)?$',
-        r'^name\s*(field)?$',
-        r'^email\s*(address)?$',
-        r'^phone\s*(number)?$',
-        r'^contact\s*(info|information)?$'
-    ]
-    
-    for pattern in form_field_patterns:
-        if re.match(pattern, text):
-            return False
-    
-    return True
-    
-
 def replace_pii(text, analyzer_results):
     # 將 analyzer_results 轉換為 RecognizerResult 物件
     recognizer_results = [
@@ -88,14 +33,18 @@ def replace_pii(text, analyzer_results):
         for res in analyzer_results
     ]
 
-    # 按照 start 位置倒序排列，避免替換時位置偏移
+    # 保留原文 / 替換的判斷整批一次做（同一個原文只判斷一次）
+    keep_flags = dict(zip(map(id, recognizer_results), keep_original_batch(analyzer_results, text)))
+
+    # 按照 start 位置倒序排列（替換值最後由 rewrite_spans 一次接好，順序不影響位置）
     recognizer_results.sort(key=lambda x: x.start, reverse=True)
     
-    replaced_text = text
+    replacements = []
     
     for res in recognizer_results:
         et = res.entity_type
         detected_text = text[res.start:res.end]
+        keep = keep_flags[id(res)]
         
         # 為每個實體生成獨立的替換值
         if et == "EMAIL_ADDRESS":
@@ -118,65 +67,8 @@ def replace_pii(text, analyzer_results):
             new_value = fake.phone_number()
 
         elif et == "DATE_TIME":
-            # 檢查是否為相對時間表達，如果是則保留原文
-            detected_text_lower = detected_text.lower().strip()
-            
-            # 定義相對時間關鍵詞（更完整的列表）
-            relative_time_keywords = {
-                # 英文相對時間 - 基本
-                "today", "tomorrow", "yesterday", "now", "tonight", 
-                # 英文相對時間 - 時段
-                "this morning", "this afternoon", "this evening", "this noon",
-                "last night", "yesterday morning", "yesterday afternoon", "yesterday evening",
-                "tomorrow morning", "tomorrow afternoon", "tomorrow evening", "tomorrow night",
-                # 英文相對時間 - 週期
-                "this week", "this month", "this year", "this quarter", "this semester",
-                "next week", "next month", "next year", "next quarter", "next semester",
-                "last week", "last month", "last year", "last quarter", "last semester",
-                # 英文相對時間 - 模糊時間
-                "recently", "lately", "soon", "later", "earlier", "before", "after", 
-                "currently", "presently", "nowadays", "these days", "right now",
-                "just now", "a moment ago", "a while ago", "in a while", "shortly",
-                # 中文相對時間 - 基本
-                "今天", "明天", "昨天", "現在", "今晚", "今夜",
-                # 中文相對時間 - 時段  
-                "今早", "今天早上", "今天上午", "今天中午", "今天下午", "今天晚上",
-                "昨天早上", "昨天上午", "昨天中午", "昨天下午", "昨天晚上", "昨晚",
-                "明天早上", "明天上午", "明天中午", "明天下午", "明天晚上", "明晚",
-                # 中文相對時間 - 週期
-                "這週", "這個星期", "這個月", "這一個月", "今年", "這一年",
-                "下週", "下個星期", "下個月", "下一個月", "明年", "下一年",
-                "上週", "上個星期", "上個月", "上一個月", "去年", "上一年",
-                # 中文相對時間 - 模糊時間
-                "最近", "近來", "稍後", "等等", "等一下", "之前", "之後", "以前", "以後",
-                "目前", "現階段", "當前", "眼前", "剛才", "剛剛", "一會兒", "待會兒"
-            }
-            
-            # 檢查是否包含相對時間關鍵詞（精確匹配或模式匹配）
-            is_relative_time = False
-            
-            # 1. 直接關鍵詞匹配
-            is_relative_time = any(keyword in detected_text_lower for keyword in relative_time_keywords)
-            
-            # 2. 模式匹配 - 檢測相對時間模式
-            if not is_relative_time:
-                relative_patterns = [
-                    r'\b(in|within)\s+\d+\s+(days?|weeks?|months?|years?)\b',  # "in 3 days", "within 2 weeks"
-                    r'\b\d+\s+(days?|weeks?|months?|years?)\s+(ago|from now)\b',  # "3 days ago", "2 weeks from now"
-                    r'\bthis\s+(coming|past)\s+(week|month|year)\b',  # "this coming week", "this past month"
-                    r'\b(next|last)\s+\w+(day|week|end)\b',  # "next weekend", "last weekday"
-                    r'\b(early|late)\s+(this|next|last)\s+(week|month|year)\b',  # "early this week"
-                    r'\b幾天(前|後|內)\b',  # 中文："幾天前", "幾天後", "幾天內"
-                    r'\b\d+天(前|後|內)\b',  # 中文："3天前", "5天後", "一週內"
-                    r'\b(下|上)(周|月|年)(初|中|末)\b',  # 中文："下週初", "上月末"
-                ]
-                
-                for pattern in relative_patterns:
-                    if re.search(pattern, detected_text_lower):
-                        is_relative_time = True
-                        break
-            
-            if is_relative_time:
+            # 檢查是否為相對時間表達，如果是則保留原文（entity_validators 預先編譯、每個原文只判斷一次）
+            if keep:
                 print(f"Detected relative time expression: {detected_text}, keeping original text")
                 new_value = detected_text  # 保留原始文字
             else:
@@ -185,14 +77,14 @@ def replace_pii(text, analyzer_results):
                 print(f"Generated fake date for: {detected_text} -> {new_value}")
 
         elif et == "UK_NHS":
-            new_value = f"{random.randint(100, 999)} {random.randint(100, 999)} {random.randint(0, 9999):04d}"
+            new_value = fake_pools.take("UK_NHS")
 
         elif et == "CREDIT_CARD":
             new_value = fake.credit_card_number()
 
         elif et == "PERSON":
             # 驗證是否真的是人名
-            if is_likely_person_name(detected_text):
+            if not keep:
                 new_value = fake.name()
                 print(f"Valid person name detected: {detected_text} -> {new_value}")
             else:
@@ -213,16 +105,16 @@ def replace_pii(text, analyzer_results):
             new_value = fake.mac_address()
 
         # TW
-        # 新增：統一編號
+        # 新增：統一編號（數字型類別都從 fake_pools 的池子取，整批向量化產生）
         elif et == "UNIFIED_BUSINESS_NO":
-            new_value = fake_ubn()
+            new_value = fake_pools.take("UNIFIED_BUSINESS_NO")
 
         # 新增：台灣身分證
         elif et == "TW_ID_NUMBER":
-            new_value = fake_tw_id()
+            new_value = fake_pools.take("TW_ID_NUMBER")
         
         elif et == "TW_PHONE_NUMBER":
-            new_value = f"09{''.join([str(random.randint(0,9)) for _ in range(8)])}"
+            new_value = fake_pools.take("TW_PHONE_NUMBER")
 
         elif et == "TW_ID_NUMBER":
             new_value = f"{random.choice(string.ascii_uppercase)}{random.choice(['1','2'])}{''.join(str(random.randint(0,9)) for _ in range(8))}"
@@ -231,16 +123,16 @@ def replace_pii(text, analyzer_results):
             new_value = f"{''.join([str(random.randint(0,9)) for _ in range(8)])}"
 
         elif et == "TW_HEALTH_INSURANCE":
-            new_value = f"0000{''.join([str(random.randint(0,9)) for _ in range(6)])}"
+            new_value = fake_pools.take("TW_HEALTH_INSURANCE")
 
         elif et == "TW_PASSPORT_NUMBER":
-            new_value = f"3{''.join([str(random.randint(0,9)) for _ in range(7)])}"
+            new_value = fake_pools.take("TW_PASSPORT_NUMBER")
             
         else:
             new_value = detected_text  # 保留原始文字
         
-        # 直接替換文字
-        replaced_text = replaced_text[:res.start] + new_value + replaced_text[res.end:]
+        # 先記下替換值，最後一次改寫
+        replacements.append((res.start, res.end, new_value))
         
         print(f"--- 處理實體類別: {et}")
         print(f"    原始文字: {detected_text}")
@@ -248,4 +140,5 @@ def replace_pii(text, analyzer_results):
         # if it's the last entity, print end marker
         if res == recognizer_results[-1]:
             print(f"*** End ***\n")
+    replaced_text, _ = rewrite_spans(text, replacements)
     return replaced_text
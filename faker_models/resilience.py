@@ -0,0 +1,215 @@
+# faker_models/resilience.py
+"""
+模型呼叫的容錯：真正的逾時、抖動退避重試、斷路器。
+
+- 逾時：async 呼叫用 asyncio.wait_for，逾時即取消請求；同步呼叫放到背景 thread，
+  超過期限就不再等（Python 無法強制中止同步呼叫，該 thread 會自己結束）。
+- 重試：指數退避加 full jitter，避免多個 worker 同時重打。
+- 斷路器：連續失敗達門檻就打開，冷卻期間所有批次直接走本地 Faker，
+  不必每批都等到逾時；冷卻結束放一個試探請求（half-open），成功才關閉。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """斷路器打開中，這次呼叫直接略過"""
+
+
+class RetryPolicy:
+    """attempts 為總嘗試次數（含第一次）；第 n 次重試前等待 uniform(0, min(max_delay, base_delay * 2**n))"""
+
+    def __init__(self, attempts: int = 2, base_delay: float = 0.5, max_delay: float = 4.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+
+class CircuitBreaker:
+    """
+    用法：
+        if not breaker.allow(): 走本地替換
+        ... 呼叫成功 breaker.record_success()，失敗 breaker.record_failure()
+    thread-safe；metrics() 回傳狀態與各項計數。
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown_sec: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "short_circuited": 0,
+            "opened": 0,
+            "fallback_batches": 0,
+            "fallback_items": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_sec:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        """可以送請求就回傳 True；half-open 時只放行一個試探請求"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            # 試探請求被取消而沒回報結果時，過了冷卻時間再放行一個
+            if state == HALF_OPEN and (not self._probing or time.monotonic() - self._probe_at >= self.cooldown_sec):
+                self._probing = True
+                self._probe_at = time.monotonic()
+                return True
+            self.counters["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                print("[Breaker] 模型恢復，斷路器關閉")
+            self._state = CLOSED
+
+    def record_failure(self, timeout: bool = False):
+        with self._lock:
+            self.counters["failures"] += 1
+            if timeout:
+                self.counters["timeouts"] += 1
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.counters["opened"] += 1
+                print(f"[Breaker] 連續失敗 {self._failures} 次，{self.cooldown_sec:g}s 內改走本地替換")
+
+    def record_fallback(self, items: int):
+        with self._lock:
+            self.counters["fallback_batches"] += 1
+            self.counters["fallback_items"] += items
+
+    def record_attempt(self, retry: bool = False):
+        """每送出一次請求呼叫一次；retry=True 表示是重試"""
+        with self._lock:
+            self.counters["calls"] += 1
+            if retry:
+                self.counters["retries"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                **self.counters,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+
+def run_in_thread(fn, *args) -> Future:
+    # 用 daemon thread 而不是 ThreadPoolExecutor：卡住的呼叫不會擋住程式結束
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name="model-call", daemon=True).start()
+    return future
+
+
+def call_sync(fn, *args, timeout_sec: float, breaker: CircuitBreaker, retry: RetryPolicy):
+    """同步版：每次嘗試最多等 timeout_sec 秒；斷路器打開或全部失敗時丟出例外"""
+    last_error = None
+    for attempt in range(retry.attempts):
+        if not breaker.allow():
+            raise CircuitOpenError("circuit open") from last_error
+        breaker.record_attempt(retry=attempt > 0)
+        future = run_in_thread(fn, *args)
+        try:
+            out = future.result(timeout=timeout_sec)
+        except FutureTimeoutError:
+            last_error = TimeoutError(f"model timeout after {timeout_sec}s")
+            breaker.record_failure(timeout=True)
+        except Exception as e:
+            last_error = e
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            return out
+        if attempt + 1 < retry.attempts:
+            time.sleep(retry.delay(attempt))
+    raise last_error
+
+
+async def call_async(coro_fn, *args, timeout_sec: float, breaker: CircuitBreaker, retry: RetryPolicy):
+    """async 版：逾時會取消進行中的請求"""
+    last_error = None
+    for attempt in range(retry.attempts):
+        if not breaker.allow():
+            raise CircuitOpenError("circuit open") from last_error
+        breaker.record_attempt(retry=attempt > 0)
+        try:
+            out = await asyncio.wait_for(coro_fn(*args), timeout_sec)
+        except asyncio.TimeoutError:
+            last_error = TimeoutError(f"model timeout after {timeout_sec}s")
+            breaker.record_failure(timeout=True)
+        except Exception as e:
+            last_error = e
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            return out
+        if attempt + 1 < retry.attempts:
+            await asyncio.sleep(retry.delay(attempt))
+    raise last_error
+
+
+_breaker = CircuitBreaker()
+
+
+def get_breaker() -> CircuitBreaker:
+    """process 共用的模型斷路器"""
+    return _breaker
+
+
+def get_llm_metrics() -> dict:
+    return _breaker.metrics()
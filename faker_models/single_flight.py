@@ -0,0 +1,63 @@
+# faker_models/single_flight.py
+"""
+同一個 key 同時只送一次：多個呼叫同時要同一個還沒有對照的 (類型, 原文) 時，
+只有第一個（owner）真的去問模型，其他呼叫拿到同一個 Future 等它的結果。
+
+用 concurrent.futures.Future，不綁定 event loop：不同 thread、不同 loop 的呼叫都能互等
+（async 端用 asyncio.wrap_future）。只在同一個 process 內合併；跨 process 的一致性
+仍由 SqliteMappingStore 的「先寫先贏」保證。
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+
+class SingleFlight:
+    """
+    用法：
+        owned, waiting = flight.acquire(keys)
+        try:
+            results = 算出 owned 的值
+        finally:
+            flight.release(owned, results)   # 一定要 release，否則等待者要等到逾時
+        其他 key 的值：waiting[key].result(timeout)
+    owner 沒給出結果的 key，等待者拿到 None，需自行處理（例如改走本地替換）。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.counters = {"owned": 0, "coalesced": 0}
+
+    def acquire(self, keys: Iterable[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        """回傳 (owned, waiting)：owned 由呼叫端負責算並 release；waiting 是別人正在算的 key → Future"""
+        owned, waiting = [], {}
+        with self._lock:
+            # 同一次呼叫內重複的 key 只算一次，否則會等到自己身上
+            for key in dict.fromkeys(keys):
+                fut = self._calls.get(key)
+                if fut is None:
+                    self._calls[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = fut
+            self.counters["owned"] += len(owned)
+            self.counters["coalesced"] += len(waiting)
+        return owned, waiting
+
+    def release(self, owned: Iterable[Hashable], results: Dict[Hashable, object]):
+        """結束 owned 的 key，把結果交給等待者（沒有結果的給 None）"""
+        with self._lock:
+            futures = [(key, self._calls.pop(key, None)) for key in owned]
+        for key, fut in futures:
+            if fut is not None and not fut.done():
+                fut.set_result(results.get(key))
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), **self.counters}
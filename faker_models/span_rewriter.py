@@ -0,0 +1,110 @@
+# faker_models/span_rewriter.py
+"""
+共用的 span 改寫：一次把所有替換值接成新字串，並回傳原文 ↔ 新文字的位置對照。
+
+原本各替換器對每個實體做 text[:start] + value + text[end:]，
+每次都複製整個字串，成本是 O(文字長度 × 實體數)；這裡依 start 排序後
+只掃一次、最後一次 join，成本是 O(文字長度 + 實體數 log 實體數)。
+"""
+
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+
+class OffsetMap:
+    """
+    原文與改寫後文字的位置對照。
+    segments 為依原文位置排序的 (old_start, old_end, new_start, new_end)，只記被替換的區段，
+    區段外的文字長度不變，只需加上前面累積的位移。
+    """
+
+    def __init__(self, segments: List[Tuple[int, int, int, int]]):
+        self.segments = segments
+        self._old_starts = [s[0] for s in segments]
+        self._new_starts = [s[2] for s in segments]
+
+    def to_new(self, pos: int) -> int:
+        """原文位置 → 新文字位置；落在被替換區段內部時對到該區段的結尾"""
+        k = bisect_right(self._old_starts, pos) - 1
+        if k < 0:
+            return pos
+        old_start, old_end, new_start, new_end = self.segments[k]
+        if pos == old_start:
+            return new_start
+        if pos < old_end:
+            return new_end
+        return pos - old_end + new_end
+
+    def to_old(self, pos: int) -> int:
+        """新文字位置 → 原文位置；落在替換值內部時對到原區段的結尾"""
+        k = bisect_right(self._new_starts, pos) - 1
+        if k < 0:
+            return pos
+        old_start, old_end, new_start, new_end = self.segments[k]
+        if pos == new_start:
+            return old_start
+        if pos < new_end:
+            return old_end
+        return pos - new_end + old_end
+
+    def __len__(self):
+        return len(self.segments)
+
+
+def rewrite_spans(text: str, replacements: Iterable[Tuple[int, int, str]]) -> Tuple[str, OffsetMap]:
+    """
+    replacements: [(start, end, value), ...]，順序不拘。
+    重疊的 span 以先開始（同起點取較長）的為準，其餘略過。
+    回傳 (新文字, OffsetMap)。
+    """
+    ordered = sorted(replacements, key=lambda r: (r[0], -r[1]))
+    parts = []
+    segments = []
+    cursor = 0      # 原文已處理到的位置
+    new_pos = 0     # 新文字目前長度
+    for start, end, value in ordered:
+        if start < cursor:
+            continue  # 與前一個 span 重疊
+        parts.append(text[cursor:start])
+        new_pos += start - cursor
+        parts.append(value)
+        segments.append((start, end, new_pos, new_pos + len(value)))
+        new_pos += len(value)
+        cursor = end
+    parts.append(text[cursor:])
+    return "".join(parts), OffsetMap(segments)
+
+
+def _rewrite_naive(text: str, replacements) -> str:
+    """舊作法（右→左逐一切接），只給 benchmark 對照用"""
+    for start, end, value in sorted(replacements, key=lambda r: r[0], reverse=True):
+        text = text[:start] + value + text[end:]
+    return text
+
+
+if __name__ == "__main__":
+    # benchmark：1 MB 文字、10k 個 span，逐一切接 vs 一次 join
+    import random
+    import time
+
+    random.seed(0)
+    size, count = 1_000_000, 10_000
+    text = "".join(random.choice("abcdefghij klmnopqrst\n") for _ in range(size))
+    starts = sorted(random.sample(range(0, size - 20, 20), count))
+    replacements = [(s, s + random.randint(3, 15), f"<FAKE_{i}>") for i, s in enumerate(starts)]
+
+    t0 = time.perf_counter()
+    old = _rewrite_naive(text, replacements)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new, offsets = rewrite_spans(text, replacements)
+    t_new = time.perf_counter() - t0
+
+    assert old == new
+    for start, end, value in replacements[:100]:
+        assert new[offsets.to_new(start):offsets.to_new(end)] == value
+        assert offsets.to_old(offsets.to_new(start)) == start
+    print(f"文字長度：{len(text):,} 字元，span 數：{count:,}")
+    print(f"[改寫] 逐一切接：{t_old:.3f}s")
+    print(f"[改寫] 一次 join：{t_new:.3f}s，{t_old / t_new:.1f}x")
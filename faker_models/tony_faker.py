@@ -3,6 +3,7 @@ import torch
 import random
 import string
 from faker import Faker
+from faker_models import fake_pools
 
 class SimpleGPT2TagGenerator:
     def generate_with_faker_by_tag_list(self, tag_list):
@@ -25,18 +26,18 @@ class SimpleGPT2TagGenerator:
             # US
             "US_BANK_NUMBER": lambda: fake.bban(),
             "US_DRIVER_LICENSE": lambda: fake.license_plate(),
-            "US_ITIN": lambda: "".join([str(random.randint(0,9)) for _ in range(9)]),  # US ITIN 格式，9 bits羅馬數字
+            "US_ITIN": lambda: fake_pools.take("US_ITIN"),  # US ITIN 格式，9 bits羅馬數字
             "US_PASSPORT": lambda: fake.passport_number(), # 新版 one alphabet + eight numbers
             "US_SSN": lambda: fake.ssn(),
             # UK
-            "UK_NHS": lambda: f"{''.join([str(random.randint(0,9)) for _ in range(3)])} {''.join([str(random.randint(0,9)) for _ in range(3)])} {''.join([str(random.randint(0,9)) for _ in range(4)])}",  # 9bits, 3 3 4 格式
+            "UK_NHS": lambda: fake_pools.take("UK_NHS"),  # 9bits, 3 3 4 格式
             "UK_NINO": lambda: f"{''.join(random.choice(string.ascii_uppercase) for _ in range(2))} {''.join([str(random.randint(0,9)) for _ in range(6)])} {str(random.choice(string.ascii_uppercase))}",  # UK NINO 格式
-            # TW
-            "TW_HEALTH_INSURANCE": lambda: f"0000{''.join([str(random.randint(0,9)) for _ in range(6)])}",  # 10碼
-            "TW_ID_NUMBER": lambda: f"{random.choice(string.ascii_uppercase)}{random.choice(['1','2'])}{''.join(str(random.randint(0,9)) for _ in range(8))}",
-            "UNIFIED_BUSINESS_NO": lambda: f"{''.join([str(random.randint(0,9)) for _ in range(8)])}",  # 8碼
-            "TW_PHONE_NUMBER": lambda: f"09{''.join([str(random.randint(0,9)) for _ in range(8)])}",  # 台灣手機
-            "TW_PASSPORT_NUMBER": lambda: f"3{''.join([str(random.randint(0,9)) for _ in range(7)])}",  # 台灣護照號碼，8碼
+            # TW（數字型從 fake_pools 的池子取，整批向量化產生）
+            "TW_HEALTH_INSURANCE": lambda: fake_pools.take("TW_HEALTH_INSURANCE"),  # 10碼
+            "TW_ID_NUMBER": lambda: fake_pools.take("TW_ID_NUMBER"),
+            "UNIFIED_BUSINESS_NO": lambda: fake_pools.take("UNIFIED_BUSINESS_NO"),  # 8碼
+            "TW_PHONE_NUMBER": lambda: fake_pools.take("TW_PHONE_NUMBER"),  # 台灣手機
+            "TW_PASSPORT_NUMBER": lambda: fake_pools.take("TW_PASSPORT_NUMBER"),  # 台灣護照號碼，8碼
             # 自訂
             "MAC_ADDRESS": lambda: fake.mac_address(),
             # 忘記規則
@@ -69,7 +70,8 @@ class SimpleGPT2TagGenerator:
         # if self.tokenizer.pad_token is None:
         #     self.tokenizer.pad_token = self.tokenizer.eos_token
         
-        self.fake = Faker(['zh_TW', 'en_US'])
+        # 共用 fake_pools 的 Faker 實例，不必每次重建
+        self.fake = fake_pools.get_faker(('zh_TW', 'en_US'))
         print("模型載入完成！")
     
     def generate_with_prompt_engineering(self, tag_template):
@@ -109,11 +111,17 @@ class SimpleGPT2TagGenerator:
         return results
     
     
+_generator = None
+
+
 def test_all_methods(pii_list):
+    global _generator
     print("=== GPT-2 預訓練模型標籤資料生成測試 ===\n")
     
-    # 初始化生成器
-    generator = SimpleGPT2TagGenerator()
+    # 初始化生成器（只建一次，之後重複使用）
+    if _generator is None:
+        _generator = SimpleGPT2TagGenerator()
+    generator = _generator
     
     # 測試 faker 產生 PII 標籤資料
     tag_list = [
@@ -2,10 +2,74 @@
 
 import os
 from docx import Document
-from pii_models.presidio_detector import detect_pii
+from pii_models.presidio_detector import detect_pii_batch
 from faker_models.presidio_replacer_plus import replace_pii
 # from faker_models.ai_replacer import replace_entities
-from faker_models.muiltAI_pii_replace import replace_entities, MappingStore, KuwaChatClient
+from faker_models.muiltAI_pii_replace import (
+    resolve_replacements_async,
+    span_replacements,
+)
+from file_handlers.pipeline_context import PipelineContext
+from faker_models.span_rewriter import rewrite_spans
+
+
+def _iter_block_paragraphs(container):
+    """container（文件本文 / cell / 頁首頁尾）內的段落，含表格（及巢狀表格）裡的段落"""
+    yield from container.paragraphs
+    for table in container.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                yield from _iter_block_paragraphs(cell)
+
+
+def collect_paragraphs(doc):
+    """
+    收集文件中所有要處理的段落：本文、表格、各 section 的頁首/頁尾。
+    合併儲存格在 row.cells 會重複出現，依底層 XML 元素（para._p）去重。
+    """
+    containers = [doc]
+    for section in doc.sections:
+        for part in (
+            section.header, section.first_page_header, section.even_page_header,
+            section.footer, section.first_page_footer, section.even_page_footer,
+        ):
+            # 沿用前一節的頁首頁尾沒有自己的內容（讀取它反而會新增一份定義）
+            if not part.is_linked_to_previous:
+                containers.append(part)
+
+    seen = set()
+    paragraphs = []
+    for container in containers:
+        for para in _iter_block_paragraphs(container):
+            if para._p in seen:
+                continue
+            seen.add(para._p)
+            paragraphs.append(para)
+    return paragraphs
+
+
+def rewrite_runs(para, old_text: str, new_text: str, offsets) -> None:
+    """
+    依 OffsetMap 把新文字分回原本的各個 run，保留每個 run 的樣式；
+    替換值歸給實體開頭所在的 run。
+    段落文字和 runs 對不上時（例如含超連結），退回整段放進第一個 run。
+    """
+    runs = para.runs
+    if not runs:
+        para.add_run(new_text)
+        return
+    if "".join(run.text for run in runs) != old_text:
+        for run in runs:
+            run.text = ""
+        runs[0].text = new_text
+        return
+
+    pos = 0
+    for run in runs:
+        end = pos + len(run.text)
+        run.text = new_text[offsets.to_new(pos):offsets.to_new(end)]
+        pos = end
+
 
 class DocxHandler:
     """
@@ -13,90 +77,64 @@ class DocxHandler:
     保留所有段落格式、run 樣式與表格結構。
     """
     # 新增：初始化 LlamaChatClient 和 MappingStore
-    def __init__(self):                                   
-        self.client = KuwaChatClient()
-        self.mapping = MappingStore()
+    def __init__(self, context=None):
+        # client / mapping 由 PipelineContext 提供（沒給就自己建一個）；client 要用模型時才建立
+        self.context = context if context is not None else PipelineContext()
+        self.mapping = self.context.mapping  # 多個 worker 共用同一份對照表
 
-    def deidentify(self, input_path: str, output_path: str, selected_types: list[str] = None) -> str:
+    def deidentify(self, input_path: str, output_path: str, selected_types: list[str] = None, detect_mode: str = "full",
+                   use_model: bool = True) -> str:
         """
         1. 讀取 input_path 的 Word 文件
-        2. 針對每個 run.text 呼叫 detect_pii() + replace_pii()
-        3. 處理表格內 cell
-        4. 存成 output_path，並回傳它
+        2. 收集本文、表格、頁首/頁尾的所有段落，用 detect_pii_batch() 一次偵測
+        3. 整份文件的實體依 (類型, 原文) 去重後一次解析（模型以完整批次同時送出）
+        4. 把替換值套回各段落，存成 output_path，並回傳它
+        detect_mode="regex" 只用 pattern 實體快速偵測（不跑 spaCy NER）
+        use_model=False 不等模型，全部先用本地 Faker 替換（即時預覽用）
         """
         if not os.path.exists(input_path):
             raise FileNotFoundError(f"找不到輸入檔：{input_path}")
 
         doc = Document(input_path)
-        
-        # 處理段落中的 runs
-        for para in doc.paragraphs:
-            # 合併整個段落的文字
-            full_text = para.text
-            if not full_text.strip():
+
+        # Phase 1：收集所有段落，一次批次偵測
+        paragraphs = collect_paragraphs(doc)
+        texts = [para.text for para in paragraphs]
+        all_entities = detect_pii_batch(
+            texts, language="auto", score_threshold=0.6, mode=detect_mode, selected_types=selected_types,
+        )
+
+        # Phase 2：整份文件的實體去重後一次解析
+        pairs = [(e["entity_type"], e["raw_txt"]) for entities in all_entities for e in entities]
+        chat_client = self.context.model_client(use_model)
+        replacements = self.context.run(resolve_replacements_async(
+            pairs,
+            chat_client=chat_client,
+            mapping=self.mapping,        # ★ 同一份 mapping，保持一致性
+            # batch_size=30,             # 可調；大量文件時 20~50 都可
+            use_model=use_model,
+        ), use_model)
+        print(f"整份文件 {len(pairs)} 個實體，{len(replacements)} 個不重複替換值")
+
+        # Phase 3：套回各段落
+        for para, full_text, entities in zip(paragraphs, texts, all_entities):
+            if not full_text.strip() or not entities:
                 continue
-            # 對完整段落進行實體偵測
-            entities = detect_pii(full_text, language="en", score_threshold=0.6)
             print(f"處理段落：'{full_text}'", "\n")
-            
-            if entities:
-                # 生成替換後的完整文字
-                # new_full_text = replace_pii(full_text, entities)
-                new_full_text = replace_entities(full_text, entities)
-                new_full_text = replace_entities(                   # ★ (新)
-                    full_text,
-                    entities,
-                    chat_client=self.client,
-                    mapping=self.mapping,        # ★ 同一份 mapping，保持一致性
-                    # batch_size=30,             # 可調；大量文件時 20~50 都可
-                )
-                print("替換後內容：", new_full_text)
-
-                
-                if new_full_text != full_text:
-                    # 清空所有 runs 並重新設置文字
-                    for run in para.runs:
-                        run.text = ""
-                    
-                    # 將新文字設置到第一個 run（如果存在）
-                    if para.runs:
-                        para.runs[0].text = new_full_text
-                    else:
-                        # 如果沒有 runs，創建一個新的
-                        para.add_run(new_full_text)
-
-        # 處理表格
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        # 合併整個段落的文字
-                        full_text = para.text
-                        if not full_text.strip():
-                            continue
-                        # 對完整段落進行實體偵測
-                        entities = detect_pii(full_text, language="en", score_threshold=0.6)
-                        if entities:
-                            # 生成替換後的完整文字
-                            # new_full_text = replace_pii(full_text, entities)
-                            new_full_text = replace_entities(full_text, entities)
-                            new_full_text = replace_entities(                          # ★ (新)
-                                full_text,
-                                entities,
-                                chat_client=self.client,
-                                mapping=self.mapping,   # ★ 同一份映射
-                            )
-                            
-                            if new_full_text != full_text:
-                                # 清空所有 runs 並重新設置文字
-                                for run in para.runs:
-                                    run.text = ""
-                                
-                                # 將新文字設置到第一個 run
-                                if para.runs:
-                                    para.runs[0].text = new_full_text
-                                else:
-                                    para.add_run(new_full_text)
+
+            # 生成替換後的完整文字
+            # new_full_text = replace_pii(full_text, entities)
+            prepared = {
+                i: replacements[(e["entity_type"], e["raw_txt"])]
+                for i, e in enumerate(entities)
+                if (e["entity_type"], e["raw_txt"]) in replacements
+            }
+            new_full_text, offsets = rewrite_spans(full_text, span_replacements(entities, prepared))
+            print("替換後內容：", new_full_text)
+
+            if new_full_text != full_text:
+                # 依位置對照把新文字分回各個 run（保留粗體、字型等 run 樣式）
+                rewrite_runs(para, full_text, new_full_text, offsets)
 
         # 儲存結果
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
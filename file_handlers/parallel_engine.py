@@ -0,0 +1,218 @@
+# file_handlers/parallel_engine.py
+"""
+多檔案平行去識別化：ProcessPoolExecutor + 預先載入好 analyzer 的 worker。
+
+- 非 Windows 用 forkserver，並以 worker_preload 作為 preload：spaCy 模型只在
+  forkserver 載入一次，worker 以 copy-on-write 共用；Windows 只能用 spawn，
+  由 initializer 在每個 worker 各自載入。
+- 整個檔案分派給 worker；很大的文字檔則在主程序依行切段，每段經 shared memory
+  交給 worker（不經 pickle），worker 把結果寫到暫存檔，最後依序接起來。
+- worker 處理 max_tasks_per_child 個任務後會被回收重開，限制記憶體成長。
+"""
+
+import io
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from file_handlers.txt_handler import detect_encoding
+
+PRELOAD_MODULE = "file_handlers.worker_preload"
+DEFAULT_MAX_TASKS_PER_CHILD = 50
+# 文字檔超過這個大小（bytes）就切段平行處理，每段約 TEXT_CHUNK_CHARS 字元
+LARGE_TEXT_BYTES = 16 * 1024 * 1024
+TEXT_CHUNK_CHARS = 4_000_000
+
+# worker 內的 handler（由 initializer 建立）
+_handlers = None
+# initializer 失敗的原因。initializer 丟例外的話整個 pool 變成 BrokenProcessPool，
+# 看不到真正的錯誤、重建後又再壞一次；所以記下來，由每個任務回報
+_init_error = None
+
+
+def _mp_context():
+    if sys.platform != "win32" and "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload([PRELOAD_MODULE])
+        return ctx
+    return mp.get_context("spawn")
+
+
+def _init_worker():
+    global _handlers, _init_error
+    try:
+        # forkserver 已經 import（並載入模型）過的話，這裡不會重複載入
+        from file_handlers import worker_preload
+        _handlers = worker_preload.create_handlers()
+    except Exception as e:
+        _init_error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+
+
+def _get_handler(ftype):
+    if _init_error is not None:
+        raise RuntimeError(f"worker 初始化失敗：{_init_error}")
+    return _handlers[ftype]
+
+
+def _run_file(ftype, src, out_path, selected_types, detect_mode, use_model=True):
+    return _get_handler(ftype).deidentify(src, out_path, selected_types, detect_mode=detect_mode, use_model=use_model)
+
+
+def _run_text_chunk(shm_name, size, part_path, selected_types, detect_mode, use_model=True):
+    handler = _get_handler("text")
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        text = bytes(shm.buf[:size]).decode("utf-8")
+    finally:
+        shm.close()
+    with open(part_path, "w", encoding="utf-8", newline="") as dst:
+        handler.deidentify_stream(io.StringIO(text), dst, selected_types, detect_mode, use_model)
+    return part_path
+
+
+def _iter_line_chunks(src, chunk_chars):
+    """依行切段，每段約 chunk_chars 字元；只在換行處切（單行超長時該段會比較大）"""
+    pieces, size = [], 0
+    while True:
+        piece = src.readline(chunk_chars)
+        if not piece:
+            break
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_chars and piece != piece.rstrip("\r\n"):
+            yield "".join(pieces)
+            pieces, size = [], 0
+    if pieces:
+        yield "".join(pieces)
+
+
+class ParallelEngine:
+    """
+    用法：
+        engine = ParallelEngine()
+        results = engine.process_files([(ftype, src, out_path), ...], selected_types)
+        # results[i] 是輸出路徑，失敗則是該檔案的 Exception
+    worker 第一次用到時才啟動，之後重複使用，直到 shutdown()。
+    """
+
+    def __init__(self, max_workers: int = None, max_tasks_per_child: int = DEFAULT_MAX_TASKS_PER_CHILD):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            kwargs = dict(max_workers=self.max_workers, mp_context=_mp_context(), initializer=_init_worker)
+            try:
+                self._executor = ProcessPoolExecutor(max_tasks_per_child=self.max_tasks_per_child, **kwargs)
+            except TypeError:
+                # Python < 3.11 沒有 max_tasks_per_child
+                self._executor = ProcessPoolExecutor(**kwargs)
+            print(f"[Engine] 啟動 {self.max_workers} 個 worker（{kwargs['mp_context'].get_start_method()}）")
+        return self._executor
+
+    def process_files(self, jobs, selected_types=None, detect_mode: str = "full", use_model: bool = True):
+        """
+        jobs: [(ftype, src, out_path), ...]，回傳與 jobs 同順序的輸出路徑或 Exception
+        use_model=False 時不呼叫模型，全部用本地 Faker 替換（即時預覽）
+        """
+        executor = self._get_executor()
+        results = [None] * len(jobs)
+        futures = {}
+        large = []
+        for i, (ftype, src, out_path) in enumerate(jobs):
+            if not os.path.exists(src):
+                results[i] = FileNotFoundError(f"找不到輸入檔：{src}")
+                continue
+            if ftype == "text" and os.path.getsize(src) > LARGE_TEXT_BYTES:
+                large.append(i)
+                continue
+            futures[executor.submit(_run_file, ftype, src, out_path, selected_types, detect_mode, use_model)] = i
+
+        # 大文字檔在主程序切段送進同一個 pool，與其他檔案同時處理
+        for i in large:
+            _, src, out_path = jobs[i]
+            try:
+                results[i] = self._process_large_text(src, out_path, selected_types, detect_mode, use_model)
+            except Exception as e:
+                results[i] = e
+
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                results[i] = e
+
+        # worker 異常結束（或 initializer 失敗）後 pool 不能再用，下次重建
+        if any(isinstance(r, BrokenProcessPool) for r in results):
+            print("[Engine] worker 異常結束，下次使用時重建 process pool")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        return results
+
+    def _process_large_text(self, src, out_path, selected_types, detect_mode, use_model=True):
+        executor = self._get_executor()
+        encoding = detect_encoding(src)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        parts = []
+        pending = deque()  # (future, shm)；同時最多 2 倍 worker 數的段落在記憶體中
+
+        def finish(fut, shm):
+            try:
+                fut.result()
+            finally:
+                shm.close()
+                shm.unlink()
+
+        try:
+            with open(src, "r", encoding=encoding, errors="replace", newline="") as f:
+                for n, chunk in enumerate(_iter_line_chunks(f, TEXT_CHUNK_CHARS)):
+                    data = chunk.encode("utf-8")
+                    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+                    shm.buf[:len(data)] = data
+                    part_path = f"{out_path}.part{n}"
+                    parts.append(part_path)
+                    pending.append((executor.submit(
+                        _run_text_chunk, shm.name, len(data), part_path, selected_types, detect_mode, use_model
+                    ), shm))
+                    while len(pending) >= self.max_workers * 2:
+                        finish(*pending.popleft())
+            while pending:
+                finish(*pending.popleft())
+
+            with open(out_path, "wb") as dst:
+                for part_path in parts:
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, dst)
+        finally:
+            # 出錯時也要釋放還在排隊的 shared memory
+            while pending:
+                fut, shm = pending.popleft()
+                fut.cancel()
+                shm.close()
+                shm.unlink()
+            for part_path in parts:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        print(f"[Engine] 大文字檔切成 {len(parts)} 段平行處理：{os.path.basename(src)}")
+        return out_path
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
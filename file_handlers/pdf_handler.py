@@ -1,7 +1,9 @@
 import os
 import fitz  # PyMuPDF
-from pii_models.presidio_detector import detect_pii
-from faker_models.tony_faker import test_all_methods, keep_highest_score_per_raw_txt
+from pii_models.presidio_detector import detect_pii_batch
+from faker_models.tony_faker import test_all_methods
+from faker_models.span_rewriter import rewrite_spans
+from faker_models.keyed_pseudonym import get_pseudonymizer
 
 
 class PdfHandler :
@@ -10,12 +12,16 @@ class PdfHandler :
     每個實體包含：頁碼、實體類型、起訖位置、匹配文字。
     """
 
+    def __init__(self, context=None):
+        self.context = context
 
-    def deidentify(self, input_path: str, output_path: str, language: str = "auto") -> str:
+    def deidentify(self, input_path: str, output_path: str, selected_types: list[str] = None, language: str = "auto", detect_mode: str = "full",
+                   use_model: bool = True) -> str:
         """
         1. 讀取 input_path 的 PDF 檔案
         2. 偵測 PII 並遮蔽
         3. 儲存處理後的 PDF 到 output_path
+        PDF 一律用本地 Faker 替換，use_model 只是為了和其他 handler 介面一致
         """
         if not os.path.exists(input_path):
             raise FileNotFoundError(f"找不到輸入檔：{input_path}")
@@ -23,63 +29,85 @@ class PdfHandler :
         doc = fitz.open(input_path)
         new_doc = fitz.open()  # 新 PDF
 
+        # 先收集所有頁面的 span 文字，整份文件一次批次偵測
+        span_jobs = []
         for page in doc:
             page_dict = page.get_text("dict")
             new_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
             for block in page_dict["blocks"]:
                 for line in block.get("lines", []):
                     for span in line.get("spans", []):
-                        print("處理 span：", span)
-                        text = span["text"]
-                        entities = detect_pii(text, language="en", score_threshold=0.6)
-                        print("字串：", text)
-                        # print("偵測到的實體：", entities[0].entity_type)
-                        # print("偵測到的 PII：", text[entities[0].start:entities[0].end])
-                        
-                        # 如果沒有偵測到 PII，則直接使用原文字
-                        if not entities:
-                            masked_text = text
-                        else:
-                            faker_results = test_all_methods(entities)
-                            best_results = keep_highest_score_per_raw_txt(faker_results)
-                            # 建立 raw_txt -> fake_value 的 mapping
-                            fake_map = {item["raw_txt"]: item["fake_value"] for item in best_results}
-                            # 依 entities 位置替換
-                            masked_text = text
-                            offset = 0
-        
-                            for ent in entities:
-                                start, end = ent["start"] + offset, ent["end"] + offset
-                                raw_txt = ent["raw_txt"]
-                                entity_type = ent["entity_type"]
-                                
-                                # 如果是 ORGANIZATION，直接保留原文字
-                                if entity_type == "ORGANIZATION":
-                                    fake_value = raw_txt
-                                else:
-                                    fake_value = fake_map.get(raw_txt, "*" * (end - start))
-                                    # 確保 fake_value 與 raw_txt 長度一致
-                                    fake_value = fake_value[:len(raw_txt)].ljust(len(raw_txt))
+                        span_jobs.append((new_page, span))
+        all_entities = detect_pii_batch(
+            [span["text"] for _, span in span_jobs], language=language, score_threshold=0.6,
+            mode=detect_mode, selected_types=selected_types,
+        )
 
-                                # 替換並調整 offset
-                                masked_text = masked_text[:start] + fake_value + masked_text[end:]
-                                offset += len(fake_value) - (end - start)
-                            
-                        # 用原本的字型、大小、座標插入遮蔽後文字
-                        font_path = "/Users/lucasauriant/Downloads/Noto_Sans_TC/NotoSansTC-VariableFont_wght.ttf"
-                        new_page.insert_text(
-                            (span["bbox"][0], span["bbox"][1]),
-                            masked_text,
-                            # fontname=span["font"],  # 使用原檔原字型
-                            # 但這裡可能會有問題，因為 PyMuPDF 只支援特定標準字型名稱
-                            # 所以這裡改成使用 "helv" or "times" or "cour" 字型
-                            # 你可以根據需要改成其他標準字型
-                            # or use fontname = "helv"
-                            fontname=span["font"],  # 或 "helv", "cour"
-                            fontsize=span["size"],
-                            fontfile=font_path,
-                            color=span.get("color", 0)
-                        )
+        # 整份文件的實體一次產生假值（同一個原文在各 span 用同一個值）
+        doc_entities = [ent for entities in all_entities for ent in entities]
+        fake_map = {}
+        pseudonymizer = self.context.pseudonymizer if self.context is not None else get_pseudonymizer()
+        if pseudonymizer is not None:
+            # 決定性模式：由金鑰推導，跨檔案、跨機器一致
+            fake_map = {
+                (ent["entity_type"], ent["raw_txt"]): pseudonymizer.pseudonymize(ent["entity_type"], ent["raw_txt"])
+                for ent in doc_entities
+            }
+        elif doc_entities:
+            # 同一原文可能被判成不同類別，以（類別, 原文）區分，各自保留最高分的假值
+            best = {}
+            for item in test_all_methods(doc_entities):
+                key = (item["entity_type"], item["raw_txt"])
+                if key not in best or item["score"] > best[key]["score"]:
+                    best[key] = item
+            fake_map = {key: item["fake_value"] for key, item in best.items()}
+
+        for (new_page, span), entities in zip(span_jobs, all_entities):
+            print("處理 span：", span)
+            text = span["text"]
+            print("字串：", text)
+            # print("偵測到的實體：", entities[0].entity_type)
+            # print("偵測到的 PII：", text[entities[0].start:entities[0].end])
+
+            # 如果沒有偵測到 PII，則直接使用原文字
+            if not entities:
+                masked_text = text
+            else:
+                # 依 entities 位置替換（最後一次改寫）
+                replacements = []
+
+                for ent in entities:
+                    start, end = ent["start"], ent["end"]
+                    raw_txt = ent["raw_txt"]
+                    entity_type = ent["entity_type"]
+
+                    # 如果是 ORGANIZATION，直接保留原文字
+                    if entity_type == "ORGANIZATION":
+                        fake_value = raw_txt
+                    else:
+                        fake_value = fake_map.get((entity_type, raw_txt), "*" * (end - start))
+                        # 確保 fake_value 與 raw_txt 長度一致
+                        fake_value = fake_value[:len(raw_txt)].ljust(len(raw_txt))
+
+                    replacements.append((start, end, fake_value))
+
+                masked_text, _ = rewrite_spans(text, replacements)
+
+            # 用原本的字型、大小、座標插入遮蔽後文字
+            font_path = "/Users/lucasauriant/Downloads/Noto_Sans_TC/NotoSansTC-VariableFont_wght.ttf"
+            new_page.insert_text(
+                (span["bbox"][0], span["bbox"][1]),
+                masked_text,
+                # fontname=span["font"],  # 使用原檔原字型
+                # 但這裡可能會有問題，因為 PyMuPDF 只支援特定標準字型名稱
+                # 所以這裡改成使用 "helv" or "times" or "cour" 字型
+                # 你可以根據需要改成其他標準字型
+                # or use fontname = "helv"
+                fontname=span["font"],  # 或 "helv", "cour"
+                fontsize=span["size"],
+                fontfile=font_path,
+                color=span.get("color", 0)
+            )
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         new_doc.save(output_path)
@@ -0,0 +1,108 @@
+# file_handlers/pipeline_context.py
+"""
+整個 session 共用的處理資源：analyzer、LLM client、對照表、假資料產生器、handler。
+
+原本每個檔案都新建一個 handler，每個 handler 又各自建 client、從磁碟重新載入對照表；
+改成 session 開始時建一個 PipelineContext，handler 由它建立（每種一個）並注入共用資源，
+之後每個檔案直接拿來用，不再有逐檔的初始化成本。
+"""
+
+import asyncio
+import threading
+
+from pii_models.presidio_detector import get_analyzer, warm_up
+from faker_models import fake_pools
+from faker_models.keyed_pseudonym import get_pseudonymizer
+from faker_models.kuwa_async_client import AsyncKuwaChatClient
+from faker_models.mapping_store import open_mapping_store
+from faker_models.reidentifier import Reidentifier
+
+
+class PipelineContext:
+    """
+    用法：
+        ctx = PipelineContext()
+        ctx.handler("docx").deidentify(src, out_path, selected_types)
+        ...
+        ctx.reidentifier().reidentify_text(ai_reply)   # 選用：對照表需 keep_raw
+        ctx.close()   # session 結束時
+    client / mapping 沒給就用預設（.env 的 Kuwa 設定、open_mapping_store()）；
+    Kuwa client 第一次需要模型時才建立，沒設定 Kuwa 時只用本地替換的流程（PDF、即時預覽）照常可用。
+    """
+
+    def __init__(self, client=None, mapping=None, preload_languages=()):
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.mapping = mapping if mapping is not None else open_mapping_store()
+        self.faker = fake_pools.get_faker()
+        self.pseudonymizer = get_pseudonymizer()
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._reidentifier = None
+        if preload_languages:
+            warm_up(preload_languages)
+
+    @property
+    def client(self):
+        """Kuwa client（AsyncKuwaChatClient）；缺少 KUWA_* 設定時這裡才丟 RuntimeError"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = AsyncKuwaChatClient()
+        return self._client
+
+    def model_client(self, use_model: bool):
+        """use_model=False 時回傳 None，不建立 client"""
+        return self.client if use_model else None
+
+    def run(self, coro, use_model: bool = True):
+        """跑替換用的協程：要用模型時在 client 的背景 loop 上跑，否則直接 asyncio.run"""
+        if use_model:
+            return self.client.run(coro)
+        return asyncio.run(coro)
+
+    def reidentifier(self):
+        """
+        把 AI 回覆裡的假值還原成原文的 Reidentifier，和去識別化共用 self.mapping；
+        對照表要以 keep_raw=True 開啟（ANONIME_MAPPING_KEEP_RAW=1），否則丟 ValueError
+        """
+        if self._reidentifier is None:
+            with self._lock:
+                if self._reidentifier is None:
+                    self._reidentifier = Reidentifier(self.mapping)
+        return self._reidentifier
+
+    def analyzer(self, language: str):
+        """該語言的 AnalyzerEngine（presidio_detector 內已快取，這裡只是統一入口）"""
+        return get_analyzer(language)
+
+    def handler(self, ftype: str):
+        """取得 ftype（text / docx / pdf）的 handler；第一次用到才建立，之後重複使用"""
+        handler = self._handlers.get(ftype)
+        if handler is None:
+            with self._lock:
+                handler = self._handlers.get(ftype)
+                if handler is None:
+                    handler = self._handlers[ftype] = self._create_handler(ftype)
+        return handler
+
+    def _create_handler(self, ftype: str):
+        # 延後 import，避免 handler 模組與這裡互相 import
+        if ftype == "text":
+            from file_handlers.txt_handler import TextHandler
+            return TextHandler(context=self)
+        if ftype == "docx":
+            from file_handlers.docx_handler import DocxHandler
+            return DocxHandler(context=self)
+        if ftype == "pdf":
+            from file_handlers.pdf_handler import PdfHandler
+            return PdfHandler(context=self)
+        raise RuntimeError(f"不支援的檔案類型：{ftype}")
+
+    def close(self):
+        """寫回對照表並關閉連線池"""
+        try:
+            self.mapping.flush()
+        finally:
+            if self._client is not None:
+                self._client.close()
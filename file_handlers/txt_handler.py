@@ -1,47 +1,191 @@
 # file_handlers/text_handler.py
+import codecs
 import os
-from pii_models.presidio_detector import detect_pii
+import re
+from pii_models.presidio_detector import detect_pii_batch
 from faker_models.presidio_replacer_plus import replace_pii
-from faker_models.muiltAI_pii_replace import replace_entities, MappingStore, KuwaChatClient
+from faker_models.muiltAI_pii_replace import replace_entities_async
+from file_handlers.pipeline_context import PipelineContext
+
+# 偵測編碼時讀取的檔頭大小
+ENCODING_SAMPLE_BYTES = 1 << 20
+# 依序嘗試的編碼（繁中舊檔多半是 cp950 / big5）
+CANDIDATE_ENCODINGS = ("utf-8", "cp950", "big5")
+
+# 超長行切段時優先切在句尾標點或空白之後
+_CUT_BOUNDARY_RE = re.compile(r"[。！？!?；;.,，]\s*|\s+")
+
+
+def detect_encoding(path: str, sample_bytes: int = ENCODING_SAMPLE_BYTES) -> str:
+    """讀檔頭判斷編碼：先看 BOM，再依序嘗試 CANDIDATE_ENCODINGS，都失敗就用 utf-8"""
+    with open(path, "rb") as f:
+        sample = f.read(sample_bytes)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    for encoding in CANDIDATE_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            # 檔頭可能剛好切在多位元組字元中間，讀到檔尾才要求完整
+            decoder.decode(sample, final=len(sample) < sample_bytes)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    print(f"[Text] 無法判斷 {os.path.basename(path)} 的編碼，改用 utf-8（無法解碼的字元會被取代）")
+    return "utf-8"
+
+
+def _split_paragraphs(lines) -> list[str]:
+    """把連續的行接成段落，空白行結束一個段落（空白行本身併在前一段的結尾），串起來等於原文"""
+    paragraphs = []
+    current = []
+    for line in lines:
+        current.append(line)
+        if not line.strip():
+            paragraphs.append("".join(current))
+            current = []
+    if current:
+        paragraphs.append("".join(current))
+    return paragraphs
 
 
 class TextHandler:
     """
     處理純文字格式 (.txt, .csv, .html, .json) in-place 去識別化，
     抽取純文字、替換 PII、再輸出純文字檔。
+
+    檔案以串流方式處理：每次只讀進約 chunk_chars 字元（以行為單位），
+    偵測 + 替換後立刻寫出，記憶體用量與檔案大小無關。
     """
     # 新增：初始化 LlamaChatClient 和 MappingStore
-    def __init__(self):
-        self.client = KuwaChatClient()
-        self.mapping = MappingStore()
+    def __init__(self, chunk_chars: int = 100_000, overlap_chars: int = 200, context=None):
+        # 保留的尾段不小於視窗的話，超長行每輪都整段留到下一輪，永遠讀不完
+        if overlap_chars >= chunk_chars:
+            raise ValueError(f"overlap_chars（{overlap_chars}）必須小於 chunk_chars（{chunk_chars}）")
+        # client / mapping 由 PipelineContext 提供（沒給就自己建一個）；client 要用模型時才建立
+        self.context = context if context is not None else PipelineContext()
+        self.mapping = self.context.mapping  # 多個 worker 共用同一份對照表
+        # 每個視窗的大約字元數（需遠小於 spaCy 的 max_length）
+        self.chunk_chars = chunk_chars
+        # 超長行被切段時，切點前保留這麼多字元留到下一段重新偵測，避免實體被切斷
+        self.overlap_chars = overlap_chars
 
-    def deidentify(self, input_path: str, output_path: str, selected_types: list[str] = None) -> str:
+    def deidentify(self, input_path: str, output_path: str, selected_types: list[str] = None, detect_mode: str = "full",
+                   use_model: bool = True) -> str:
         # 檢查檔案是否存在
         if not os.path.exists(input_path):
             raise FileNotFoundError(f"找不到輸入檔: {input_path}")
 
-        # 1) 讀取純文字內容
-        with open(input_path, "r", encoding="utf-8") as f:
-            text = f.read()
-
-        # 2) 偵測 PII
-        entities = detect_pii(text, language="en", score_threshold=0.6)
-        
-        # 3) 使用假資料或遮蔽進行替換
-        # cleaned = replace_pii(text, entities)
-        cleaned = replace_entities(                   # ★ (新)
-                    text,
-                    entities,
-                    chat_client=self.client,
-                    mapping=self.mapping,        # ★ 同一份 mapping，保持一致性
-                    # batch_size=30,             # 可調；大量文件時 20~50 都可
-        )
-
-        # 4) 寫入輸出檔
+        # 1) 先判斷編碼，再以串流方式讀取（newline="" 保留原本的換行符號）
+        encoding = detect_encoding(input_path)
+        print(f"[Text] {os.path.basename(input_path)} 編碼：{encoding}")
+
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(cleaned)
+        with open(input_path, "r", encoding=encoding, errors="replace", newline="") as src, \
+                open(output_path, "w", encoding="utf-8", newline="") as dst:
+            self.deidentify_stream(src, dst, selected_types, detect_mode, use_model)
 
         return output_path
 
+    def deidentify_stream(self, src, dst, selected_types: list[str] = None, detect_mode: str = "full",
+                          use_model: bool = True) -> None:
+        """
+        從文字串流 src 讀取、去識別化後寫到 dst（parallel_engine 的 worker 也用這個處理切段）
+        use_model=False：不等模型，全部先用本地 Faker 替換（即時預覽用）
+        """
+        for window, entities in self._iter_windows(src, selected_types, detect_mode):
+            # 3) 使用假資料或遮蔽進行替換
+            # cleaned = replace_pii(window, entities)
+            chat_client = self.context.model_client(use_model)  # 同一視窗的模型批次同時送出
+            cleaned = self.context.run(replace_entities_async(   # ★ (新)
+                        window,
+                        entities,
+                        chat_client=chat_client,
+                        mapping=self.mapping,        # ★ 同一份 mapping，保持一致性
+                        # batch_size=30,             # 可調；大量文件時 20~50 都可
+                        debug=False,                 # 視窗可能很大，不印整段原文
+                        use_model=use_model,
+            ), use_model)
+            # 4) 立刻寫出，不在記憶體累積整份結果
+            dst.write(cleaned)
+
+    def _iter_windows(self, src, selected_types, detect_mode):
+        """
+        逐段讀取並偵測，產生 (要輸出的文字, 該段文字座標的實體 list)。
+
+        以行為單位累積到 chunk_chars 後，依空白行切成段落批次偵測（detect_pii_batch）：
+        同一段落內上一行的 context（例如「健保卡號」）仍會加分，跨行的實體也找得到；
+        單行超過 chunk_chars 時用 readline(limit) 分段讀，
+        該行未讀完的尾段保留 overlap_chars（切在句尾/空白、且不切斷任何實體），
+        和下一段接起來再偵測一次。
+        """
+        carry = ""  # 上一輪未輸出、要重新偵測的超長行尾段
+        eof = False
+        while not eof:
+            pieces = [carry]
+            size = len(carry)
+            while size < self.chunk_chars:
+                piece = src.readline(self.chunk_chars)
+                if not piece:
+                    eof = True
+                    break
+                pieces.append(piece)
+                size += len(piece)
+            window = "".join(pieces)
+            if not window:
+                break
+
+            # 2) 以段落為單位批次偵測 PII，再把座標換回整個視窗
+            lines = window.splitlines(keepends=True)
+            paragraphs = _split_paragraphs(lines)
+            paragraph_entities = detect_pii_batch(
+                paragraphs, language="auto", score_threshold=0.6, mode=detect_mode, selected_types=selected_types,
+            )
+            entities = []
+            offset = 0
+            for paragraph, spans in zip(paragraphs, paragraph_entities):
+                for s in spans:
+                    entities.append({**s, "start": s["start"] + offset, "end": s["end"] + offset})
+                offset += len(paragraph)
+
+            cut = len(window)
+            last = lines[-1]
+            # 最後一行沒有換行符號且還沒到檔尾 → 是超長行的一部分，尾段留到下一輪
+            if not eof and last == last.rstrip("\r\n"):
+                cut = self._safe_cut(window, len(window) - len(last), entities)
+
+            carry = window[cut:]
+            if cut:
+                yield window[:cut], [e for e in entities if e["end"] <= cut]
+
+    def _safe_cut(self, window: str, line_start: int, entities) -> int:
+        """在最後一行（從 line_start 開始）裡找輸出切點：切點後至少保留 overlap_chars，且不落在實體中間"""
+        target = len(window) - self.overlap_chars
+        if target <= line_start:
+            # 這一行還很短，整行都留到下一輪
+            return line_start
+
+        # 在 [target - overlap_chars, target] 找最後一個句尾/空白邊界
+        lo = max(line_start, target - self.overlap_chars)
+        cut = target
+        for m in _CUT_BOUNDARY_RE.finditer(window, lo, target):
+            cut = m.end()
 
+        # 切點落在實體中間就往前移到實體開頭（移動後可能又落在別的實體裡，重複檢查）
+        moved = True
+        while moved:
+            moved = False
+            for e in entities:
+                if e["start"] < cut < e["end"]:
+                    cut = e["start"]
+                    moved = True
+        if cut > line_start:
+            return cut
+        # 實體從行首開始：前面的完整行照常輸出，這一行整行留到下一輪
+        if line_start > 0:
+            return line_start
+        # 整個視窗只剩一個超過 chunk_chars 的實體：只能硬切，維持記憶體上限
+        return target
@@ -0,0 +1,36 @@
+# file_handlers/worker_preload.py
+"""
+parallel_engine 的 worker 預載模組。
+
+用 forkserver 時這個模組會在 forkserver 裡 import 一次：analyzer（spaCy 模型）
+和 handler 相關模組（Faker 等）都先載入，之後 fork 出來的 worker 以 copy-on-write
+共用，不必各自再載一次。用 spawn（Windows）時則由每個 worker 的 initializer 載入。
+"""
+
+from pii_models.presidio_detector import warm_up
+
+PRELOAD_LANGUAGES = ("en", "zh")
+
+try:
+    warm_up(PRELOAD_LANGUAGES)
+except Exception as e:
+    # 載入失敗不影響 worker 啟動，第一次用到該語言時會再載入
+    print(f"[Preload] 預先載入 analyzer 失敗：{e}")
+
+try:
+    from file_handlers.txt_handler import TextHandler
+    from file_handlers.docx_handler import DocxHandler
+    from file_handlers.pdf_handler import PdfHandler
+    from file_handlers.pipeline_context import PipelineContext
+except ImportError as e:
+    print(f"[Preload] 無法導入 handler：{e}")
+
+
+def create_handlers():
+    """
+    建立 worker 自己的 handler：每個 worker 一份 PipelineContext，
+    三種 handler 共用裡面的 client / mapping（不跨 process 共用；client 要用模型時才建立，
+    沒設定 Kuwa 也能啟動 worker）
+    """
+    context = PipelineContext()
+    return {ftype: context.handler(ftype) for ftype in ("text", "docx", "pdf")}
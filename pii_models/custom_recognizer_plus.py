@@ -1,184 +1,63 @@
 # custom_recognizer.py
 from presidio_analyzer import Pattern, PatternRecognizer, AnalyzerEngine, RecognizerResult
 from typing import List, Optional
-import re
 
-# ---------- helpers: validators / scoring tweaks ----------
+from pii_models import pattern_specs
+from pii_models.pattern_specs import (
+    DURATION_CONTEXT,
+    MAC_CONTEXT,
+    PATTERN_ENTITY_SPECS,
+    TW_HOME_CONTEXT,
+    TW_ID_CONTEXT,
+    TW_NHI_CONTEXT,
+    TW_PHONE_CONTEXT,
+    TW_UBN_CONTEXT,
+    normalize_mac,
+    validate_tw_ubn,
+)
+
+# ---------- patterns ----------
+# regex / 分數 / context 定義在 pattern_specs（不依賴 presidio，regex 快速模式也用），這裡轉成 presidio 的 Pattern
+
+
+def _patterns(specs) -> List[Pattern]:
+    return [Pattern(name=s.name, regex=s.regex, score=s.score) for s in specs]
+
+
+tw_id_pattern, tw_ubn_pattern = _patterns([pattern_specs.tw_id_pattern, pattern_specs.tw_ubn_pattern])
+tw_mobile_patterns = _patterns(pattern_specs.tw_mobile_patterns)
+duration_patterns = _patterns(pattern_specs.duration_patterns)
+tw_home_patterns = _patterns(pattern_specs.tw_home_patterns)
+mac_patterns = _patterns(pattern_specs.mac_patterns)
+tw_nhi_patterns = _patterns(pattern_specs.tw_nhi_patterns)
+
+# presidio 內建、預設只註冊給 en 的 pattern recognizer。這些格式與語言無關，
+# 原本所有文字都用 en 分析時都會跑；中文段落改走 zh analyzer 後也要註冊，否則卡號、SSN 會漏掉
+LANGUAGE_INDEPENDENT_RECOGNIZERS = (
+    "CreditCardRecognizer",
+    "UsSsnRecognizer",
+    "UsItinRecognizer",
+    "UsPassportRecognizer",
+    "UsBankRecognizer",
+    "UsLicenseRecognizer",
+    "NhsRecognizer",
+)
+
+
+def register_language_independent(analyzer: AnalyzerEngine, language: str):
+    """把 LANGUAGE_INDEPENDENT_RECOGNIZERS 中這個語言還沒有的註冊給 language"""
+    from presidio_analyzer import predefined_recognizers
+
+    supported = set(analyzer.get_supported_entities(language))
+    for name in LANGUAGE_INDEPENDENT_RECOGNIZERS:
+        recognizer = getattr(predefined_recognizers, name)(supported_language=language)
+        if not set(recognizer.supported_entities) & supported:
+            analyzer.registry.add_recognizer(recognizer)
 
-def validate_tw_ubn(ubn: str) -> bool:
-    """
-    Taiwan UBN checksum:
-    multiply digits by [1,2,1,2,1,2,4,1], sum digits of products,
-    total % 10 == 0, or special case: if 7th digit product sums to 10, allow (total+1) % 10 == 0
-    """
-    if not re.fullmatch(r"\d{8}", ubn):
-        return False
-    coef = [1,2,1,2,1,2,4,1]
-    s = 0
-    for i, c in enumerate(ubn):
-        p = int(c) * coef[i]
-        s += (p // 10) + (p % 10)
-    # special case: if 7th position (index 6) contributes 10, allow +1
-    if (int(ubn[6]) * 4) >= 10:
-        return s % 10 == 0 or (s + 1) % 10 == 0
-    return s % 10 == 0
-
-def normalize_mac(mac: str) -> str:
-    mac = mac.lower()
-    mac = mac.replace("-", ":")
-    if "." in mac:  # cisco dotted -> convert to colon
-        mac = mac.replace(".", "")
-        mac = ":".join([mac[i:i+2] for i in range(0, 12, 2)])
-    return mac
 
 # ---------- main registration ----------
 
 def register_custom_entities(analyzer: AnalyzerEngine):
-    # ==== Existing: TW_ID & UBN (keep your patterns but add validator awareness) ====
-    tw_id_pattern = Pattern(
-        name="tw_id_pattern",
-        regex=r"\b[A-Z][12]\d{8}\b",
-        score=0.85
-    )
-    tw_ubn_pattern = Pattern(
-        name="tw_ubn_pattern",
-        regex=r"\b\d{8}\b",
-        score=0.95 # 一開始就提高基礎分數
-    )
-
-    # ==== NEW: Taiwan Mobile (行動電話) ====
-    # 支援：09xxxxxxxx、09xx-xxx-xxx、+886 9xxxxxxxx、(+886)9xxxxxxxx、+8869xxxxxxxx（空白/連字號/括號皆可）
-    tw_mobile_patterns = [
-        Pattern(
-            name="tw_mobile_domestic",
-            regex=r"\b09\d{2}[-\s]?\d{3}[-\s]?\d{3}\b",
-            score=0.85
-        ),
-        Pattern(
-            name="tw_mobile_intl_spaced",
-            regex=r"\b(?:\+886|\(\+886\))\s*9\d{2}\s*\d{3}\s*\d{3}\b",
-            score=0.85
-        ),
-        Pattern(
-            name="tw_mobile_intl_compact",
-            regex=r"\b\+886\s*9\d{8}\b",
-            score=0.85
-        ),
-        Pattern(
-            name="tw_mobile_intl_no_space",
-            regex=r"\b\+8869\d{8}\b",  # 新增允許無空格的情況
-            score=0.95  # 提高分數
-        ),
-    ]
-    
-    # ==== NEW: Duration (時間長度) ====
-    # 改進版：更簡潔的時間持續期識別，主要基於數字 + 時間單位的模式
-    duration_patterns = [
-        # 核心模式：數字 + 時間單位（年/月/週/日）
-        Pattern(
-            name="duration_basic_time_units",
-            regex=r"\b\d+\s+(?:years?|months?|weeks?|days?)\b",
-            score=0.92  # 高分數，因為這是明確的時間持續期指標
-        ),
-        # 中文時間單位支援
-        Pattern(
-            name="duration_chinese_time_units",
-            regex=r"\b\d+\s*(?:年|個月|月|週|星期|日|天)\b",
-            score=0.92
-        ),
-        # 帶有 "ago" 的時間表達（明確的時間參考）
-        Pattern(
-            name="duration_time_ago",
-            regex=r"\b\d+\s+(?:years?|months?|weeks?|days?)\s+ago\b",
-            score=0.98  # 最高分數，因為有明確的時間上下文
-        ),
-        # 年齡表達（排除純粹的年份，如 2023）
-        Pattern(
-            name="duration_age_expression",
-            regex=r"\b\d{1,2}\s+years?\s+old\b",
-            score=0.95
-        ),
-        # 經驗年數（保留一些明確的經驗表達）
-        Pattern(
-            name="duration_experience_explicit",
-            regex=r"\b\d+\s+(?:years?|months?)\s+(?:of\s+)?(?:experience|experiences?)\b",
-            score=0.96
-        ),
-        # 工作年資表達
-        Pattern(
-            name="duration_work_period",
-            regex=r"\b\d+\s+(?:years?|months?)\s+(?:of\s+)?(?:work|service|employment)\b",
-            score=0.94
-        ),
-        # 帶小數點的時間表達（如 2.5 years）
-        Pattern(
-            name="duration_decimal_time",
-            regex=r"\b\d+(?:\.\d+)?\s*(?:years?|months?|weeks?|days?)\b",
-            score=0.90
-        ),
-        # 範圍表達（如 3-5 years）
-        Pattern(
-            name="duration_range_time",
-            regex=r"\b\d+[-]\d+\s+(?:years?|months?|weeks?|days?)\b",
-            score=0.95
-        ),
-        # 時間長度 + over/under/about 等修飾詞
-        Pattern(
-            name="duration_with_modifiers",
-            regex=r"\b(?:over|under|about|around|approximately|roughly)\s+\d+\s+(?:years?|months?|weeks?|days?)\b",
-            score=0.93
-        )
-    ]
-
-    # ==== NEW: Taiwan Landline (市話) ====
-    # 形式：0X~0XXX 區碼 + 6~8碼；可為 (0X)xxxxxxx、0X-xxxx-xxxx、+886 X xxxxxxxx 等
-    # 排除 09 開頭避免吃到手機
-    tw_home_patterns = [
-        Pattern(
-            name="tw_home_parenthesized",
-            regex=r"\(\s?0\d{1,3}\s?\)\s?\d{6,8}\b",
-            score=0.80
-        ),
-        Pattern(
-            name="tw_home_dash_or_space",
-            regex=r"\b0(?!9)\d{1,3}[-\s]\d{6,8}\b",  # 要求必須有分隔符
-            score=0.80
-        ),
-        Pattern(
-            name="tw_home_no_separator_9_10_digits",  # 新增：純數字但必須9-10位
-            regex=r"\b0(?!9)\d{8,9}\b",  # 9-10位數字，排除8位
-            score=0.75
-        ),
-        Pattern(
-            name="tw_home_intl",
-            regex=r"\b\+886\s?(?:[2-8]|[2-8]\d|\d{2})\s?\d{6,8}\b",
-            score=0.80
-        ),
-    ]
-
-    # ==== NEW: MAC address ====
-    mac_patterns = [
-        Pattern(
-            name="mac_colon_or_dash",
-            regex=r"\b(?:[0-9A-Fa-f]{2}([:-]))(?:[0-9A-Fa-f]{2}\1){4}[0-9A-Fa-f]{2}\b",
-            score=0.90
-        ),
-        Pattern(
-            name="mac_cisco_dotted",
-            regex=r"\b(?:[0-9A-Fa-f]{4}\.){2}[0-9A-Fa-f]{4}\b",
-            score=0.90
-        ),
-    ]
-
-    # ==== NEW: Taiwan NHI card number (健保卡卡號) 12位純數字 ====
-    tw_nhi_patterns = [
-        Pattern(
-            name="tw_nhi_12_digits",
-            regex=r"\b0000\d{8}\b",
-            score=0.51  # 基礎分數不高，以「上下文」拉分，避免一般12碼數字誤擊
-        )
-    ]
-
     # ---------- Recognizers with context & validation ----------
 
     # zh/en 都註冊（Presidio 會依語言分流）
@@ -188,14 +67,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
             supported_entity="DURATION_TIME",
             patterns=duration_patterns,
             supported_language=lang,
-            context=[
-                # 英文上下文
-                "experience", "work", "service", "training", "employment", "old", "ago", 
-                "years", "months", "weeks", "days", "year", "month", "week", "day",
-                "over", "under", "about", "around", "approximately", "roughly",
-                # 中文上下文
-                "年", "月", "週", "星期", "日", "天", "個月", "經驗", "工作", "服務", "歲"
-            ]
+            context=DURATION_CONTEXT
         )
         
         # 身分證
@@ -203,7 +75,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
             supported_entity="TW_ID_NUMBER",
             patterns=[tw_id_pattern],
             supported_language=lang,
-            context=["身分證", "身份證", "ID", "ID number"]
+            context=TW_ID_CONTEXT
         )
 
         # 統編（含校驗加權）
@@ -212,7 +84,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
                 super().__init__(supported_entity="UNIFIED_BUSINESS_NO",
                                  patterns=[tw_ubn_pattern],
                                  supported_language=lang,
-                                 context=["統編", "統一編號", "UBN", "company", "tax", "Unified Business No"],
+                                 context=TW_UBN_CONTEXT,
                                  **kwargs)
 
             def validate_result(self, pattern_text: str) -> Optional[bool]:
@@ -240,7 +112,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
             supported_entity="TW_PHONE_NUMBER",
             patterns=tw_mobile_patterns,
             supported_language=lang,
-            context=["手機", "行動", "phone", "mobile", "tel", "臺灣", "台灣手機", "行動電話"]
+            context=TW_PHONE_CONTEXT
         )
 
         # 市話
@@ -248,7 +120,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
             supported_entity="TW_HOME_NUMBER",
             patterns=tw_home_patterns[1:],  # 去掉那個保護性極低的basic pattern
             supported_language=lang,
-            context=["市話", "電話", "tel", "phone", "landline"]
+            context=TW_HOME_CONTEXT
         )
 
         # MAC
@@ -257,7 +129,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
                 super().__init__(supported_entity="MAC_ADDRESS",
                                  patterns=mac_patterns,
                                  supported_language=lang,
-                                 context=["MAC", "網卡", "乙太網路", "Ethernet"], **kwargs)
+                                 context=MAC_CONTEXT, **kwargs)
 
             def enhance_confidence(self, result: RecognizerResult, text: str) -> RecognizerResult:
                 norm = normalize_mac(text[result.start:result.end])
@@ -271,7 +143,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
             def analyze(self, text: str, entities: List[str], nlp_artifacts=None) -> List[RecognizerResult]:
                 results = super().analyze(text, entities, nlp_artifacts)
                 for r in results:
-                    r = self.enhance_confidence(r)
+                    r = self.enhance_confidence(r, text)
                 return results
 
         mac_recognizer = MACRecognizer()
@@ -282,7 +154,7 @@ def register_custom_entities(analyzer: AnalyzerEngine):
             patterns=tw_nhi_patterns,
             supported_language=lang,
             # 強化上下文，降低一般12碼數字誤擊
-            context=["健保", "健保卡", "NHI", "NHIC", "健康保險", "health insurance"]
+            context=TW_NHI_CONTEXT
         )
 
         # ---- register all ----
@@ -0,0 +1,152 @@
+# pii_models/detection_cache.py
+"""
+偵測結果快取：(文字 sha256, 語言, 門檻, 實體 profile, 模式) → 實體 list。
+
+同一批文件裡反覆出現的頁首、頁尾、免責聲明、表格標題只需分析一次；
+同一份文件改版後重跑，也只有改過的段落需要重新分析。
+記憶體用 LRU；設定 disk_path（或環境變數 ANONIME_DETECTION_CACHE）時
+另外寫一份到 sqlite，程式重開後仍可命中。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 20000
+
+# 偵測結果的算法改變時遞增，舊的 sqlite 快取自動失效
+# v2：批次偵測串接成包時，結果曾受隔壁段落的 context 影響；之後每段結果只看自己的文字
+KEY_VERSION = 2
+
+
+def make_key(text: str, language: str, score_threshold: float, profile_key: str, mode: str) -> str:
+    """快取的值只能取決於 key 裡的東西：偵測結果必須和這段文字在批次中的位置、鄰居無關"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"v{KEY_VERSION}|{digest}|{language}|{score_threshold}|{profile_key}|{mode}"
+
+
+class DetectionCache:
+    """
+    LRU（+ 選用的 sqlite）偵測結果快取。
+    只存 (entity_type, start, end, score)，取出時再從原文補上 raw_txt，
+    每次取出都是新的 dict，呼叫端修改不會污染快取。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, disk_path: str = None):
+        self.max_entries = max_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS detection_cache (key TEXT PRIMARY KEY, spans TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def _pack(spans):
+        return [(s["entity_type"], s["start"], s["end"], s["score"]) for s in spans]
+
+    @staticmethod
+    def _unpack(text, packed):
+        return [
+            {"entity_type": t, "start": start, "end": end, "score": score, "raw_txt": text[start:end]}
+            for t, start, end, score in packed
+        ]
+
+    def _remember(self, key, packed):
+        # 呼叫端需持有 self._lock
+        self._mem[key] = packed
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def get(self, key: str, text: str):
+        """命中回傳實體 list，否則回傳 None"""
+        with self._lock:
+            packed = self._mem.get(key)
+            if packed is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return self._unpack(text, packed)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT spans FROM detection_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    packed = [tuple(item) for item in json.loads(row[0])]
+                    self._remember(key, packed)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return self._unpack(text, packed)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, spans):
+        self.put_many([(key, spans)])
+
+    def put_many(self, items):
+        """一次寫入多筆 [(key, spans), ...]；sqlite 只 commit 一次"""
+        rows = []
+        with self._lock:
+            for key, spans in items:
+                packed = self._pack(spans)
+                self._remember(key, packed)
+                rows.append((key, json.dumps(packed)))
+            if self._db is not None and rows:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO detection_cache (key, spans) VALUES (?, ?)", rows
+                    )
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM detection_cache")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._mem),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_detection_cache() -> DetectionCache:
+    """取得 process 共用的偵測快取（第一次呼叫時建立）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DetectionCache(disk_path=os.getenv("ANONIME_DETECTION_CACHE") or None)
+    return _cache
+
+
+def configure_detection_cache(max_entries: int = DEFAULT_MAX_ENTRIES, disk_path: str = None) -> DetectionCache:
+    """換掉共用快取的設定（例如指定 sqlite 路徑），回傳新的快取"""
+    global _cache
+    with _cache_lock:
+        _cache = DetectionCache(max_entries=max_entries, disk_path=disk_path)
+    return _cache
+
+
+def get_cache_stats() -> dict:
+    return get_detection_cache().stats()
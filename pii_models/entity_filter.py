@@ -0,0 +1,114 @@
+# pii_models/entity_filter.py
+
+from bisect import bisect_left
+
+# 篩選重疊實體的函數
+PRIORITY = {
+    "TW_PHONE_NUMBER": 1,
+    "DURATION_TIME": 1,
+    "DATE_TIME": 2,
+    "UNIFIED_BUSINESS_NO": 1,
+    "TW_HOME_NUMBER": 2,
+    "EMAIL_ADDRESS": 1,
+    "PERSON": 1,
+    "LOCATION": 2,
+    "ORGANIZATION": 3,
+}
+
+
+def filter_entities_by_priority(entities, verbose=False):
+    """
+    篩選重疊實體，保留優先級高且分數高的實體。
+
+    依 (優先級, -分數) 排序後逐一決定是否保留：與任何已保留實體重疊就跳過。
+    已保留實體用「依起點排序的 Fenwick tree（前綴最大終點）」索引：
+    查「起點 < 目前終點」的已保留實體中最大的終點，若大於目前起點就代表重疊。
+    每個實體查詢/更新各 O(log n)，整體 O(n log n)，結果與逐一兩兩比對相同。
+    """
+    if not entities:
+        return []
+
+    # 按優先級和分數排序（優先級低的數字代表高優先級）
+    sorted_entities = sorted(
+        entities,
+        key=lambda e: (PRIORITY.get(e["entity_type"], 99), -e["score"])
+    )
+
+    starts = sorted({e["start"] for e in entities})
+    size = len(starts)
+    tree = [-1] * (size + 1)  # tree[i]：該節點涵蓋範圍內已保留實體的最大終點
+
+    filtered = []
+    for current_entity in sorted_entities:
+        current_start = current_entity["start"]
+        current_end = current_entity["end"]
+
+        # 起點 < current_end 的已保留實體中，最大的終點
+        i = bisect_left(starts, current_end)
+        max_end = -1
+        while i > 0:
+            if tree[i] > max_end:
+                max_end = tree[i]
+            i -= i & -i
+
+        # 檢查重疊：如果兩個範圍有任何交集就算重疊
+        if max_end > current_start:
+            if verbose:
+                print(f"跳過重疊實體：{current_entity['entity_type']} - '{current_entity['raw_txt']}' (score: {current_entity['score']})")
+            continue
+
+        filtered.append(current_entity)
+        if verbose:
+            print(f"保留實體：{current_entity['entity_type']} - '{current_entity['raw_txt']}' (score: {current_entity['score']})")
+        i = bisect_left(starts, current_start) + 1
+        while i <= size:
+            if tree[i] < current_end:
+                tree[i] = current_end
+            i += i & -i
+
+    return filtered
+
+
+if __name__ == "__main__":
+    # scaling benchmark：10k ~ 1M 個合成 span，並和舊的 O(n²) 做法比對結果
+    import random
+    import time
+
+    def filter_quadratic(entities):
+        sorted_entities = sorted(
+            entities,
+            key=lambda e: (PRIORITY.get(e["entity_type"], 99), -e["score"])
+        )
+        filtered = []
+        for cur in sorted_entities:
+            if all(cur["end"] <= sel["start"] or cur["start"] >= sel["end"] for sel in filtered):
+                filtered.append(cur)
+        return filtered
+
+    def synthetic_spans(n, seed=0):
+        # 平均每 40 字元一個 span，長度 3~30，約三成會因重疊被篩掉
+        rng = random.Random(seed)
+        types = list(PRIORITY) + ["TW_ID_NUMBER", "MAC_ADDRESS"]
+        spans = []
+        for _ in range(n):
+            start = rng.randrange(0, n * 40)
+            spans.append({
+                "entity_type": rng.choice(types),
+                "start": start,
+                "end": start + rng.randint(3, 30),
+                "score": round(rng.uniform(0.5, 1.0), 2),
+                "raw_txt": "",
+            })
+        return spans
+
+    for n in (10_000, 100_000, 1_000_000):
+        spans = synthetic_spans(n)
+        t0 = time.perf_counter()
+        kept = filter_entities_by_priority(spans)
+        elapsed = time.perf_counter() - t0
+        line = f"n={n:>9,}：{elapsed:.3f}s，保留 {len(kept):,} 個"
+        if n <= 10_000:
+            t0 = time.perf_counter()
+            expected = filter_quadratic(spans)
+            line += f"；O(n²) 舊做法 {time.perf_counter() - t0:.3f}s，結果一致：{expected == kept}"
+        print(line)
@@ -0,0 +1,93 @@
+# pii_models/entity_profiles.py
+
+from functools import lru_cache
+
+# UI（UploadPage.qml）勾選的選項 key → 要偵測的 Presidio 實體
+OPTION_ENTITIES = {
+    "name": ["PERSON"],
+    "email": ["EMAIL_ADDRESS"],
+    "phone": ["PHONE_NUMBER", "TW_PHONE_NUMBER", "TW_HOME_NUMBER"],
+    "address": ["LOCATION"],
+    "birthday": ["DATE_TIME"],
+    "id": ["TW_ID_NUMBER", "US_SSN"],
+    "company": ["ORGANIZATION"],
+    "bank": ["IBAN_CODE", "US_BANK_NUMBER"],
+    "CREDIT_CARD": ["CREDIT_CARD"],
+    "TW_ID_NUMBER": ["TW_ID_NUMBER"],
+    "TW_NHI_NUMBER": ["TW_NHI_NUMBER"],
+    "DATE_TIME": ["DATE_TIME", "DURATION_TIME"],
+    "UNIFIED_BUSINESS_NO": ["UNIFIED_BUSINESS_NO"],
+    "TW_PHONE_NUMBER": ["TW_PHONE_NUMBER", "TW_HOME_NUMBER"],
+    "IP_ADDRESS": ["IP_ADDRESS"],
+    "TW_PASSPORT_NUMBER": ["TW_PASSPORT_NUMBER"],
+    "URL": ["URL"],
+}
+
+# 由 spaCy NER（presidio 的 SpacyRecognizer）產生的實體；都沒選就不必跑 ner
+NER_ENTITIES = {"PERSON", "LOCATION", "ORGANIZATION", "NRP", "DATE_TIME"}
+
+# presidio 用不到的 spaCy 元件（只用 tokens / lemmas / ents），一律不跑
+UNUSED_PIPES = ("parser",)
+
+
+class AnalyzerProfile:
+    """
+    一組 UI 選項對應的偵測設定：
+    entities 傳給 analyzer.analyze（None = 全部實體），
+    disabled_pipes 是跑 spaCy 時要停用的元件。
+    """
+
+    def __init__(self, entities, needs_ner):
+        self.entities = entities
+        self.needs_ner = needs_ner
+        self.disabled_pipes = UNUSED_PIPES + (() if needs_ner else ("ner",))
+        # 給快取等用途的穩定 key
+        self.key = "*" if entities is None else ",".join(entities)
+        self._by_language = {}
+
+    def entities_for(self, language, get_supported):
+        """
+        只保留該語言有 recognizer 的實體（None = 全部）；get_supported() 回傳該語言支援的實體，只在第一次呼叫。
+        analyzer.analyze 遇到沒有任何 recognizer 的實體會丟 ValueError，整份檔案就失敗；
+        回傳空 list 表示這個語言沒有可偵測的實體，不必呼叫 analyze。
+        """
+        if self.entities is None:
+            return None
+        entities = self._by_language.get(language)
+        if entities is None:
+            supported = set(get_supported())
+            entities = [e for e in self.entities if e in supported]
+            dropped = [e for e in self.entities if e not in supported]
+            if dropped:
+                print(f"[Profile] {language} 沒有 {dropped} 的 recognizer，略過")
+            self._by_language[language] = entities
+        return entities
+
+    def __repr__(self):
+        return f"AnalyzerProfile(entities={self.key}, needs_ner={self.needs_ner})"
+
+
+def build_profile(selected_types=None) -> AnalyzerProfile:
+    """
+    依 UI 勾選的選項建立 AnalyzerProfile（相同組合只建一次）。
+    沒有勾選任何選項時沿用原本行為：偵測全部實體。
+    """
+    return _build_profile(frozenset(selected_types or ()))
+
+
+@lru_cache(maxsize=None)
+def _build_profile(options: frozenset) -> AnalyzerProfile:
+    entities = set()
+    for option in options:
+        mapped = OPTION_ENTITIES.get(option)
+        if mapped is None:
+            print(f"[Profile] 未知的選項：{option}，略過")
+            continue
+        entities.update(mapped)
+
+    if not entities:
+        return AnalyzerProfile(None, needs_ner=True)
+
+    profile = AnalyzerProfile(sorted(entities), needs_ner=bool(entities & NER_ENTITIES))
+    print(f"[Profile] 選項 {sorted(options)} → {profile}")
+    return profile
@@ -0,0 +1,161 @@
+# pii_models/fast_detector.py
+"""
+Regex-only 快速偵測模式：只跑 custom_recognizer_plus 註冊的 pattern 實體
+（TW 手機/市話、身分證、統編、健保卡、MAC、時間長度）加上 Email，
+完全不經過 spaCy / NlpEngine；pattern 從 pattern_specs 讀，連 presidio 都不 import。
+
+語境加分用「實體前方固定字元視窗內是否出現 context 關鍵字」取代 spaCy lemma，
+分數規則比照 presidio 的 LemmaContextAwareEnhancer（+0.35、最低 0.4、上限 1.0）。
+"""
+
+import re
+from typing import Callable, Dict, List, Optional
+
+from pii_models.pattern_specs import (
+    PATTERN_ENTITY_SPECS,
+    normalize_mac,
+    validate_tw_ubn,
+)
+from pii_models.entity_filter import filter_entities_by_priority
+
+# 與 presidio PatternRecognizer 預設相同的 regex flags
+REGEX_FLAGS = re.DOTALL | re.MULTILINE | re.IGNORECASE
+
+# 語境加分參數（同 presidio 預設值）
+CONTEXT_SIMILARITY_FACTOR = 0.35
+MIN_SCORE_WITH_CONTEXT = 0.4
+# 往前看多少字元找 context 關鍵字（約等於 presidio 的前 5 個詞）
+CONTEXT_WINDOW_CHARS = 40
+
+# presidio 內建 EmailRecognizer 的 regex 與 context
+EMAIL_REGEX = r"\b((([!#$%&'*+\-/=?^_`{|}~\w])|([!#$%&'*+\-/=?^_`{|}~\w][!#$%&'*+\-/=?^_`{|}~\.\w]{0,}[!#$%&'*+\-/=?^_`{|}~\w]))[@]\w+([-.]\w+)*\.\w+([-.]\w+)*)\b"
+EMAIL_CONTEXT = ["email"]
+
+
+def _validate_email(raw: str) -> bool:
+    # 取代 tldextract：最後一段網域必須是 2 碼以上英文字母
+    tld = raw.rsplit(".", 1)[-1]
+    return len(tld) >= 2 and tld.isalpha()
+
+
+def _ubn_score(raw: str, score: float) -> Optional[float]:
+    # 同 TWUBNRecognizer：校驗失敗直接丟棄，通過給 0.98
+    return 0.98 if validate_tw_ubn(raw) else None
+
+
+def _mac_score(raw: str, score: float) -> Optional[float]:
+    # 同 MACRecognizer：全 0 / 全 f 給低分，其餘至少 0.90
+    if normalize_mac(raw) in {"00:00:00:00:00:00", "ff:ff:ff:ff:ff:ff"}:
+        return min(score, 0.20)
+    return max(score, 0.90)
+
+
+def _email_score(raw: str, score: float) -> Optional[float]:
+    # 同 presidio：validate_result 通過 → 1.0
+    return 1.0 if _validate_email(raw) else None
+
+
+# 實體 → 分數調整函式（回傳 None 表示丟棄這個結果）
+SCORE_ADJUSTERS: Dict[str, Callable[[str, float], Optional[float]]] = {
+    "UNIFIED_BUSINESS_NO": _ubn_score,
+    "MAC_ADDRESS": _mac_score,
+    "EMAIL_ADDRESS": _email_score,
+}
+
+FAST_ENTITIES = tuple(PATTERN_ENTITY_SPECS) + ("EMAIL_ADDRESS",)
+
+# [(entity_type, compiled_regex, score), ...]，第一次用到才編譯
+_compiled_patterns = None
+# entity_type → context 關鍵字合併成的 regex（不分大小寫）
+_context_regex = {}
+
+
+def _compile_keywords(words):
+    return re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+
+
+def _get_compiled_patterns():
+    global _compiled_patterns
+    if _compiled_patterns is None:
+        compiled = []
+        for entity_type, (patterns, context) in PATTERN_ENTITY_SPECS.items():
+            for p in patterns:
+                compiled.append((entity_type, re.compile(p.regex, REGEX_FLAGS), p.score))
+            _context_regex[entity_type] = _compile_keywords(context)
+        compiled.append(("EMAIL_ADDRESS", re.compile(EMAIL_REGEX, REGEX_FLAGS), 0.5))
+        _context_regex["EMAIL_ADDRESS"] = _compile_keywords(EMAIL_CONTEXT)
+        _compiled_patterns = compiled
+    return _compiled_patterns
+
+
+def _apply_context(text: str, entity_type: str, start: int, score: float) -> float:
+    """實體前方 CONTEXT_WINDOW_CHARS 字元內出現 context 關鍵字就加分"""
+    keywords = _context_regex.get(entity_type)
+    if keywords is None:
+        return score
+    if keywords.search(text, max(0, start - CONTEXT_WINDOW_CHARS), start):
+        score = max(score + CONTEXT_SIMILARITY_FACTOR, MIN_SCORE_WITH_CONTEXT)
+        score = min(score, 1.0)
+    return score
+
+
+def score_span(text: str, entity_type: str, start: int, end: int, score: float) -> Optional[float]:
+    """驗證 + 分數調整 + 語境加分，回傳 None 表示丟棄"""
+    adjust = SCORE_ADJUSTERS.get(entity_type)
+    if adjust is not None:
+        score = adjust(text[start:end], score)
+        if score is None:
+            return None
+    return _apply_context(text, entity_type, start, score)
+
+
+def detect_pii_fast(
+    text: str,
+    score_threshold: float = 0.5,
+    entities: Optional[List[str]] = None,
+) -> List[Dict]:
+    """
+    只用 regex 偵測 PII，回傳格式同 presidio_detector.detect_pii。
+    entities 可限定只找某些實體類型（None = FAST_ENTITIES 全部）。
+    """
+    wanted = set(entities) if entities else None
+    spans = []
+    for entity_type, regex, base_score in _get_compiled_patterns():
+        if wanted is not None and entity_type not in wanted:
+            continue
+        for m in regex.finditer(text):
+            start, end = m.span()
+            if start == end:
+                continue
+            score = score_span(text, entity_type, start, end, base_score)
+            if score is None or score < score_threshold:
+                continue
+            spans.append({
+                "entity_type": entity_type,
+                "start": start,
+                "end": end,
+                "score": score,
+                "raw_txt": m.group(),
+            })
+    return filter_entities_by_priority(spans)
+
+
+def deidentify_fast(
+    text: str,
+    replace_fn: Callable[[str, str], str],
+    score_threshold: float = 0.5,
+    entities: Optional[List[str]] = None,
+) -> str:
+    """
+    偵測 + 替換一次完成：replace_fn(entity_type, raw_txt) 回傳替換值，
+    依位置順序把原文片段與替換值串起來，只 join 一次。
+    """
+    spans = sorted(detect_pii_fast(text, score_threshold, entities), key=lambda s: s["start"])
+    parts = []
+    last = 0
+    for s in spans:
+        parts.append(text[last:s["start"]])
+        parts.append(replace_fn(s["entity_type"], s["raw_txt"]))
+        last = s["end"]
+    parts.append(text[last:])
+    return "".join(parts)
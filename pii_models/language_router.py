@@ -0,0 +1,78 @@
+# pii_models/language_router.py
+"""
+依文字本身的字元組成判斷該送哪個語言的 analyzer（zh / en）。
+
+只算 CJK 漢字與英文字母的比例，不跑任何模型：
+中英混合的文件只有真的含中文的段落才需要載入、使用 zh_core_web_sm。
+判斷結果以文字的 hash 快取，重複出現的段落（頁首、頁尾、表格標題…）不必重算。
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# CJK 統一漢字（含擴充 A）與相容漢字
+_CJK_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+# 漢字佔（漢字 + 英文字母）的比例達到這個值就當作中文；
+# 一個漢字約等於一個英文單字（4~5 個字母），所以門檻不需要到一半
+CJK_RATIO_THRESHOLD = 0.25
+DEFAULT_LANGUAGE = "en"
+
+# text hash → 語言，超過上限就丟掉最舊的
+CACHE_MAX_ENTRIES = 50000
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def classify_language(text: str) -> str:
+    """依 CJK 字元比例判斷語言（不查快取）"""
+    if not text or text.isascii():
+        return DEFAULT_LANGUAGE
+    cjk = len(_CJK_RE.findall(text))
+    if not cjk:
+        return DEFAULT_LANGUAGE
+    latin = len(_LATIN_RE.findall(text))
+    return "zh" if cjk / (cjk + latin) >= CJK_RATIO_THRESHOLD else "en"
+
+
+def _text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def route_language(text: str) -> str:
+    """回傳這段文字該用的語言代碼，結果依 text hash 快取"""
+    # 純 ASCII 直接判定，連 hash 都不用算
+    if not text or text.isascii():
+        return DEFAULT_LANGUAGE
+
+    key = _text_key(text)
+    with _cache_lock:
+        language = _cache.get(key)
+        if language is not None:
+            _cache.move_to_end(key)
+            return language
+
+    language = classify_language(text)
+    with _cache_lock:
+        _cache[key] = language
+        if len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return language
+
+
+def group_by_language(texts):
+    """把多段文字依語言分組，回傳 {語言: [text index, ...]}（空白文字略過）"""
+    groups = {}
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        groups.setdefault(route_language(text), []).append(i)
+    return groups
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -1,49 +1,115 @@
 # pii_models/presidio_detector.py
 
-from presidio_analyzer import AnalyzerEngine, RecognizerRegistry, PatternRecognizer, Pattern
-from presidio_analyzer.nlp_engine import NlpEngineProvider
-from pii_models.custom_recognizer_plus import register_custom_entities
-
-# 篩選重疊實體的函數
-PRIORITY = {
-    "TW_PHONE_NUMBER": 1,
-    "DURATION_TIME": 1,
-    "DATE_TIME": 2,
-    "UNIFIED_BUSINESS_NO": 1,
-    "TW_HOME_NUMBER": 2,
-    "EMAIL_ADDRESS": 1,
-    "PERSON": 1,
-    "LOCATION": 2,
-    "ORGANIZATION": 3,
-}
+import threading
+import time
+
+from pii_models.entity_filter import PRIORITY, filter_entities_by_priority
+from pii_models.detection_cache import get_detection_cache, make_key
+from pii_models.entity_profiles import build_profile
+from pii_models.language_router import group_by_language, route_language
 
-# 1) 定義 spaCy 多語模型
-nlp_config = {
-    "nlp_engine_name": "spacy",
-    "models": [
-        {"lang_code": "en", "model_name": "en_core_web_sm"},
-        {"lang_code": "zh", "model_name": "zh_core_web_sm"},
-    ],
+
+# 各語言對應的 spaCy 模型；模型只在第一次用到該語言時才載入
+LANGUAGE_MODELS = {
+    "en": "en_core_web_sm",
+    "zh": "zh_core_web_sm",
 }
 
-# 2) 用 Provider 建立 NlpEngine
-provider = NlpEngineProvider(nlp_configuration=nlp_config)
-nlp_engine = provider.create_engine()
+# 整個 process 共用的 analyzer（每個語言一個），以及各語言的載入時間（秒）
+_analyzers = {}
+_load_timings = {}
+_analyzer_lock = threading.Lock()
+# 各語言跑 spaCy 批次時持有（_nlp_artifacts 會用 select_pipes 暫時停用元件）
+_pipe_locks = {}
+
+
+def _build_analyzer(language: str):
+    """建立只載入單一語言模型的 AnalyzerEngine，並註冊自訂實體"""
+    # presidio / spaCy 本身 import 就要一秒左右，延後到真的需要時才載入
+    from presidio_analyzer import AnalyzerEngine
+    from presidio_analyzer.nlp_engine import NlpEngineProvider
+    from pii_models.custom_recognizer_plus import register_custom_entities, register_language_independent
+
+    # 1) 定義 spaCy 模型（只有這個語言）
+    nlp_config = {
+        "nlp_engine_name": "spacy",
+        "models": [
+            {"lang_code": language, "model_name": LANGUAGE_MODELS[language]},
+        ],
+    }
+
+    # 2) 用 Provider 建立 NlpEngine
+    provider = NlpEngineProvider(nlp_configuration=nlp_config)
+    nlp_engine = provider.create_engine()
+
+    # 3) 用這個引擎去初始化 Analyzer
+    analyzer = AnalyzerEngine(
+        nlp_engine=nlp_engine,
+        supported_languages=[language]
+    )
+
+    # 4) 註冊自訂實體，以及 presidio 只給 en 的語言無關 pattern（卡號、SSN...）
+    register_custom_entities(analyzer)
+    register_language_independent(analyzer, language)
+    return analyzer
+
+
+def get_analyzer(language: str = "en"):
+    """取得該語言的 analyzer（process 內共用），第一次呼叫時才載入模型"""
+    analyzer = _analyzers.get(language)
+    if analyzer is not None:
+        return analyzer
+    if language not in LANGUAGE_MODELS:
+        raise ValueError(f"不支援的語言：{language}（可用：{', '.join(LANGUAGE_MODELS)}）")
+
+    with _analyzer_lock:
+        # 等鎖期間可能已被其他 thread 建好
+        analyzer = _analyzers.get(language)
+        if analyzer is None:
+            t0 = time.perf_counter()
+            analyzer = _build_analyzer(language)
+            _load_timings[language] = time.perf_counter() - t0
+            _analyzers[language] = analyzer
+            print(f"[Analyzer] 載入 {language} 模型 {LANGUAGE_MODELS[language]}：{_load_timings[language]:.2f}s")
+    return analyzer
+
+
+def warm_up(languages=("en", "zh")):
+    """預先載入指定語言的 analyzer，回傳 {語言: 載入秒數}（已載入過的沿用當初的時間）"""
+    for language in languages:
+        get_analyzer(language)
+    return {language: _load_timings[language] for language in languages}
 
-# 3) 用這個引擎去初始化 Analyzer
-analyzer = AnalyzerEngine(
-    nlp_engine=nlp_engine,
-    supported_languages=["en", "zh"]
-)
 
-# 4) 註冊自訂實體
-register_custom_entities(analyzer)
+def get_load_timings():
+    """回傳目前已載入語言的載入時間 {語言: 秒數}"""
+    return dict(_load_timings)
+
+
+def __getattr__(name):
+    # 相容舊用法：from pii_models.presidio_detector import analyzer
+    if name == "analyzer":
+        return get_analyzer("en")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def detect_pii(
     text: str,
     language: str = "auto",
     score_threshold: float = 0.5,
+    mode: str = "full",
+    selected_types=None,
+    use_cache: bool = True,
 ):
+    # selected_types：UI 勾選的選項，只偵測這些對應的實體（None = 全部）
+    # use_cache：full 模式的結果依 (文字 hash, 語言, 門檻, profile) 快取，重複的段落不再分析
+    profile = build_profile(selected_types)
+
+    # mode="regex"：只跑 pattern recognizers，不碰 NLP engine
+    if mode == "regex":
+        from pii_models.fast_detector import detect_pii_fast
+        return detect_pii_fast(text, score_threshold=score_threshold, entities=profile.entities)
+
     # # 測試特定文字
     # test_cases = ["15 years of experience", "22 years old", "5 years ago", "Experienced administrative assistant with over 15 years of experience in office management"]
     
@@ -53,24 +119,32 @@ def detect_pii(
     #     for r in test_results:
     #         print(f"  - {r.entity_type}: {test_text[r.start:r.end]} (score: {r.score})")
     
-    # Always pass a real language code here:
-    results = analyzer.analyze(
-        text=text,
-        entities=None,
-        language=language,
-    )
+    # language="auto"：依這段文字的字元組成決定用哪個語言的 analyzer
+    if language == "auto":
+        language = route_language(text)
+
+    cache = get_detection_cache() if use_cache else None
+    if cache is not None:
+        key = make_key(text, language, score_threshold, profile.key, mode)
+        cached = cache.get(key, text)
+        if cached is not None:
+            return cached
+
+    analyzer = get_analyzer(language)
+    entities = _profile_entities(analyzer, language, profile)
+    if entities == []:
+        results = []
+    else:
+        nlp_artifacts = next(_nlp_artifacts(analyzer, [text], language, profile))
+        results = analyzer.analyze(
+            text=text,
+            entities=entities,
+            language=language,
+            nlp_artifacts=nlp_artifacts,
+        )
     # NEW!!!
     # 用 dict 包裝每個 result，加上 raw_txt
-    filtered = []
-    for r in results:
-        if r.score >= score_threshold:
-            filtered.append({
-                "entity_type": r.entity_type,
-                "start": r.start,
-                "end": r.end,
-                "score": r.score,
-                "raw_txt": text[r.start:r.end]
-            })
+    filtered = _to_spans(text, results, score_threshold)
     # 篩選重疊實體
     filtered = filter_entities_by_priority(filtered)
             
@@ -79,50 +153,163 @@ def detect_pii(
     # if there's no entity -> print end
     if not filtered:
         print("*** End ***\n")
+    if cache is not None:
+        cache.put(key, filtered)
     # return [r for r in results if r.score >= score_threshold]
     return filtered
 
-def filter_entities_by_priority(entities):
-    """篩選重疊實體，保留優先級高且分數高的實體"""
-    if not entities:
-        return []
-    
-    # 按優先級和分數排序（優先級低的數字代表高優先級）
-    sorted_entities = sorted(
-        entities, 
-        key=lambda e: (PRIORITY.get(e["entity_type"], 99), -e["score"])
+def _profile_entities(analyzer, language, profile):
+    """profile 的實體中這個語言的 analyzer 有 recognizer 的部分（None = 全部，[] = 沒有可偵測的）"""
+    return profile.entities_for(language, lambda: analyzer.get_supported_entities(language))
+
+
+def _nlp_artifacts(analyzer, texts, language, profile, batch_size=32):
+    """
+    依 profile 停用用不到的 spaCy 元件（例如沒選任何 NER 實體時的 ner）後跑 nlp_engine.process_batch，
+    依序產生每段文字的 NlpArtifacts，可直接傳給 analyzer.analyze。
+    select_pipes 會改動共用的 nlp，所以同一語言一次只跑一批，產出前就離開 select_pipes。
+    """
+    nlp_engine = analyzer.nlp_engine
+    nlp = nlp_engine.nlp[language]
+    disable = [name for name in profile.disabled_pipes if name in nlp.pipe_names]
+    lock = _pipe_locks.setdefault(language, threading.Lock())
+    for i in range(0, len(texts), batch_size):
+        chunk = texts[i:i + batch_size]
+        with lock, nlp.select_pipes(disable=disable):
+            artifacts = [a for _, a in nlp_engine.process_batch(chunk, language, batch_size=batch_size)]
+        yield from artifacts
+
+
+def _to_spans(text, results, score_threshold, offset=0):
+    """把 RecognizerResult 轉成 dict（加上 raw_txt），offset 用來換回原文字座標"""
+    spans = []
+    for r in results:
+        if r.score >= score_threshold:
+            spans.append({
+                "entity_type": r.entity_type,
+                "start": r.start - offset,
+                "end": r.end - offset,
+                "score": r.score,
+                "raw_txt": text[r.start:r.end]
+            })
+    return spans
+
+
+def detect_pii_batch(
+    texts,
+    language: str = "auto",
+    score_threshold: float = 0.5,
+    batch_size: int = 32,
+    mode: str = "full",
+    selected_types=None,
+    use_cache: bool = True,
+):
+    """
+    一次偵測多段文字，回傳與 texts 同長度的 list，每個元素是該段文字的實體 list
+    （start/end 為該段文字自己的座標，格式同 detect_pii）。
+
+    spaCy 以 batch_size 段為一批跑 nlp_engine.process_batch，之後每段各自 analyzer.analyze，
+    結果和逐段呼叫 detect_pii 相同，不會因為隔壁段落的文字而改變分數。
+    mode="regex" 時逐段走 regex-only 快速模式，不載入任何 spaCy 模型。
+    selected_types 同 detect_pii：只偵測勾選選項對應的實體。
+    language="auto" 時每段文字各自判斷語言，依語言分組後各自批次偵測，
+    只有含中文的段落才會用到（並載入）中文模型。
+    use_cache 時先查偵測快取，只分析沒命中的段落；同一批內重複的文字也只分析一次。
+    寫進快取的就是該段文字單獨偵測的結果，和批次順序無關。
+    """
+    texts = list(texts)
+    profile = build_profile(selected_types)
+    if mode == "regex":
+        from pii_models.fast_detector import detect_pii_fast
+        return [
+            detect_pii_fast(t, score_threshold=score_threshold, entities=profile.entities) if t and t.strip() else []
+            for t in texts
+        ]
+
+    results_per_text = [[] for _ in texts]
+    if not texts:
+        return results_per_text
+
+    if language == "auto":
+        groups = group_by_language(texts)
+    else:
+        groups = {language: [i for i, t in enumerate(texts) if t and t.strip()]}
+
+    # 查快取：命中的直接用；同一批內重複的文字只留第一段去分析
+    cache = get_detection_cache() if use_cache else None
+    keys = {}        # text index → cache key（需要分析的段落）
+    pending = {}     # cache key → 第一個需要分析的 text index
+    duplicates = []  # (text index, 與它文字相同、會被分析的 text index)
+    hit_count = 0
+    todo_groups = {}
+    for lang, indices in groups.items():
+        todo = []
+        for i in indices:
+            if cache is not None:
+                key = make_key(texts[i], lang, score_threshold, profile.key, mode)
+                if key in pending:
+                    duplicates.append((i, pending[key]))
+                    continue
+                cached = cache.get(key, texts[i])
+                if cached is not None:
+                    results_per_text[i] = cached
+                    hit_count += 1
+                    continue
+                pending[key] = i
+                keys[i] = key
+            todo.append(i)
+        if todo:
+            todo_groups[lang] = todo
+
+    for lang, indices in todo_groups.items():
+        # 不屬於這個語言（或不需分析）的文字以空字串代替，_analyze_batch 會略過，index 維持不變
+        lang_texts = [""] * len(texts)
+        for i in indices:
+            lang_texts[i] = texts[i]
+        _analyze_batch(lang_texts, lang, profile, score_threshold, batch_size, results_per_text)
+        for i in indices:
+            if results_per_text[i]:
+                results_per_text[i] = filter_entities_by_priority(results_per_text[i])
+
+    if cache is not None:
+        cache.put_many((key, results_per_text[i]) for i, key in keys.items())
+    for i, first in duplicates:
+        results_per_text[i] = [dict(s) for s in results_per_text[first]]
+
+    total = sum(len(s) for s in results_per_text)
+    by_lang = "、".join(f"{lang} {len(indices)} 段" for lang, indices in groups.items())
+    print(
+        f"*** Batch ***\n批次偵測 {len(texts)} 段文字（{by_lang}；"
+        f"快取命中 {hit_count} 段、批內重複 {len(duplicates)} 段），共 {total} 個 PII 實體\n"
     )
-    
-    filtered = []
-    
-    for current_entity in sorted_entities:
-        current_start = current_entity["start"]
-        current_end = current_entity["end"]
-        
-        # 檢查是否與已選擇的實體重疊
-        is_overlapping = False
-        
-        for selected_entity in filtered:
-            selected_start = selected_entity["start"]
-            selected_end = selected_entity["end"]
-            
-            # 檢查重疊：如果兩個範圍有任何交集就算重疊
-            if not (current_end <= selected_start or current_start >= selected_end):
-                is_overlapping = True
-                print(f"發現重疊：{current_entity['entity_type']} ({current_start}-{current_end}) 與 {selected_entity['entity_type']} ({selected_start}-{selected_end})")
-                break
-        
-        # 如果沒有重疊，則加入結果
-        if not is_overlapping:
-            filtered.append(current_entity)
-            print(f"保留實體：{current_entity['entity_type']} - '{current_entity['raw_txt']}' (score: {current_entity['score']})")
-        else:
-            print(f"跳過重疊實體：{current_entity['entity_type']} - '{current_entity['raw_txt']}' (score: {current_entity['score']})")
-    
-    return filtered
+    return results_per_text
+
+
+def _analyze_batch(texts, language, profile, score_threshold, batch_size, results_per_text):
+    """用單一語言的 analyzer 批次偵測 texts（spaCy 用 nlp.pipe 批次跑，analyze 逐段），結果（未篩選）加到 results_per_text"""
+    indices = [i for i, t in enumerate(texts) if t and t.strip()]
+    if not indices:
+        return
+    analyzer = get_analyzer(language)
+    entities = _profile_entities(analyzer, language, profile)
+    if entities == []:
+        return
+    artifacts = _nlp_artifacts(analyzer, [texts[i] for i in indices], language, profile, batch_size)
+    for i, nlp_artifacts in zip(indices, artifacts):
+        results = analyzer.analyze(
+            text=texts[i],
+            entities=entities,
+            language=language,
+            nlp_artifacts=nlp_artifacts,
+        )
+        results_per_text[i].extend(_to_spans(texts[i], results, score_threshold))
+
 
 if __name__ == "__main__":
+    print("=== Load timings ===")
+    for lang, sec in warm_up().items():
+        print(f"{lang}: {sec:.2f}s")
     print("=== Registered recognizers ===")
-    for r in analyzer.registry.recognizers:
+    for r in get_analyzer("en").registry.recognizers:
         print(f"{r.name} → supports: {r.supported_entities}; langs: {r.supported_language}")
 
@@ -12,6 +12,24 @@ Item {
     property string selectedContent: ""
     property var selectedPreviewData: null
 
+    // 模型升級版（v2）完成：換成新結果，保留目前選取的檔案
+    Connections {
+        target: typeof backend !== "undefined" ? backend : null
+        ignoreUnknownSignals: true
+        function onResultsUpgraded(json) {
+            try {
+                var arr = JSON.parse(json)
+                var keep = selectedIndex
+                results = arr
+                selectedIndex = (keep >= 0 && keep < arr.length) ? keep : (arr.length > 0 ? 0 : -1)
+                loadFileContent(selectedIndex)
+                console.log("ResultPage: 收到模型升級結果", arr.length, "筆")
+            } catch (e) {
+                console.error("ResultPage: 升級結果 JSON 解析失敗", e)
+            }
+        }
+    }
+
     // 檔案格式檢測函數
     function getFileExtension(fileName) {
         if (!fileName) return ""
@@ -0,0 +1,8 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# 讓 tests 不論從哪裡執行都能 import pii_models / faker_models / file_handlers
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
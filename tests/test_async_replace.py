@@ -0,0 +1,73 @@
+# tests/test_async_replace.py
+import asyncio
+
+from faker_models import muiltAI_pii_replace as replace
+from faker_models.kuwa_async_client import iter_lines
+from faker_models.mapping_store import MappingStore
+
+
+def _items(user_prompt):
+    return [line.split("raw=", 1)[1] for line in user_prompt.splitlines() if "raw=" in line]
+
+
+class _AsyncChat:
+    """每個項目回一個假名，並記錄同時在途的請求數"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.sent = []
+
+    async def chat(self, system_prompt, user_prompt):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.1)
+        finally:
+            self.active -= 1
+        raws = _items(user_prompt)
+        self.sent.extend(raws)
+        return "\n".join(f"Fake {raw.split()[0]}" for raw in raws)
+
+    async def chat_stream_lines(self, system_prompt, user_prompt):
+        for raw in _items(user_prompt):
+            self.sent.append(raw)
+            await asyncio.sleep(0)
+            yield f"Fake {raw.split()[0]}"
+
+
+def _spans(text, *raws):
+    return [
+        {"entity_type": "PERSON", "start": text.index(raw), "end": text.index(raw) + len(raw), "raw_txt": raw, "score": 0.9}
+        for raw in raws
+    ]
+
+
+def test_async_batches_are_sent_concurrently(tmp_path):
+    # batch_size=1：三個批次同時送出，而不是一個等一個
+    mapping = MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0)
+    chat = _AsyncChat()
+    text = "John Smith met Mary Jones and Peter Parker."
+    spans = _spans(text, "John Smith", "Mary Jones", "Peter Parker")
+    out = asyncio.run(replace.replace_entities_async(
+        text, spans, chat_client=chat, mapping=mapping, batch_size=1, debug=False,
+    ))
+    assert out == "Fake John met Fake Mary and Fake Peter."
+    assert chat.peak == 3
+    assert mapping.get("PERSON", "Mary Jones") == "Fake Mary"
+
+
+def test_async_stream_writes_each_line(tmp_path):
+    mapping = MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0)
+    chat = _AsyncChat()
+    text = "John Smith met Mary Jones."
+    out = asyncio.run(replace.replace_entities_async(
+        text, _spans(text, "John Smith", "Mary Jones"), chat_client=chat, mapping=mapping, stream=True, debug=False,
+    ))
+    assert out == "Fake John met Fake Mary."
+    assert mapping.get_many([("PERSON", "John Smith"), ("PERSON", "Mary Jones")]) == ["Fake John", "Fake Mary"]
+
+
+def test_iter_lines_joins_chunks():
+    # 片段可能在行中間切開；空行略過
+    assert list(iter_lines(["Fake J", "ohn\n\nFake ", "Mary\nFake P"])) == ["Fake John", "Fake Mary", "Fake P"]
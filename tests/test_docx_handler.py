@@ -0,0 +1,63 @@
+# tests/test_docx_handler.py
+import asyncio
+
+from docx import Document
+
+from faker_models.mapping_store import MappingStore
+from faker_models.muiltAI_pii_replace import resolve_replacements_async
+from file_handlers.docx_handler import collect_paragraphs
+from file_handlers.pipeline_context import PipelineContext
+
+PHONE = "0912345678"
+
+
+def _build_docx(path):
+    doc = Document()
+    para = doc.add_paragraph()
+    para.add_run("電話 ").bold = True
+    para.add_run(f"{PHONE}，請回電。")
+    table = doc.add_table(rows=1, cols=2)
+    merged = table.cell(0, 0).merge(table.cell(0, 1))
+    merged.text = f"聯絡 {PHONE}"
+    doc.sections[0].header.paragraphs[0].text = f"頁首 {PHONE}"
+    doc.save(path)
+
+
+def test_docx_entities_resolved_document_wide(tmp_path):
+    src, out = str(tmp_path / "in.docx"), str(tmp_path / "out" / "out.docx")
+    _build_docx(src)
+    # 合併儲存格只收一次
+    assert [p.text for p in collect_paragraphs(Document(src))] == [f"電話 {PHONE}，請回電。", f"聯絡 {PHONE}", f"頁首 {PHONE}"]
+
+    context = PipelineContext(mapping=MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0))
+    context.handler("docx").deidentify(src, out, ["TW_PHONE_NUMBER"], detect_mode="regex", use_model=False)
+
+    texts = [p.text for p in collect_paragraphs(Document(out))]
+    fake = texts[0][3:3 + len(PHONE)]
+    assert fake != PHONE
+    # 本文、表格、頁首的同一個原文都換成同一個值，run 樣式保留
+    assert texts == [f"電話 {fake}，請回電。", f"聯絡 {fake}", f"頁首 {fake}"]
+    first = Document(out).paragraphs[0]
+    assert first.runs[0].bold and first.runs[0].text == "電話 "
+
+
+class _CountingChat:
+    def __init__(self):
+        self.prompts = []
+
+    async def chat(self, system_prompt, user_prompt):
+        self.prompts.append(user_prompt)
+        raws = [line.split("raw=", 1)[1] for line in user_prompt.splitlines() if "raw=" in line]
+        return "\n".join(f"Fake {raw.split()[0]}" for raw in raws)
+
+
+def test_resolve_replacements_dedups_before_model(tmp_path):
+    # 整份文件重複出現的實體只送一次，全部放在同一個完整批次
+    chat = _CountingChat()
+    pairs = [("PERSON", "John Smith"), ("PERSON", "Mary Jones"), ("PERSON", "John Smith"), ("PERSON", "")] * 5
+    replacements = asyncio.run(resolve_replacements_async(
+        pairs, chat_client=chat, mapping=MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0), debug=False,
+    ))
+    assert replacements == {("PERSON", "John Smith"): "Fake John", ("PERSON", "Mary Jones"): "Fake Mary"}
+    assert len(chat.prompts) == 1
+    assert chat.prompts[0].count("raw=") == 2
@@ -0,0 +1,67 @@
+# tests/test_entity_validators.py
+import random
+import re
+
+from faker_models.entity_validators import (
+    NON_PERSON_KEYWORDS, RELATIVE_TIME_KEYWORDS, _RELATIVE_TIME_PATTERNS, KeywordMatcher, keep_original_batch,
+)
+
+FORM_FIELD_PATTERNS = (
+    r'^(first|last|full)\s*(name)?$',
+    r'^name\s*(field)?$',
+    r'^email\s*(address)?$',
+    r'^phone\s*(number)?$',
+    r'^contact\s*(info|information)?$',
+)
+
+
+def _baseline_keep(entity_type, raw):
+    # 原本 presidio_replacer_plus 逐一比對關鍵字、逐一跑 regex 的作法
+    if entity_type == "DATE_TIME":
+        lowered = raw.lower().strip()
+        return (any(k in lowered for k in RELATIVE_TIME_KEYWORDS)
+                or any(re.search(p, lowered) for p in _RELATIVE_TIME_PATTERNS))
+    if entity_type == "PERSON":
+        text = raw.strip().lower()
+        likely = (
+            not any(k in text for k in NON_PERSON_KEYWORDS)
+            and not any(ch.isdigit() for ch in text)
+            and all(ch in "abcdefghijklmnopqrstuvwxyz -'." for ch in text)
+            and 2 <= len(text) <= 50
+            and not any(re.match(p, text) for p in FORM_FIELD_PATTERNS)
+        )
+        return not likely
+    return False
+
+
+def test_keep_original_batch_matches_baseline():
+    random.seed(0)
+    words = list(RELATIVE_TIME_KEYWORDS[::7]) + list(NON_PERSON_KEYWORDS[::5]) + [
+        "John", "Mary Ann", "O'Neil", "3 days ago", "in 2 weeks", "3天前", "下月末", "2024-01-01",
+        "next weekend", "first name", "email address", "王小明", "Dr.", "  ", "X",
+    ]
+    spans = []
+    for _ in range(3000):
+        raw = " ".join(random.choice(words) for _ in range(random.randint(1, 3)))
+        spans.append({"entity_type": random.choice(("DATE_TIME", "PERSON", "LOCATION")), "raw_txt": raw})
+
+    assert keep_original_batch(spans) == [_baseline_keep(s["entity_type"], s["raw_txt"]) for s in spans]
+
+
+def test_keep_original_batch_reads_text_offsets():
+    text = "John 明天 見"
+    spans = [
+        {"entity_type": "PERSON", "start": 0, "end": 4, "raw_txt": "ignored"},
+        {"entity_type": "DATE_TIME", "start": 5, "end": 7},
+    ]
+    assert keep_original_batch(spans, text) == [False, True]
+
+
+def test_keyword_matcher_overlapping_keywords():
+    # 失敗鏈上的關鍵字也要命中（she 之後的 he、hers 的前綴）
+    matcher = KeywordMatcher(["he", "she", "hers", "今天下午"])
+    assert matcher.contains("ushers")
+    assert matcher.contains("ashe")
+    assert matcher.contains("是今天下午嗎")
+    assert not matcher.contains("今天上午")
+    assert not matcher.contains("")
@@ -0,0 +1,57 @@
+# tests/test_fake_pools.py
+import re
+
+import pytest
+
+from faker_models import fake_pools
+
+FORMATS = {
+    "TW_PHONE_NUMBER": r"09\d{8}",
+    "TW_ID_NUMBER": r"[A-Z][12]\d{8}",
+    "UNIFIED_BUSINESS_NO": r"\d{8}",
+    "TW_HEALTH_INSURANCE": r"0000\d{6}",
+    "TW_PASSPORT_NUMBER": r"3\d{7}",
+    "UK_NHS": r"\d{3} \d{3} \d{4}",
+    "US_ITIN": r"\d{9}",
+}
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_bulk_generators_keep_formats(monkeypatch, use_numpy):
+    # 有沒有 NumPy 產生的格式都一樣
+    if not use_numpy:
+        monkeypatch.setattr(fake_pools, "np", None)
+    for entity_type, pattern in FORMATS.items():
+        values = fake_pools.generate_many(entity_type, 200)
+        assert len(values) == 200
+        assert all(re.fullmatch(pattern, v) for v in values), entity_type
+        assert len(set(values)) > 1
+
+
+def test_pool_refills_in_batches(monkeypatch):
+    calls = []
+    generate = fake_pools.generate_many
+
+    def counting(entity_type, n, locale=fake_pools.DEFAULT_LOCALE):
+        calls.append((entity_type, n))
+        return generate(entity_type, n, locale)
+
+    monkeypatch.setattr(fake_pools, "generate_many", counting)
+    pool = fake_pools.FakePool(refill=32)
+    values = [pool.take("TW_PHONE_NUMBER") for _ in range(40)]
+    assert all(re.fullmatch(FORMATS["TW_PHONE_NUMBER"], v) for v in values)
+    # 數字型一次補 refill 個；Faker 類別補 refill // 16 個
+    assert calls == [("TW_PHONE_NUMBER", 32), ("TW_PHONE_NUMBER", 32)]
+    pool.take("PERSON")
+    assert calls[-1] == ("PERSON", 2)
+
+    pool.clear()
+    pool.take("TW_PHONE_NUMBER")
+    assert len(calls) == 4
+
+
+def test_faker_instances_are_shared():
+    assert fake_pools.get_faker("en_US") is fake_pools.get_faker(["en_US"])
+    assert fake_pools.get_faker() is not fake_pools.get_faker("en_US")
+    with pytest.raises(KeyError):
+        fake_pools.generate_many("NOT_A_TYPE", 1)
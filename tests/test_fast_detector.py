@@ -0,0 +1,23 @@
+# tests/test_fast_detector.py
+import subprocess
+import sys
+from pathlib import Path
+
+from pii_models.fast_detector import detect_pii_fast
+
+
+def test_fast_mode_does_not_import_presidio():
+    # regex-only 模式不能為了讀 pattern 就載入 presidio（連帶 spaCy）
+    code = (
+        "import sys; import pii_models.fast_detector; "
+        "sys.exit(any(m.split('.')[0] in ('presidio_analyzer', 'spacy') for m in sys.modules))"
+    )
+    assert subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1]).returncode == 0
+
+
+def test_fast_mode_detects_pattern_entities():
+    spans = detect_pii_fast("統編 04595257，手機 0912-345-678")
+    assert [(s["entity_type"], s["raw_txt"]) for s in spans] == [
+        ("UNIFIED_BUSINESS_NO", "04595257"),
+        ("TW_PHONE_NUMBER", "0912-345-678"),
+    ]
@@ -0,0 +1,21 @@
+# tests/test_keyed_pseudonym.py
+from faker_models.keyed_pseudonym import KeyedPseudonymizer
+
+
+def test_fpe_keeps_raw_formatting():
+    # 加密輸入取自正規化後的數字，但輸出要保留原文的全形數字與分隔符號
+    pseudonymizer = KeyedPseudonymizer(b"test-key")
+    half = pseudonymizer.pseudonymize("TW_PHONE_NUMBER", "0912-345-678")
+    full = pseudonymizer.pseudonymize("TW_PHONE_NUMBER", "０９１２-３４５-６７８")
+    assert half.startswith("09") and half != "0912-345-678"
+    assert full == half.translate(str.maketrans("0123456789", "０１２３４５６７８９"))
+
+    # 不合格式的身分證字號只加密數字，小寫字母與空白照舊
+    assert pseudonymizer.pseudonymize("TW_ID_NUMBER", "a 12345678")[:2] == "a "
+
+
+def test_unmapped_type_keeps_full_hex():
+    pseudonymizer = KeyedPseudonymizer(b"test-key")
+    value = pseudonymizer.pseudonymize("FOO_ID", "x")
+    assert value.startswith("FOO_ID_") and len(value) == len("FOO_ID_") + 16
+    assert value == KeyedPseudonymizer(b"test-key").pseudonymize("FOO_ID", "x")
@@ -0,0 +1,113 @@
+# tests/test_mapping_store.py
+import json
+import time
+
+from faker_models.mapping_store import MappingStore, SqliteMappingStore
+
+
+def test_sqlite_imports_json_mapping_once(tmp_path):
+    # 改用 SQLite 後，pii_map.json（含還沒壓縮的 journal）裡的假值要沿用，不能重新產生
+    json_path = str(tmp_path / "pii_map.json")
+    legacy = MappingStore(json_path, flush_interval=0)
+    legacy.put("PERSON", "王小明", "陳大文")
+    legacy.compact()
+    legacy.put("TW_PHONE_NUMBER", "0912345678", "0987654321")
+    legacy.close()
+
+    store = SqliteMappingStore(str(tmp_path / "pii_map.sqlite3"))
+    assert store.import_json(json_path) == 2
+    assert store.get_many([("PERSON", "王小明"), ("TW_PHONE_NUMBER", "0912345678")]) == ["陳大文", "0987654321"]
+    # 先寫先贏：匯入的值不會被新的假值覆寫
+    assert store.put("PERSON", "王小明", "林小華") == "陳大文"
+
+    # 資料表已經有資料就不再匯入
+    assert store.import_json(json_path) == 0
+    store.close()
+
+
+def test_journal_replay_drops_torn_tail(tmp_path):
+    # 當機留下寫到一半的最後一行：重播時忽略並截掉，之前的對照都還在
+    path = str(tmp_path / "pii_map.json")
+    store = MappingStore(path, group_size=1, flush_interval=0, fsync=False)
+    store.put("PERSON", "王小明", "陳大文")
+    store.put("TW_PHONE_NUMBER", "0912345678", "0987654321")
+    store.close()
+    with open(path + ".journal", "rb") as f:
+        good = f.read()
+    with open(path + ".journal", "ab") as f:
+        f.write(b'{"k":"torn","v":"\xe9')
+
+    store = MappingStore(path, group_size=1, flush_interval=0, fsync=False)
+    assert len(store) == 2
+    assert store.get("PERSON", "王小明") == "陳大文"
+    with open(path + ".journal", "rb") as f:
+        assert f.read() == good
+
+    # 截掉後可以接著 append，重開仍讀得到
+    store.put("PERSON", "林小華", "張美玲")
+    store.close()
+    assert MappingStore(path, flush_interval=0).get("PERSON", "林小華") == "張美玲"
+
+
+def test_compaction_writes_snapshot_and_clears_journal(tmp_path):
+    path = str(tmp_path / "pii_map.json")
+    store = MappingStore(path, group_size=1, flush_interval=0, compact_every=2, fsync=False)
+    store.put("PERSON", "王小明", "陳大文")
+    store.put("PERSON", "林小華", "張美玲")
+    # 第二筆寫入後達到 compact_every：snapshot 有兩筆、journal 清空
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)) == 2
+    with open(path + ".journal", "rb") as f:
+        assert f.read() == b""
+
+    store.put("PERSON", "王小明", "李志強")
+    store.close()
+    # snapshot 再加上 journal 重播，後寫的值蓋過 snapshot 的舊值
+    reopened = MappingStore(path, flush_interval=0)
+    assert len(reopened) == 2
+    assert reopened.get_many([("PERSON", "王小明"), ("PERSON", "林小華")]) == ["李志強", "張美玲"]
+
+
+def test_sqlite_namespaces_are_isolated(tmp_path):
+    path = str(tmp_path / "pii_map.sqlite3")
+    a = SqliteMappingStore(path, namespace="project_a")
+    b = SqliteMappingStore(path, namespace="project_b")
+    assert a.put("PERSON", "王小明", "陳大文") == "陳大文"
+    # 同一原文在不同 namespace 各自有假值，互不影響
+    assert b.get("PERSON", "王小明") is None
+    assert b.put("PERSON", "王小明", "林小華") == "林小華"
+    assert (len(a), len(b)) == (1, 1)
+
+    assert a.clear_namespace() == 1
+    assert a.get("PERSON", "王小明") is None
+    assert b.get("PERSON", "王小明") == "林小華"
+    a.close()
+    b.close()
+
+
+def test_sqlite_ttl_expiry(tmp_path):
+    store = SqliteMappingStore(str(tmp_path / "pii_map.sqlite3"), ttl=0.2)
+    store.put("PERSON", "王小明", "陳大文")
+    assert store.get("PERSON", "王小明") == "陳大文"
+    time.sleep(0.3)
+    # 過期視同不存在（快取裡的也一樣），可以寫入新值
+    assert store.get("PERSON", "王小明") is None
+    assert len(store) == 0
+    assert store.put("PERSON", "王小明", "林小華") == "林小華"
+
+    time.sleep(0.3)
+    assert store.purge_expired() == 1
+    store.close()
+
+
+def test_sqlite_cache_is_bounded_lru(tmp_path):
+    store = SqliteMappingStore(str(tmp_path / "pii_map.sqlite3"), max_cache_entries=2)
+    store.put_many([("PERSON", "甲", "A"), ("PERSON", "乙", "B")])
+    store.get("PERSON", "甲")  # 甲變成最近使用
+    store.put("PERSON", "丙", "C")
+    assert len(store._cache) == 2
+    assert store._key("PERSON", "甲") in store._cache
+    assert store._key("PERSON", "乙") not in store._cache
+    # 被擠出快取的值仍在磁碟上
+    assert store.get("PERSON", "乙") == "B"
+    store.close()
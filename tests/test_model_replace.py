@@ -0,0 +1,45 @@
+# tests/test_model_replace.py
+from faker_models import muiltAI_pii_replace as replace
+from faker_models.mapping_store import MappingStore
+from faker_models.resilience import CircuitBreaker
+
+
+def test_empty_or_echoed_model_lines_are_not_persisted(tmp_path):
+    # 模型回空行或照抄原文時改走本地替換，對照表裡不能出現「原文 → 原文」
+    mapping = MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0)
+    batch = [(0, "TW_ID_NUMBER", "A123456789"), (1, "TW_ID_NUMBER", "B234567890"), (2, "TW_ID_NUMBER", "C198765432")]
+    prepared = {}
+    replace._store_model_batch("F112233445\nB234567890", batch, mapping, prepared, debug=False)
+
+    assert prepared[0] == "F112233445"
+    for i, e_type, raw in batch:
+        assert prepared[i] != raw
+        assert mapping.get(e_type, raw) == prepared[i]
+
+    prepared = {}
+    replace._commit_stream_line(" D123123123 ", (0, "TW_ID_NUMBER", "D123123123"), mapping, prepared, debug=False)
+    assert prepared[0] != "D123123123"
+    assert mapping.get("TW_ID_NUMBER", "D123123123") == prepared[0]
+
+
+def test_breaker_counts_attempts():
+    breaker = CircuitBreaker()
+    breaker.record_attempt()
+    breaker.record_attempt(retry=True)
+    metrics = breaker.metrics()
+    assert (metrics["calls"], metrics["retries"]) == (2, 1)
+
+
+def test_fallback_counts_only_breaker_events(tmp_path, monkeypatch):
+    # 照抄原文、空行改走本地替換不算 fallback；斷路器擋下才算
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_sec=60)
+    monkeypatch.setattr(replace, "get_breaker", lambda: breaker)
+    mapping = MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0)
+    batch = [(0, "TW_ID_NUMBER", "A123456789"), (1, "TW_ID_NUMBER", "B234567890")]
+    replace._store_model_batch("A123456789\n", batch, mapping, {}, debug=False)
+    assert breaker.metrics()["fallback_items"] == 0
+
+    breaker.record_failure()
+    assert replace._safe_chat(object(), "system", "user", batch) is None
+    metrics = breaker.metrics()
+    assert (metrics["fallback_batches"], metrics["fallback_items"]) == (1, 2)
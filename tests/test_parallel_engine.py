@@ -0,0 +1,21 @@
+# tests/test_parallel_engine.py
+from file_handlers.parallel_engine import ParallelEngine
+
+
+def test_failed_job_does_not_fail_the_batch(tmp_path, monkeypatch):
+    # 每個檔案各自回報結果：找不到的檔案回傳 Exception，其他檔案照常輸出，
+    # 後端只需要逐一重跑失敗的那幾個
+    monkeypatch.setenv("ANONIME_MAPPING_NAMESPACE", "test_parallel_engine")
+    src = tmp_path / "a.txt"
+    src.write_text("電話 0912345678\n", encoding="utf-8")
+    jobs = [
+        ("text", str(tmp_path / "missing.txt"), str(tmp_path / "out" / "missing.txt")),
+        ("text", str(src), str(tmp_path / "out" / "a.txt")),
+    ]
+    with ParallelEngine(max_workers=1) as engine:
+        results = engine.process_files(jobs, ["TW_PHONE_NUMBER"], use_model=False)
+
+    assert isinstance(results[0], FileNotFoundError)
+    assert results[1] == jobs[1][2]
+    output = (tmp_path / "out" / "a.txt").read_text(encoding="utf-8")
+    assert output.startswith("電話 ") and "0912345678" not in output
@@ -0,0 +1,97 @@
+# tests/test_presidio_detector.py
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+
+from pii_models.detection_cache import configure_detection_cache
+from pii_models import presidio_detector
+from pii_models.presidio_detector import detect_pii, detect_pii_batch
+
+
+def test_selection_without_recognizer_returns_empty():
+    # TW_PASSPORT_NUMBER 沒有任何 recognizer：只勾它時不能讓 analyze 丟 ValueError
+    selected = ["TW_PASSPORT_NUMBER"]
+    assert detect_pii("Passport No. 312345678", language="en", selected_types=selected, use_cache=False) == []
+    assert detect_pii_batch(
+        ["Passport No. 312345678", "護照號碼 312345678"], selected_types=selected, use_cache=False
+    ) == [[], []]
+
+
+def test_credit_card_in_chinese_sentence():
+    # 中文段落走 zh analyzer，卡號等語言無關的 pattern 也要偵測得到
+    text = "我的信用卡號是 4111 1111 1111 1111，請幫我保密。"
+    for selected in (None, ["CREDIT_CARD"]):
+        spans = detect_pii(text, selected_types=selected, use_cache=False)
+        assert [(s["entity_type"], s["raw_txt"]) for s in spans if s["entity_type"] == "CREDIT_CARD"] == [
+            ("CREDIT_CARD", "4111 1111 1111 1111")
+        ]
+    [spans] = detect_pii_batch([text], selected_types=["CREDIT_CARD"], use_cache=False)
+    assert [s["raw_txt"] for s in spans] == ["4111 1111 1111 1111"]
+
+
+def test_batch_matches_per_text():
+    # 批次偵測的結果必須和逐段 detect_pii 相同：隔壁段落的 context（「健保卡」）不能替卡號加分
+    texts = [
+        "健保卡",
+        "000012345678",
+        "NHI",
+        "000012345678",
+        "健保卡號 000012345678",
+        "My name is John Smith, call 0912-345-678.",
+        "信用卡 4111 1111 1111 1111",
+        "",
+        "email: someone@example.com",
+    ]
+    for language in ("en", "zh"):
+        expected = [detect_pii(t, language=language, score_threshold=0.6, use_cache=False) if t else [] for t in texts]
+        assert detect_pii_batch(texts, language=language, score_threshold=0.6, use_cache=False) == expected
+
+
+def test_batch_cache_does_not_depend_on_neighbours(tmp_path):
+    # 批次寫進快取的結果之後會被別的順序、別的檔案拿去用，必須等於單獨偵測那段文字的結果
+    cache = configure_detection_cache(disk_path=str(tmp_path / "detection.sqlite"))
+    try:
+        texts = ["健保卡", "000012345678", "電話 0912-345-678", "健保卡"]
+        detect_pii_batch(texts, language="en", score_threshold=0.6)
+        for text in reversed(texts):
+            fresh = detect_pii(text, language="en", score_threshold=0.6, use_cache=False)
+            assert detect_pii(text, language="en", score_threshold=0.6) == fresh
+        assert cache.stats()["hits"] == len(texts)
+    finally:
+        configure_detection_cache()
+
+
+def test_analyzer_loaded_once_per_language(monkeypatch):
+    # 各語言第一次用到才建立，多個 thread 同時要也只建一次
+    built = []
+
+    def fake_build(language):
+        built.append(language)
+        time.sleep(0.1)
+        return object()
+
+    monkeypatch.setattr(presidio_detector, "_analyzers", {})
+    monkeypatch.setattr(presidio_detector, "_load_timings", {})
+    monkeypatch.setattr(presidio_detector, "_build_analyzer", fake_build)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(presidio_detector.get_analyzer("zh"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert built == ["zh"]
+    assert len({id(a) for a in results}) == 1
+    assert set(presidio_detector.get_load_timings()) == {"zh"}
+    assert presidio_detector.warm_up(("zh",)) == presidio_detector.get_load_timings()
+    with pytest.raises(ValueError):
+        presidio_detector.get_analyzer("xx")
+
+
+def test_analyzer_only_loads_its_language():
+    analyzer = presidio_detector.get_analyzer("zh")
+    assert analyzer.supported_languages == ["zh"]
+    assert list(analyzer.nlp_engine.nlp) == ["zh"]
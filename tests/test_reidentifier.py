@@ -0,0 +1,37 @@
+# tests/test_reidentifier.py
+import pytest
+
+from faker_models.mapping_store import SqliteMappingStore
+from faker_models.muiltAI_pii_replace import replace_entities
+from faker_models.reidentifier import Reidentifier
+from file_handlers.pipeline_context import PipelineContext
+
+
+def _spans(text, *raws):
+    return [
+        {"entity_type": e_type, "start": text.index(raw), "end": text.index(raw) + len(raw), "raw_txt": raw, "score": 1.0}
+        for e_type, raw in raws
+    ]
+
+
+def test_reidentify_reply_with_real_store(tmp_path):
+    # 去識別化寫進對照表（keep_raw）的假值，出現在 AI 回覆裡時要還原回原文
+    store = SqliteMappingStore(str(tmp_path / "pii_map.sqlite3"), keep_raw=True)
+    context = PipelineContext(mapping=store)
+    text = "申請人身分證 A123456789，電話 0912345678。"
+    spans = _spans(text, ("TW_ID_NUMBER", "A123456789"), ("TW_PHONE_NUMBER", "0912345678"))
+    # 這兩種類型都是本地替換，不會呼叫模型
+    masked = replace_entities(text, spans, chat_client=object(), mapping=store)
+    assert "A123456789" not in masked and "0912345678" not in masked
+
+    reply = f"已收到：{masked}"
+    chunks = [reply[i:i + 3] for i in range(0, len(reply), 3)]
+    assert "".join(context.reidentifier().reidentify(chunks)) == f"已收到：{text}"
+    store.close()
+
+
+def test_store_without_raw_is_rejected(tmp_path):
+    store = SqliteMappingStore(str(tmp_path / "pii_map.sqlite3"))
+    with pytest.raises(ValueError):
+        Reidentifier(store)
+    store.close()
@@ -0,0 +1,57 @@
+# tests/test_single_flight.py
+import threading
+import time
+
+from faker_models import muiltAI_pii_replace as replace
+from faker_models.mapping_store import MappingStore
+from faker_models.single_flight import SingleFlight
+
+
+def test_acquire_and_release():
+    flight = SingleFlight()
+    owned, waiting = flight.acquire(["a", "b", "a"])
+    assert owned == ["a", "b"] and waiting == {}
+    # 別的呼叫要同一個 key 時拿到 Future，不會再成為 owner
+    owned2, waiting2 = flight.acquire(["b", "c"])
+    assert owned2 == ["c"] and set(waiting2) == {"b"}
+
+    flight.release(owned, {"b": "B"})
+    assert waiting2["b"].result(timeout=1) == "B"
+    flight.release(owned2, {"c": "C"})
+    assert flight.metrics() == {"in_flight": 0, "owned": 3, "coalesced": 1}
+
+
+class _SlowChat:
+    """每次呼叫等一下才回覆，讓第二個呼叫在第一個還沒回來時送出"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, system_prompt, user_prompt):
+        self.calls += 1
+        time.sleep(0.3)
+        return "Alice Chen"
+
+
+def test_concurrent_requests_share_one_model_call(tmp_path):
+    mapping = MappingStore(str(tmp_path / "pii_map.json"), flush_interval=0)
+    chat = _SlowChat()
+    text = "Contact John Smith today."
+    spans = [{"entity_type": "PERSON", "start": 8, "end": 18, "raw_txt": "John Smith", "score": 0.9}]
+    outputs = []
+
+    def run():
+        outputs.append(replace.replace_entities(text, spans, chat_client=chat, mapping=mapping, debug=False))
+
+    first = threading.Thread(target=run)
+    first.start()
+    deadline = time.monotonic() + 5
+    while replace._MODEL_FLIGHT.in_flight() == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    second = threading.Thread(target=run)
+    second.start()
+    first.join()
+    second.join()
+
+    assert chat.calls == 1
+    assert outputs == ["Contact Alice Chen today."] * 2
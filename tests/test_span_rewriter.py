@@ -0,0 +1,45 @@
+# tests/test_span_rewriter.py
+import random
+
+from faker_models.span_rewriter import _rewrite_naive, rewrite_spans
+
+
+def test_rewrite_matches_naive_and_maps_offsets():
+    random.seed(0)
+    text = "".join(random.choice("abc 甲乙\n") for _ in range(2000))
+    starts = sorted(random.sample(range(0, 1980, 20), 60))
+    replacements = [(s, s + random.randint(1, 15), f"<{i}>" * random.randint(0, 3)) for i, s in enumerate(starts)]
+    random.shuffle(replacements)
+
+    new, offsets = rewrite_spans(text, replacements)
+    assert new == _rewrite_naive(text, replacements)
+    assert len(offsets) == len(replacements)
+    for start, end, value in replacements:
+        assert new[offsets.to_new(start):offsets.to_new(end)] == value
+        assert offsets.to_old(offsets.to_new(start)) == start
+    # 區段外的字元只平移
+    last_start, last_end, _, new_end = offsets.segments[-1]
+    assert offsets.to_new(last_end + 1) == new_end + 1
+    assert offsets.to_old(new_end + 1) == last_end + 1
+
+
+def test_overlapping_spans_keep_earliest_longest():
+    text = "王小明的電話是0912345678"
+    new, offsets = rewrite_spans(text, [
+        (1, 3, "X"),            # 與前一個重疊，略過
+        (0, 3, "陳大文"),        # 同起點取較長
+        (0, 2, "陳大"),
+        (7, 17, "0987654321"),
+        (10, 12, "??"),          # 落在前一個 span 內，略過
+    ])
+    assert new == "陳大文的電話是0987654321"
+    assert len(offsets) == 2
+    # 落在被替換區段內部的位置對到區段結尾
+    assert offsets.to_new(1) == 3
+    assert offsets.to_old(1) == 3
+
+
+def test_empty_replacements():
+    new, offsets = rewrite_spans("abc", [])
+    assert new == "abc" and len(offsets) == 0
+    assert offsets.to_new(2) == 2 and offsets.to_old(2) == 2
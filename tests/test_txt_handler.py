@@ -0,0 +1,40 @@
+# tests/test_txt_handler.py
+import io
+from types import SimpleNamespace
+
+import pytest
+
+from file_handlers.txt_handler import TextHandler
+
+
+def _windows(text, **kwargs):
+    handler = TextHandler(context=SimpleNamespace(mapping=None), **kwargs)
+    return list(handler._iter_windows(io.StringIO(text), None, "regex"))
+
+
+def test_windows_detect_by_paragraph():
+    # 同一段落內，上一行的 context 仍會加分、跨行的實體也找得到；座標換回整個視窗
+    text = "健保卡號\n000012345678\n\n電話 0912 345\n678\n"
+    [(window, entities)] = _windows(text)
+    assert window == text
+    assert [(e["entity_type"], e["raw_txt"]) for e in entities] == [
+        ("TW_NHI_NUMBER", "000012345678"),
+        ("TW_PHONE_NUMBER", "0912 345\n678"),
+    ]
+    assert all(window[e["start"]:e["end"]] == e["raw_txt"] for e in entities)
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    # overlap_chars >= chunk_chars 時超長行永遠切不出可輸出的部分，會無限迴圈
+    with pytest.raises(ValueError):
+        TextHandler(chunk_chars=100, overlap_chars=100, context=SimpleNamespace(mapping=None))
+
+
+def test_long_line_is_split_into_windows():
+    line = "電話 0912-345-678 " * 40
+    windows = _windows(line, chunk_chars=120, overlap_chars=30)
+    assert len(windows) > 1
+    assert "".join(w for w, _ in windows) == line
+    for window, entities in windows:
+        assert all(window[e["start"]:e["end"]] == e["raw_txt"] for e in entities)
+    assert sum(len(e) for _, e in windows) == 40